@@ -0,0 +1,69 @@
+"""
+مقارنة البايتات اللي بتتبعت لملفات /static قبل وبعد static_assets.py:
+- قبل: StaticFiles عادي (من غير ضغط ومن غير Cache-Control، فالمتصفح بيسأل كل زيارة)
+- بعد: الاسم المبصوم بـ gzip/brotli حسب Accept-Encoding و Cache-Control immutable
+
+    python benchmarks/asset_savings.py [--encoding "br, gzip"]
+
+الزيارة الأولى بتتقاس بالبايتات الفعلية على السلك (body + headers)، والزيارة التانية
+بعدد الطلبات: القديم revalidation لكل ملف (304)، والجديد صفر طلبات لأن الملف immutable.
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+from starlette.testclient import TestClient
+
+from static_assets import AssetManifest, AssetFiles
+
+
+def wire_bytes(response):
+    headers = sum(len(k) + len(v) + 4 for k, v in response.headers.raw)
+    return response.num_bytes_downloaded + headers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--encoding", default="br, gzip", help="Accept-Encoding بتاع المتصفح")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as build_dir:
+        manifest = AssetManifest(os.path.join(ROOT, "static"), build_dir).build()
+        app = Starlette(routes=[
+            Mount("/old", StaticFiles(directory=manifest.directory)),
+            Mount("/static", AssetFiles(manifest)),
+        ])
+        client = TestClient(app)
+        headers = {"Accept-Encoding": args.encoding}
+
+        total_old = total_new = revalidations = 0
+        print(f"{'file':32} {'before':>10} {'after':>10}  encoding")
+        for rel in sorted(manifest.urls):
+            old = client.get(f"/old/{rel}", headers=headers)
+            new = client.get(manifest.url(rel), headers=headers)
+            assert old.status_code == new.status_code == 200 and old.content == new.content, rel
+            before, after = wire_bytes(old), wire_bytes(new)
+            total_old += before
+            total_new += after
+            print(f"{rel:32} {before:>10,} {after:>10,}  {new.headers.get('content-encoding', 'identity')}")
+
+            # الزيارة التانية: القديم بيسأل بـ If-None-Match، الجديد مش بيتطلب أصلاً
+            again = client.get(f"/old/{rel}", headers=dict(headers, **{"If-None-Match": old.headers["etag"]}))
+            revalidations += again.status_code == 304
+            assert "immutable" in new.headers["cache-control"], rel
+
+        print(f"{'TOTAL (first visit)':32} {total_old:>10,} {total_new:>10,}  "
+              f"-{1 - total_new / total_old:.1%}")
+        print(f"repeat visit: {revalidations} revalidation requests before, 0 after (immutable)")
+
+
+if __name__ == "__main__":
+    main()
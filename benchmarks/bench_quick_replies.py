@@ -0,0 +1,97 @@
+"""
+مقارنة الردود السريعة: get_quick_response القديمة (بتبني القاموس وتلف على الكلمات
+مع كل رسالة) قدام QuickReplyMatcher المتجهز مرة واحدة.
+
+    python benchmarks/bench_quick_replies.py [عدد الرسائل]
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quick_replies import QUICK_RESPONSES, quick_replies
+
+def legacy_quick_response(message, lang):
+    """
+    get_quick_response القديمة زي ما هي: بتبني القاموس من الأول مع كل رسالة
+    وبتلف على كل الكلمات (الأساس اللي بنقارن بيه).
+    """
+    message_lower = message.lower().strip()
+    quick_responses = {
+        "ar": {k: list(v) for k, v in QUICK_RESPONSES["ar"].items()},
+        "en": {k: list(v) for k, v in QUICK_RESPONSES["en"].items()},
+    }
+    lang_dict = quick_responses.get(lang, {})
+    for key, responses in lang_dict.items():
+        if key in message_lower:
+            return key
+    return None
+
+
+ARABIC_MESSAGES = [
+    "مرحبا", "مرحبا يا سيينا عاملة ايه", "كيف حالك النهاردة؟", "احبك اوي",
+    "شكرا على الكلام الحلو ده", "صباح الخير يا قمر", "مساء الخير، اليوم كان طويل جداً",
+    "باي هنام دلوقتي", "انا زهقان ومش عارف اعمل ايه", "فاكرة لما اتكلمنا عن السفر؟",
+    "النهاردة في الشغل المدير زعقلي قدام الكل وانا مكنتش غلطان خالص",
+    "ايه رأيك في فيلم امبارح؟ انا شايف النهاية كانت وحشة",
+    "عندي امتحان بكرة ومذاكرتش حاجة 😭", "قوليلي نكتة", "هو انتي بتحبي القهوة ولا الشاي",
+    "بفكر اغير شغلي بس خايف", "اخويا الصغير كسر الموبايل بتاعي", "تصبحي على خير",
+]
+
+ENGLISH_MESSAGES = [
+    "hi", "Hello there!", "how are you today?", "I love you", "thank you so much",
+    "good morning sunshine", "good evening, long day", "bye, going to sleep",
+    "I'm bored and don't know what to do", "remember when we talked about travelling?",
+    "my boss yelled at me in front of everyone today and it wasn't even my fault",
+    "what did you think of the movie last night? the ending was bad",
+    "I have an exam tomorrow and I haven't studied at all", "tell me a joke",
+    "do you prefer coffee or tea", "thinking about changing jobs but I'm scared",
+    "my little brother broke my phone", "what are you up to right now?",
+]
+
+
+def build_corpus(size, seed=42):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        if rng.random() < 0.5:
+            corpus.append(("ar", rng.choice(ARABIC_MESSAGES)))
+        else:
+            corpus.append(("en", rng.choice(ENGLISH_MESSAGES)))
+    return corpus
+
+
+def run(label, func, corpus, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for lang, message in corpus:
+            func(message, lang)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_msg_us = best / len(corpus) * 1e6
+    print(f"{label:<10} {best * 1000:8.1f}ms  {per_msg_us:6.2f}µs/رسالة")
+    return best
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    corpus = build_corpus(size)
+
+    # لازم الاتنين يطلعوا نفس الكلمة لكل رسالة
+    for lang, message in corpus[:2000]:
+        expected = legacy_quick_response(message, lang)
+        got = quick_replies.match(message, lang)
+        assert got == expected, (message, expected, got)
+
+    keys = sum(len(v) for v in QUICK_RESPONSES.values())
+    print(f"{size} رسالة • {keys} كلمة")
+    legacy = run("legacy", legacy_quick_response, corpus)
+    compiled = run("compiled", quick_replies.match, corpus)
+    print(f"التسريع: {legacy / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+طبقة discord.py مزيفة لاختبار الحمل: مستخدمين وقنوات خاصة ورسائل بتتبعت لـ on_message
+من غير اتصال بـ Discord. القناة بتسجل وقت أول رد على كل رسالة مستنية.
+"""
+import time
+import itertools
+
+_ids = itertools.count(10 ** 17)
+
+
+class FakeUser:
+    def __init__(self, user_id, name=None):
+        self.id = int(user_id)
+        self.name = name or f"user{user_id}"
+        self.display_name = self.name
+        self.bot = False
+        self.mention = f"<@{self.id}>"
+        self.avatar = None
+
+    def __str__(self):
+        return self.name
+
+
+class FakeSentMessage:
+    def __init__(self, channel, content):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        self.channel.edits += 1
+        if content is not None:
+            self.content = content
+        return self
+
+
+class FakeDMChannel:
+    """
+    on_first_reply(latencies): بتتنده مع أول رسالة بيبعتها البوت بعد رسائل المستخدم
+    بالتأخير من كل رسالة لحد الرد.
+    """
+
+    def __init__(self, user, on_first_reply=None):
+        self.id = next(_ids)
+        self.recipient = user
+        self.guild = None
+        self.sent = 0
+        self.edits = 0
+        self.waiting = []  # أوقات رسائل المستخدم اللي لسه متردش عليها
+        self.on_first_reply = on_first_reply
+
+    async def send(self, content=None, embed=None, **kwargs):
+        self.sent += 1
+        if self.waiting:
+            now = time.perf_counter()
+            latencies = [now - t for t in self.waiting]
+            self.waiting = []
+            if self.on_first_reply:
+                self.on_first_reply(latencies)
+        return FakeSentMessage(self, content)
+
+    def typing(self):
+        return _NoTyping()
+
+
+class _NoTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeMessage:
+    def __init__(self, author, channel, content):
+        self.id = next(_ids)
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.guild = None
+        self.created_at_perf = time.perf_counter()
+        self.mentions = []
+        self.role_mentions = []
+        self.attachments = []
+        self.reference = None
+        self.webhook_id = None
+
+
+class FakeClientUser:
+    def __init__(self, user_id=1):
+        self.id = user_id
+        self.name = "loadtest-bot"
+        self.bot = True
+        self.avatar = None
+        self.mention = f"<@{user_id}>"
+
+
+def install(bot):
+    """خلي bot.user و message._state موجودين عشان get_context تشتغل من غير login."""
+    bot._connection.user = FakeClientUser()
+    FakeMessage._state = bot._connection
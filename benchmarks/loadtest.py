@@ -0,0 +1,252 @@
+"""
+اختبار حمل من غير نت لمسار الرسائل الخاصة في bot.py:
+رسائل مزيفة بتدخل on_message (fake_discord) والذكاء الاصطناعي سيرفر محلي (stub_openai)
+بتأخير بنحدده. لكل عدد مستخدمين بيطلع:
+زمن أول رد وزمن الرد الكامل (p50/p95/p99)، رسائل/ثانية، الكتابة على الديسك لكل رسالة،
+وتأخير الـ event loop.
+
+    python benchmarks/loadtest.py --users 100,1000,10000,100000 --duration 10 --latency 0.4
+
+كل مستوى بيشتغل في process لوحده وفي مجلد مؤقت لوحده (users_data جديد).
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+RESULT_MARKER = "LOADTEST_RESULT "
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def read_proc_io():
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+
+def seeded_user(index):
+    lang = "ar" if index % 2 == 0 else "en"
+    return {
+        "user_data": {
+            "activated": True, "state": "normal", "language": lang, "age": 22,
+            "bot_name": "Sienna", "user_name": f"user{index}", "sex_mode": False,
+            "joined_at": "2026-01-01T00:00:00",
+        },
+        "user_progress": {"level": 1, "xp": 0, "messages": 0},
+        "user_reminders": [],
+        "user_conversations": {},
+    }
+
+
+# ----------------------------------------------------------------- child
+
+async def run_level(args):
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    import bot as botmod
+    import fake_discord
+    from bench_quick_replies import ARABIC_MESSAGES, ENGLISH_MESSAGES
+
+    rng = random.Random(args.seed)
+    seed_started = time.perf_counter()
+    for i in range(args.users):
+        botmod.storage.save_user(str(100000 + i), seeded_user(i))
+    seed_s = time.perf_counter() - seed_started
+
+    await botmod.bot._async_setup_hook()
+    fake_discord.install(botmod.bot)
+
+    first_reply = []
+    completed = []
+    state = {"done": 0, "last": 0.0}
+
+    def on_first_reply(latencies):
+        first_reply.extend(latencies)
+
+    handler = botmod.message_coalescer.handler
+
+    async def timed_handler(uid, messages):
+        try:
+            await handler(uid, messages)
+        finally:
+            now = time.perf_counter()
+            completed.extend(now - m.created_at_perf for m in messages)
+            state["done"] += len(messages)
+            state["last"] = now
+
+    botmod.message_coalescer.handler = timed_handler
+
+    lags = []
+    stop = asyncio.Event()
+
+    async def monitor_lag(interval=0.05):
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lags.append(max(0.0, time.perf_counter() - started - interval))
+
+    users = []
+    for i in range(args.users):
+        user = fake_discord.FakeUser(100000 + i)
+        users.append((user, fake_discord.FakeDMChannel(user, on_first_reply), i % 2 == 0))
+
+    total = args.users * args.messages_per_user
+    arrivals = sorted((rng.uniform(0, args.duration), index % args.users) for index in range(total))
+
+    io_before = read_proc_io()
+    lag_task = asyncio.create_task(monitor_lag())
+    started = time.perf_counter()
+    for at, index in arrivals:
+        delay = started + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        user, channel, arabic = users[index]
+        content = rng.choice(ARABIC_MESSAGES if arabic else ENGLISH_MESSAGES)
+        message = fake_discord.FakeMessage(user, channel, content)
+        channel.waiting.append(message.created_at_perf)
+        botmod.bot.dispatch("message", message)
+
+    deadline = time.perf_counter() + args.duration + args.timeout
+    while state["done"] < total and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    finished = state["last"] or time.perf_counter()
+
+    await botmod.user_writer.flush()
+    await botmod.conversation_log.flush()
+    stop.set()
+    await lag_task
+    io_after = read_proc_io()
+
+    writer = botmod.user_writer.stats
+    log = botmod.conversation_log.stats
+    handled = max(1, state["done"])
+    result = {
+        "users": args.users,
+        "messages": total,
+        "handled": state["done"],
+        "seed_s": round(seed_s, 2),
+        "msgs_per_s": round(state["done"] / max(1e-9, finished - started), 1),
+        "first_reply_ms": {p: round(percentile(first_reply, p) * 1000, 1) for p in (50, 95, 99)},
+        "complete_ms": {p: round(percentile(completed, p) * 1000, 1) for p in (50, 95, 99)},
+        "loop_lag_ms": {"p50": round(percentile(lags, 50) * 1000, 2), "p99": round(percentile(lags, 99) * 1000, 2),
+                        "max": round(max(lags, default=0) * 1000, 2)},
+        "saves_per_msg": round(writer["flushed"] / handled, 3),
+        "save_bytes_per_msg": round(writer["bytes"] / handled, 1),
+        "log_turns_per_msg": round(log["appended"] / handled, 3),
+        "disk_bytes_per_msg": round((io_after.get("write_bytes", 0) - io_before.get("write_bytes", 0)) / handled, 1),
+        "write_calls_per_msg": round((io_after.get("syscw", 0) - io_before.get("syscw", 0)) / handled, 2),
+        "cache_users": len(botmod.user_cache.entries),
+        "llm": dict(botmod.llm_pool.stats),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    print(RESULT_MARKER + json.dumps(result, ensure_ascii=False), flush=True)
+
+
+# ---------------------------------------------------------------- parent
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def print_row(r):
+    fr, cp, lag = r["first_reply_ms"], r["complete_ms"], r["loop_lag_ms"]
+    print(f"{r['users']:>7} {r['handled']:>7}/{r['messages']:<7} {r['msgs_per_s']:>8} "
+          f"{fr['50']:>7}/{fr['95']}/{fr['99']:<7} {cp['50']:>7}/{cp['95']}/{cp['99']:<7} "
+          f"{lag['p50']:>5}/{lag['p99']}/{lag['max']:<6} {r['saves_per_msg']:>5} {r['disk_bytes_per_msg']:>9} "
+          f"{r['max_rss_mb']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="100,1000,10000,100000")
+    parser.add_argument("--messages-per-user", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10, help="الرسائل بتتوزع على المدة دي بالثواني")
+    parser.add_argument("--timeout", type=float, default=120, help="وقت إضافي لحد ما كل الردود تخلص")
+    parser.add_argument("--latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-sec", type=float, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--stream", default="1")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.users = int(args.users)
+        asyncio.run(run_level(args))
+        return
+
+    port = free_port()
+    stub = subprocess.Popen([sys.executable, os.path.join(HERE, "stub_openai.py"), "--port", str(port),
+                             "--latency", str(args.latency), "--tokens-per-sec", str(args.tokens_per_sec),
+                             "--error-rate", str(args.error_rate)])
+    try:
+        if not wait_for_port(port):
+            sys.exit("❌ السيرفر المحلي مقامش")
+
+        env = dict(os.environ)
+        env.update({
+            "OPENROUTER_API_KEY": "loadtest",
+            "OPENROUTER_BASE_URL": f"http://127.0.0.1:{port}/v1",
+            "STORAGE_BACKEND": args.backend,
+            "STREAM_RESPONSES": args.stream,
+            "DISCORD_TOKEN": env.get("DISCORD_TOKEN", "loadtest"),
+        })
+        # حدود OpenRouter الحقيقية مش موجودة في السيرفر المحلي
+        env.setdefault("LLM_RATE_PER_SEC", "0")
+        env.setdefault("LLM_MAX_CONCURRENCY", "256")
+        env.setdefault("LLM_MAX_QUEUE", "0")
+
+        print(f"{'users':>7} {'handled':>15} {'msg/s':>8} {'first ms p50/95/99':>22} {'done ms p50/95/99':>22} "
+              f"{'lag ms':>16} {'saves':>5} {'disk B/msg':>9} {'rss MB':>7}")
+        for users in [int(u) for u in args.users.split(",") if u.strip()]:
+            with tempfile.TemporaryDirectory(prefix="loadtest-") as workdir:
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", "--users", str(users),
+                       "--messages-per-user", str(args.messages_per_user), "--duration", str(args.duration),
+                       "--timeout", str(args.timeout), "--seed", str(args.seed)]
+                proc = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True)
+                lines = [l for l in proc.stdout.splitlines() if l.startswith(RESULT_MARKER)]
+                if not lines:
+                    print(f"❌ {users} مستخدم: فشل\n{proc.stderr[-2000:]}")
+                    continue
+                result = json.loads(lines[-1][len(RESULT_MARKER):])
+                print_row(result)
+                sys.stdout.flush()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
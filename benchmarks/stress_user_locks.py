@@ -0,0 +1,226 @@
+"""
+stress test للـ locks على مسار bot.py الحقيقي: رسائل خاصة مزيفة بتدخل on_message (fake_discord)
+من مستخدمين كتير في نفس الوقت، والذكاء الاصطناعي سيرفر محلي (stub_openai). ومعاها الموقع
+بيعدل الإعدادات بـ DashboardStore وطابور التغييرات بيتقري بـ reload_changed_users (زي watch_files)،
+فالـ handle_direct_message وتأجيل إعادة التحميل (_reload_when_free / reload_after_write) بيتجربوا بجد.
+في الآخر بيتأكد إن مفيش رسالة ولا XP ضاعوا (في الذاكرة وفي المخزن)، وإن المحادثة فيها كل
+رسائل المستخدم بالترتيب، وإن آخر اسم كتبه الموقع هو اللي فضل.
+
+    python benchmarks/stress_user_locks.py [--users 200] [--messages 10] [--backend json|sqlite] [--no-locks]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from contextlib import asynccontextmanager
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from loadtest import free_port, wait_for_port, seeded_user
+
+# randint(2, 8) بتاع الخبرة بيبقى ثابت عشان نعرف المفروض يبقى كام
+XP_PER_MESSAGE = 5
+FIRST_USER_ID = 100000
+
+
+class NoLocks:
+    """--no-locks: نفس شكل UserLocks بس مفيش حاجة بتستنى (عشان نشوف اللي بيضيع من غيرها)."""
+
+    def __init__(self):
+        self.stats = {"acquired": 0, "contended": 0, "max_wait_ms": 0.0}
+
+    def locked(self, user_id):
+        return False
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        yield
+
+
+# ----------------------------------------------------------------- child
+
+async def run_child(args):
+    sys.path.insert(0, ROOT)
+    import bot as botmod
+    import fake_discord
+    from dashboard_store import DashboardStore
+
+    rng = random.Random(args.seed)
+    botmod.random.randint = lambda a, b: XP_PER_MESSAGE
+    if args.no_locks:
+        botmod.user_locks = NoLocks()
+    # مفيش اتصال بـ Discord: رسائل "الإعدادات اتحدثت" بتتعد بس
+    notices = []
+    botmod.dm_dispatcher.send = lambda user_id, content=None, **kwargs: notices.append(user_id)
+
+    uids = [str(FIRST_USER_ID + i) for i in range(args.users)]
+    for i, uid in enumerate(uids):
+        botmod.storage.save_user(uid, seeded_user(i))
+
+    await botmod.bot._async_setup_hook()
+    fake_discord.install(botmod.bot)
+    # أول قراية بتبدأ من آخر الطابور
+    botmod.change_queue.read_changes()
+
+    site = DashboardStore(botmod.storage)
+    site_names = {}  # آخر اسم الموقع كتبه لكل مستخدم
+    stop = asyncio.Event()
+    stats = {"site_writes": 0}
+
+    async def website():
+        # الموقع بروسيس تاني في الحقيقة: نفس كود /api/v1/settings بيكتب في thread
+        n = 0
+        while not stop.is_set():
+            uid = rng.choice(uids)
+            n += 1
+            name = f"Site{n}"
+            await site.patch_settings(uid, {"bot_name": name}, lambda: seeded_user(0))
+            site_names[uid] = name
+            stats["site_writes"] += 1
+            await asyncio.sleep(rng.uniform(0, 0.01))
+
+    async def watcher():
+        # زي وضع queue في watch_files بس من غير الـ 2 ثانية
+        while not stop.is_set():
+            await botmod.reload_changed_users(botmod.change_queue.read_changes())
+            await asyncio.sleep(0.005)
+
+    users = []
+    for uid in uids:
+        user = fake_discord.FakeUser(uid)
+        users.append((uid, user, fake_discord.FakeDMChannel(user)))
+
+    background = [asyncio.create_task(website()), asyncio.create_task(watcher())]
+    started = time.perf_counter()
+    for seq in range(args.messages):
+        for uid, user, channel in users:
+            message = fake_discord.FakeMessage(user, channel, f"stress {uid} {seq}")
+            botmod.bot.dispatch("message", message)
+            if rng.random() < 0.05:
+                await asyncio.sleep(0)
+        await asyncio.sleep(rng.uniform(0, 0.05))
+
+    coalescer = botmod.message_coalescer
+    deadline = time.perf_counter() + args.timeout
+    while (coalescer.pending or coalescer.running or coalescer.timers) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+    # الموقع بيكمل شوية بعد آخر رد: مستخدمين فاضيين بيتحملوا من جديد على طول من غير تأجيل
+    await asyncio.sleep(0.3)
+    stop.set()
+    await asyncio.gather(*background)
+
+    # آخر تغييرات الموقع والحفظات اللي لسه مستنية
+    while time.perf_counter() < deadline:
+        await botmod.reload_changed_users(botmod.change_queue.read_changes())
+        await botmod.user_writer.flush()
+        busy = (botmod.deferred_reloads or botmod.reload_after_write or botmod.user_writer.dirty
+                or botmod.user_writer.in_flight or not coalescer_idle(coalescer))
+        if not busy and not pending_tasks():
+            break
+        await asyncio.sleep(0.05)
+    await botmod.user_writer.flush()
+    await botmod.conversation_log.flush()
+
+    lost_messages = lost_xp = broken = stale_names = 0
+    expected_xp = args.messages * XP_PER_MESSAGE
+    for uid in uids:
+        stored = botmod.storage.load_user(uid)
+        for progress in (botmod.user_progress.get(uid, {}), stored["user_progress"]):
+            lost_messages += args.messages - progress.get("messages", 0)
+            lost_xp += expected_xp - progress.get("xp", 0)
+        said = []
+        for turn in botmod.storage.tail_turns(uid):
+            if turn.get("role") == "user":
+                said.extend(turn["content"].split("\n"))
+        if said != [f"stress {uid} {seq}" for seq in range(args.messages)]:
+            broken += 1
+        if uid in site_names:
+            names = {stored["user_data"].get("bot_name"), botmod.user_data.get(uid, {}).get("bot_name")}
+            stale_names += names != {site_names[uid]}
+
+    locks = botmod.user_locks.stats
+    mode = "بدون locks" if args.no_locks else "مع locks"
+    total = args.users * args.messages
+    print(f"{mode} ({botmod.storage.name}): {total} رسالة من {args.users} مستخدم في {elapsed:.2f}s "
+          f"({total / elapsed:.0f} رسالة/ث)")
+    print(f"دفعات: {coalescer.stats['batches']} (اتلغى {coalescer.stats['cancelled']}) • "
+          f"تعديلات الموقع: {stats['site_writes']} • إعادة تحميل: {botmod.watch_stats['reloads']} • "
+          f"رسائل تحديث الإعدادات: {len(notices)}")
+    print(f"locks: {locks['acquired']} • زحمة: {locks['contended']} • أقصى انتظار {locks['max_wait_ms']:.1f}ms")
+    print(f"رسائل ضاعت من العداد: {lost_messages} • XP ضاع: {lost_xp} • محادثات ناقصة/متلخبطة: {broken} • "
+          f"اسم الموقع ضاع: {stale_names}")
+    sys.stdout.flush()
+    # من غير إغلاق البوت (مفيش اتصال أصلاً)
+    os._exit(1 if lost_messages or lost_xp or broken or stale_names else 0)
+
+
+def coalescer_idle(coalescer):
+    return not (coalescer.pending or coalescer.running or coalescer.timers)
+
+
+def pending_tasks():
+    # مهام الخلفية بتاعة البوت (دمج بعد حفظ مرفوض، إعادة تحميل مؤجلة) لسه شغالة
+    current = asyncio.current_task()
+    return [t for t in asyncio.all_tasks() if t is not current and not t.done()
+            and t.get_coro().__name__ in ("_merge_stored_user", "_reload_when_free", "reload_changed_users")]
+
+
+# ---------------------------------------------------------------- parent
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"])
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-locks", action="store_true")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run_child(args))
+        return
+
+    port = free_port()
+    stub = subprocess.Popen([sys.executable, os.path.join(HERE, "stub_openai.py"), "--port", str(port),
+                             "--latency", str(args.latency), "--tokens-per-sec", "2000"])
+    try:
+        if not wait_for_port(port):
+            sys.exit("❌ السيرفر المحلي مقامش")
+        env = dict(os.environ)
+        env.update({
+            "OPENROUTER_API_KEY": "stress",
+            "OPENROUTER_BASE_URL": f"http://127.0.0.1:{port}/v1",
+            "STORAGE_BACKEND": args.backend,
+            "DISCORD_TOKEN": env.get("DISCORD_TOKEN", "stress"),
+            "LLM_RATE_PER_SEC": "0",
+            "LLM_MAX_CONCURRENCY": "256",
+            "LLM_MAX_QUEUE": "0",
+            # دفعات ورسائل ملغية كتير وحفظ أسرع = فرص أكتر للتداخل
+            "COALESCE_WINDOW": "0.02",
+            "COALESCE_MAX_WAIT": "0.1",
+            "SAVE_DELAY": "0.05",
+        })
+        with tempfile.TemporaryDirectory(prefix="stress-") as workdir:
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", "--users", str(args.users),
+                   "--messages", str(args.messages), "--timeout", str(args.timeout), "--seed", str(args.seed)]
+            if args.no_locks:
+                cmd.append("--no-locks")
+            proc = subprocess.run(cmd, cwd=workdir, env=env)
+        sys.exit(proc.returncode)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+سيرفر محلي بيقلد /v1/chat/completions بتاع OpenRouter (عادي و stream) عشان
+اختبار الحمل ميكلمش الـ API الحقيقي ولا يدفع فلوس.
+
+    python benchmarks/stub_openai.py --port 8089 --latency 0.4 --tokens-per-sec 60
+
+--error-rate بيرجع 429 لنسبة من الطلبات (عشان backoff بتاع llm_pool يتجرب).
+cached_tokens بيتحسب من أطول بداية للرسائل اتشافت قبل كده (تقليد لكاش المزود).
+"""
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+
+from aiohttp import web
+
+WORDS = ["تمام", "والله", "بجد", "ههههه", "طيب", "احكيلي", "اكتر", "عن", "ده", "النهاردة",
+         "yeah", "really", "tell", "me", "more", "about", "that", "today", "okay", "haha"]
+
+
+def _tokens(text):
+    return max(1, len(text) // 3)
+
+
+class PrefixCache:
+    def __init__(self, size=200000):
+        self.size = size
+        self.seen = OrderedDict()
+
+    def lookup_and_store(self, messages):
+        """عدد الـ tokens في أطول بداية للرسائل اتشافت قبل كده."""
+        digest = hashlib.sha1()
+        cached = 0
+        running = 0
+        prefixes = []
+        for message in messages:
+            content = message.get("content") or ""
+            digest.update(f"{message.get('role')}\0{content}\0".encode("utf-8"))
+            running += _tokens(content)
+            key = digest.hexdigest()
+            prefixes.append(key)
+            if key in self.seen:
+                cached = running
+        for key in prefixes:
+            self.seen[key] = True
+            self.seen.move_to_end(key)
+        while len(self.seen) > self.size:
+            self.seen.popitem(last=False)
+        return cached
+
+
+def make_app(latency, jitter, tokens_per_sec, reply_tokens, error_rate):
+    cache = PrefixCache()
+    stats = {"requests": 0, "streams": 0, "errors": 0, "disconnects": 0}
+
+    async def completions(request):
+        body = await request.json()
+        stats["requests"] += 1
+        if error_rate and random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": {"message": "rate limited", "code": 429}},
+                                     status=429, headers={"retry-after": "0.2"})
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(_tokens(m.get("content") or "") for m in messages)
+        cached_tokens = cache.lookup_and_store(messages)
+        count = min(body.get("max_tokens") or reply_tokens, reply_tokens)
+        words = [random.choice(WORDS) for _ in range(random.randint(max(1, count // 2), count))]
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        await asyncio.sleep(max(0.0, random.uniform(latency - jitter, latency + jitter)))
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": f"stub-{stats['requests']}", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        stats["streams"] += 1
+        try:
+            return await stream_reply(request, words, usage, created, model, body)
+        except ConnectionResetError:
+            # البوت قفل الاتصال (الرد اتلغى عشان رسالة أحدث)
+            stats["disconnects"] += 1
+            return web.Response(status=499)
+
+    async def stream_reply(request, words, usage, created, model, body):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        def chunk(delta, finish=None, with_usage=False):
+            payload = {"id": f"stub-{stats['requests']}", "object": "chat.completion.chunk",
+                       "created": created, "model": model,
+                       "choices": [] if with_usage else [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            if with_usage:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        delay = 1 / tokens_per_sec if tokens_per_sec > 0 else 0
+        for i, word in enumerate(words):
+            await response.write(chunk({"content": word if i == 0 else " " + word}))
+            if delay:
+                await asyncio.sleep(delay)
+        await response.write(chunk({}, finish="stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await response.write(chunk(None, with_usage=True))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def get_stats(request):
+        return web.json_response(stats)
+
+    app = web.Application(client_max_size=8 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", completions)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.4, help="وقت أول token بالثواني")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--tokens-per-sec", type=float, default=60)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    app = make_app(args.latency, args.jitter, args.tokens_per_sec, args.reply_tokens, args.error_rate)
+    web.run_app(app, host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,45 @@
 import discord
 from discord.ext import commands, tasks
 import os
-import json
 import random
 import asyncio
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
+from change_feed import ChangeQueueReader, notify_change, WEB_SOURCE
+from write_behind import WriteBehind
+from storage import get_storage, snapshot_sections, merge_documents
+from user_cache import SummaryIndex, UserCache, summarize_user
+from conversation_log import ConversationLog, HISTORY_WINDOW, HISTORY_MAX_TURNS, DISK_WRITE_SECONDS
+from memory_index import UserMemory, MEMORY_TOP_K
+from persona import PersonaCompiler
+from dashboard_store import SITE_KEYS
+from prompt_builder import build_prompt, build_cached_prompt, window_turns, RollingSummarizer, PROMPT_RECENT_TURNS, PROMPT_LAYOUT
+from llm_pool import LLMPool, LLMPoolBusy, usage_counts
+from coalescer import MessageCoalescer
+from user_locks import UserLocks
+from streaming import DiscordStreamWriter, STREAM_RESPONSES, DISCORD_SEND_SECONDS
+from quick_replies import quick_replies
+from inactivity import InactivityNotifier
+from dm_dispatch import DMDispatcher
+from reminders import ReminderScheduler, REPEAT_WORDS, DEFAULT_TIMEZONE, get_zone, next_occurrence
+from metrics import registry, LoopLagMonitor, serve_metrics, METRICS_PORT
+from sharding import create_bot, OWNS_DMS, SHARD_OPTIONS, WORKER_INDEX, WORKER_COUNT
+
+try:
+    from watchfiles import awatch
+except ImportError:
+    awatch = None
 
 load_dotenv()
 
 client = AsyncOpenAI(
     api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url="https://openrouter.ai/api/v1",
+    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+    max_retries=0,  # إعادة المحاولة بتحصل في llm_pool
 )
+llm_pool = LLMPool(client)
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 BOT_PREFIX = os.getenv("BOT_PREFIX", "!")
@@ -29,7 +55,8 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 
-bot = commands.Bot(
+# SHARD_COUNT متحدد = AutoShardedBot (وstart.sh بيشغل BOT_WORKERS بروسيس)
+bot = create_bot(
     command_prefix=BOT_PREFIX,
     intents=intents,
     help_command=None
@@ -40,187 +67,502 @@ user_data = {}
 user_progress = {}
 user_reminders = {}
 user_conversations = {}
-notified_users = set()
-user_last_active = {}
 user_conversation_history = {}
-file_last_modified = {}
+user_versions = {}
+# آخر نسخة البوت قراها أو كتبها من كل قسم (نص JSON): الأساس بتاع الدمج لو حفظ اترفض
+user_bases = {}
 bot_start_time = datetime.now()
 
 # مجلد تخزين بيانات المستخدمين
 DATA_DIR = "users_data"
 
-# تحميل البيانات من الملفات المنفصلة
+# مكان التخزين: ملفات JSON أو SQLite حسب STORAGE_BACKEND
+storage = get_storage()
+# المحادثة في سجل append-only، وفي الذاكرة آخر HISTORY_WINDOW رسالة بس
+conversation_log = ConversationLog(storage)
+# فهرس الرسائل القديمة عشان نجيب اللي ليه علاقة بالرسالة الجديدة
+user_memory = UserMemory(capacity=HISTORY_MAX_TURNS)
+persona_compiler = PersonaCompiler()
+
+def _apply_user_document(user_id, data, version):
+    user_data[user_id] = data.get("user_data", {})
+    user_progress[user_id] = data.get("user_progress", {})
+    user_reminders[user_id] = data.get("user_reminders", [])
+    user_conversations[user_id] = data.get("user_conversations", {})
+    user_versions[user_id] = version
+    user_bases[user_id] = snapshot_sections(_user_document(user_id))
+    if user_id in user_conversation_history:
+        # إعادة تحميل من الموقع: المحادثة اللي في الذاكرة هي الأحدث
+        return
+    # قراية واحدة للسجل: كله للفهرس وآخر HISTORY_WINDOW للذاكرة
+    # (ملف قديم كانت المحادثة جواه بيتنقل للسجل في storage.load_user)
+    history = conversation_log.tail(user_id, HISTORY_MAX_TURNS)
+    user_memory.load(user_id, history)
+    user_conversation_history[user_id] = history[-HISTORY_WINDOW:]
+
+def remember_turn(uid, role, content):
+    """ضيف رسالة للمحادثة: للذاكرة (آخر HISTORY_WINDOW) وللسجل على الديسك."""
+    turn = {"role": role, "content": content, "time": datetime.now().isoformat()}
+    history = user_conversation_history.setdefault(uid, [])
+    history.append(turn)
+    if len(history) > HISTORY_WINDOW:
+        del history[:-HISTORY_WINDOW]
+    conversation_log.append(uid, turn)
+    user_memory.add(uid, turn)
+    return turn
+
+# تحميل كل المستخدمين مرة واحدة (للسكربتات بس، البوت بيحمل كل مستخدم وقت ما يحتاجه)
 def load_data():
-    global user_data, user_progress, user_reminders, user_conversations, user_conversation_history
     try:
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-            print(f"✅ تم إنشاء مجلد البيانات: {DATA_DIR}")
-            return
-
         count = 0
-        for filename in os.listdir(DATA_DIR):
-            if filename.endswith(".json"):
-                user_id = filename[:-5]
-                file_path = os.path.join(DATA_DIR, filename)
-                with open(file_path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    user_data[user_id] = data.get("user_data", {})
-                    user_progress[user_id] = data.get("user_progress", {})
-                    user_reminders[user_id] = data.get("user_reminders", {})
-                    user_conversations[user_id] = data.get("user_conversations", {})
-                    user_conversation_history[user_id] = data.get("user_conversation_history", [])
-                    file_last_modified[user_id] = os.path.getmtime(file_path)
-                    count += 1
-        print(f"✅ تم تحميل بيانات {count} مستخدم من ملفات منفصلة")
+        for user_id in storage.list_user_ids():
+            version = storage.user_version(user_id)
+            data = storage.load_user(user_id)
+            if data is None:
+                continue
+            _apply_user_document(user_id, data, version)
+            count += 1
+        print(f"✅ تم تحميل بيانات {count} مستخدم ({storage.name})")
     except Exception as e:
         print(f"❌ خطأ في تحميل البيانات: {e}")
 
+# الحفظ بيتم في الخلفية: save_user_data بتعلم على المستخدم بس،
+# والـ worker بيدمج الحفظات المتكررة في فترة SAVE_DELAY ويكتب atomic
+SAVE_DELAY = float(os.getenv("SAVE_DELAY", "0.5"))
+
+def _user_document(uid):
+    return {
+        "user_data": user_data.get(uid, {}),
+        "user_progress": user_progress.get(uid, {}),
+        "user_reminders": user_reminders.get(uid, []),
+        "user_conversations": user_conversations.get(uid, {}),
+    }
+
+def _serialize_user(uid, sections):
+    summary_index.update(uid, summarize_user(
+        user_data.get(uid, {}), user_progress.get(uid, {}), user_reminders.get(uid, [])
+    ))
+    data = _user_document(uid)
+    # النسخة اللي البوت شايفها دلوقتي: الكتابة بتتأكد إن محدش كتب بعدها،
+    # واللي اتكتب فعلاً (JSON بيكتب الملف كله) بيبقى الأساس الجديد لو اتكتب
+    written = sections if storage.partial_writes else None
+    return user_versions.get(uid), snapshot_sections(data, written), storage.encode(data, sections)
+
+def _write_user(uid, payload):
+    # بتشتغل في thread الحفظ
+    expected, snapshot, payload = payload
+    with DISK_WRITE_SECONDS.time(kind="user"):
+        # لو الموقع أو worker تاني كتب بعد آخر قراية/كتابة للبوت مفيش كتابة (None = اتعمل merge وهنكتب تاني)
+        version = storage.write(uid, payload, expected)
+    if version is None:
+        return None
+    if WORKER_COUNT > 1:
+        # الـ workers التانيين ممكن يكونوا محملين المستخدم ده: يعيدوا تحميله من المخزن
+        notify_change(uid, WORKER_SOURCE)
+    return version, snapshot
+
+def _user_written(uid, result):
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None  # flush_sync وقت الإغلاق
+    if result is None:
+        if loop is not None:
+            merging_users.add(uid)
+            loop.create_task(_merge_stored_user(uid))
+        return
+    version, snapshot = result
+    user_versions[uid] = version
+    if uid in user_data:
+        user_bases.setdefault(uid, {}).update(snapshot)
+    pending = reload_after_write.pop(uid, None)
+    if pending is not None and loop is not None:
+        # تغيير من برة وصل والكتابة دي شغالة: نشوفه تاني دلوقتي
+        loop.create_task(reload_changed_users([(uid,) + pending]))
+
+user_writer = WriteBehind(_serialize_user, _write_user, delay=SAVE_DELAY, on_written=_user_written)
+
+# المستخدمين بيتحملوا عند أول استخدام بس، والإحصائيات واللوحات بتقرا من الفهرس
+# (الـ worker صاحب الخاص بس هو اللي بيكتب الملف، لأنه اللي بيحدث فيه كل المستخدمين)
+summary_index = SummaryIndex(persist=OWNS_DMS)
+
+def _unload_user(uid):
+    for store in (user_data, user_progress, user_reminders, user_conversations, user_conversation_history,
+                  user_versions, user_bases):
+        store.pop(uid, None)
+    user_memory.forget(uid)
+    persona_compiler.forget(uid)
+    prompt_anchors.pop(uid, None)
+
+def _estimate_user_size(uid):
+    history = user_conversation_history.get(uid, [])
+    size = 2048 + sum(len(m.get("content", "")) * 2 + 120 for m in history if isinstance(m, dict))
+    return size + user_memory.nbytes(uid)
+
+def _save_pending(uid):
+    # حفظ مستني أو حفظ اترفض ولسه بيتعمله merge: الذاكرة فيها حاجات مش في المخزن
+    return user_writer.is_pending(uid) or uid in merging_users
+
+def _user_busy(uid):
+    return _save_pending(uid) or conversation_log.is_pending(uid)
+
+user_cache = UserCache(_unload_user, _estimate_user_size, is_busy=_user_busy)
+
+def ensure_user_loaded(user_id, create=True):
+    """
+    حمل المستخدم لو مش في الذاكرة. create=False للأوامر: مفيش ملف جديد لأي حد كتب أمر.
+    """
+    uid = str(user_id)
+    if uid not in user_data:
+        if not create and storage.user_version(uid) is None:
+            return False
+        load_single_user(uid)
+        user_cache.touch(uid, loaded=True)
+    else:
+        user_cache.touch(uid)
+    return True
+
+async def save_summary_index():
+    # الـ snapshot على الـ event loop والكتابة في thread
+    text = summary_index.snapshot()
+    if text is not None:
+        await asyncio.to_thread(summary_index.write, text)
+
+async def evict_idle_users():
+    """شيل المستخدمين اللي مش مستخدمين من الذاكرة واحفظ الفهرس."""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        await asyncio.sleep(60)
+        try:
+            user_cache.refresh_sizes()
+            evicted = user_cache.evict()
+            if evicted:
+                print(f"🧹 تم تفريغ {evicted} مستخدم من الذاكرة")
+            await save_summary_index()
+        except Exception as e:
+            print(f"❌ خطأ في تفريغ الذاكرة: {e}")
+
 # حفظ كل مستخدم في ملفه الخاص
 def save_data():
+    all_user_ids = set(list(user_data.keys()) + list(user_progress.keys()) +
+                      list(user_reminders.keys()) + list(user_conversation_history.keys()))
+    for user_id in all_user_ids:
+        user_writer.mark_dirty(user_id)
+
+def save_user_data(user_id, *sections):
+    """
+    علم على المستخدم إنه محتاج يتحفظ، والكتابة الفعلية بتحصل في الخلفية.
+    sections: الأقسام اللي اتغيرت بس (مثلاً "user_progress")، ومن غيرها بيتحفظ كله.
+    """
+    user_writer.mark_dirty(user_id, sections or None)
+
+# مهمة مراقبة التحديثات من الموقع
+# بدل ما نلف على كل ملفات المستخدمين كل ثانيتين، بنستنى إشعارات التغيير:
+# inotify عن طريق watchfiles لو متاحة، وإلا طابور التغييرات اللي بيكتبه /save
+WATCH_MODE = os.getenv("WATCH_MODE", "auto")  # auto | inotify | queue
+change_queue = ChangeQueueReader()
+watch_stats = {
+    "mode": None,
+    "events": 0,
+    "files_scanned": 0,
+    "reloads": 0,
+    "last_reload_ms": 0.0,
+    "max_reload_ms": 0.0,
+    "total_reload_ms": 0.0,
+}
+
+def _user_id_from_path(path):
+    filename = os.path.basename(path)
+    if filename.endswith(".json") and not filename.startswith("."):
+        return filename[:-5]
+    return None
+
+async def reload_changed_users(changes):
+    """
+    حمل من جديد المستخدمين اللي ملفاتهم اتغيرت بس.
+    changes: [(user_id, وقت_ملاحظة_التغيير, source), ...] و source هو WEB_SOURCE أو worker<N>
+    """
+    for user_id, noticed_at, source in changes:
+        watch_stats["events"] += 1
+        watch_stats["files_scanned"] += 1
+        try:
+            with FILE_SCAN_SECONDS.time(op="stat"):
+                current_version = storage.user_version(user_id)
+        except Exception:
+            continue
+        if current_version is None:
+            continue
+
+        if _save_pending(user_id):
+            # حفظ البوت لسه بيتكتب: _user_written هيرجع يشوف المستخدم ده بعد الكتابة
+            _reload_after_write(user_id, noticed_at, source)
+            continue
+        if user_id not in user_data:
+            # مش محمل في الذاكرة، هيتقري جديد أول ما يتحمل
+            if OWNS_DMS and WORKER_COUNT > 1:
+                _refresh_unloaded_user(user_id)
+            continue
+        if current_version == user_versions.get(user_id):
+            continue
+        if user_locks.locked(user_id):
+            # في رد شغال دلوقتي: نستنى يخلص بدل ما نبدل الداتا من تحته
+            if user_id not in deferred_reloads:
+                deferred_reloads[user_id] = source
+                bot.loop.create_task(_reload_when_free(user_id, noticed_at))
+            elif source == WEB_SOURCE:
+                deferred_reloads[user_id] = source
+            continue
+        await _reload_user(user_id, current_version, noticed_at, source)
+
+def _refresh_unloaded_user(user_id):
+    """
+    worker تاني (أمر في سيرفر) غير مستخدم مش محمل هنا: نحدث الفهرس وجدول التذكيرات
+    بس، لأن التذكيرات بتتبعت من الـ worker ده.
+    """
     try:
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-
-        all_user_ids = set(list(user_data.keys()) + list(user_progress.keys()) +
-                          list(user_reminders.keys()) + list(user_conversation_history.keys()))
-
-        for user_id in all_user_ids:
-            data = {
-                "user_data": user_data.get(user_id, {}),
-                "user_progress": user_progress.get(user_id, {}),
-                "user_reminders": user_reminders.get(user_id, {}),
-                "user_conversations": user_conversations.get(user_id, {}),
-                "user_conversation_history": user_conversation_history.get(user_id, []),
-                "last_save": datetime.now().isoformat()
-            }
-            file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-
-            file_last_modified[user_id] = os.path.getmtime(file_path)
+        with FILE_SCAN_SECONDS.time(op="load"):
+            data = storage.load_user(user_id)
     except Exception as e:
-        print(f"❌ خطأ في حفظ البيانات: {e}")
-
-def save_user_data(user_id):
+        print(f"❌ خطأ في قراءة ملف المستخدم {user_id}: {e}")
+        return
+    if data is None:
+        return
+    reminders = data.get("user_reminders") or []
+    summary_index.update(user_id, summarize_user(data.get("user_data") or {}, data.get("user_progress") or {}, reminders))
+    reminder_scheduler.cancel_user(user_id)
+    for item in reminders:
+        reminder_scheduler.schedule(user_id, item)
+
+# رقم الـ worker ده في طابور التغييرات، عشان التانيين يعرفوا إن التغيير مش من الموقع
+WORKER_SOURCE = f"worker{WORKER_INDEX}"
+# إعادة تحميل مستنية الرد يخلص: user_id -> source
+deferred_reloads = {}
+# تغييرات وصلت وحفظ البوت مستني: user_id -> (وقت ملاحظة التغيير، source)
+reload_after_write = {}
+
+def _reload_after_write(user_id, noticed_at, source):
+    # أقدم وقت، ولو أي تغيير منهم من الموقع رسالة التحديث لازم تتبعت
+    previous = reload_after_write.get(user_id)
+    if previous is not None:
+        noticed_at = previous[0]
+        if previous[1] == WEB_SOURCE:
+            source = WEB_SOURCE
+    reload_after_write[user_id] = (noticed_at, source)
+# حفظهم اترفض و_merge_stored_user لسه مخلصتش (إعادة التحميل قبلها تمسح اللي متحفظش)
+merging_users = set()
+
+async def _merge_stored_user(user_id):
     """
-    احفظ بيانات مستخدم واحد فقط إلى ملفه وحدث file_last_modified.
+    حفظ البوت اترفض لأن المخزن اتغير من برة (الموقع أو worker تاني): اقرا المستند كله وادمج
+    كل قسم مع الذاكرة على أساس آخر نسخة البوت قراها أو كتبها (merge_documents)، فلا إعدادات
+    الموقع ولا تقدم وتذكيرات الـ worker التاني بيضيعوا، ولا اللي في الذاكرة ومتحفظش. وبعدين اكتب الكل تاني.
     """
     try:
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-        uid = str(user_id)
-        data = {
-            "user_data": user_data.get(uid, {}),
-            "user_progress": user_progress.get(uid, {}),
-            "user_reminders": user_reminders.get(uid, {}),
-            "user_conversations": user_conversations.get(uid, {}),
-            "user_conversation_history": user_conversation_history.get(uid, []),
-            "last_save": datetime.now().isoformat()
-        }
-        file_path = os.path.join(DATA_DIR, f"{uid}.json")
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-        file_last_modified[uid] = os.path.getmtime(file_path)
+        async with user_locks.hold(user_id):
+            try:
+                current_version = storage.user_version(user_id)
+                data = storage.load_user(user_id)
+            except Exception as e:
+                print(f"❌ خطأ في قراءة ملف المستخدم {user_id}: {e}")
+                data = None
+            if user_id not in user_data:
+                reload_after_write.pop(user_id, None)
+                return
+            if data is not None:
+                ours = _user_document(user_id)
+                before = snapshot_sections(ours, ("user_reminders",))
+                settings = {key: ours["user_data"].get(key) for key in SITE_KEYS}
+                merged = merge_documents(user_bases.get(user_id, {}), ours, data, prefer_theirs=SITE_KEYS,
+                                         counters=("xp", "messages"), highest=("level",))
+                # نفس الـ objects: أي كود ماسك user_data[uid] يشوف الدمج
+                for store, section in ((user_data, "user_data"), (user_progress, "user_progress"),
+                                       (user_conversations, "user_conversations")):
+                    store.setdefault(user_id, {}).clear()
+                    store[user_id].update(merged[section] or {})
+                user_reminders.setdefault(user_id, [])[:] = merged["user_reminders"] or []
+                user_bases[user_id] = snapshot_sections(data)
+                user_versions[user_id] = current_version
+                if snapshot_sections(_user_document(user_id), ("user_reminders",)) != before:
+                    reminder_scheduler.cancel_user(user_id)
+                    for item in user_reminders[user_id]:
+                        reminder_scheduler.schedule(user_id, item)
+                print(f"🔄 تم دمج بيانات المستخدم {user_id} من المخزن قبل الحفظ.")
+                # الكتابة اللي سبقتنا ممكن تكون من worker تاني مش من الموقع
+                if any(settings[key] != user_data[user_id].get(key) for key in SITE_KEYS):
+                    notify_site_update(user_id)
+            save_user_data(user_id)
+    finally:
+        # save_user_data فوق خلت الحفظ مستني، فمفيش لحظة المستخدم فيها شكله مش مشغول
+        merging_users.discard(user_id)
+
+async def _reload_when_free(user_id, noticed_at):
+    try:
+        async with user_locks.hold(user_id):
+            source = deferred_reloads.get(user_id, WEB_SOURCE)
+            if _save_pending(user_id):
+                # الرد اللي خلص علم على حفظ لسه متكتبش: إعادة التحميل دلوقتي تمسحه
+                _reload_after_write(user_id, noticed_at, source)
+                return
+            current_version = storage.user_version(user_id)
+            if user_id in user_data and current_version is not None and current_version != user_versions.get(user_id):
+                await _reload_user(user_id, current_version, noticed_at, source)
+    finally:
+        deferred_reloads.pop(user_id, None)
+
+def notify_site_update(user_id):
+    # الخاص بتاع الـ worker اللي معاه shard 0 بس، وبس لما الموقع هو اللي غير الإعدادات
+    if OWNS_DMS:
+        dm_dispatcher.send(user_id, "```css\n[ ✨ تم تحديث إعداداتي من الموقع بنجاح! ]\n```")
+
+async def _reload_user(user_id, current_version, noticed_at, source=WEB_SOURCE):
+    try:
+        with FILE_SCAN_SECONDS.time(op="load"):
+            data = storage.load_user(user_id)
     except Exception as e:
-        print(f"❌ خطأ في حفظ بيانات المستخدم {user_id}: {e}")
+        print(f"❌ خطأ في قراءة ملف المستخدم {user_id}: {e}")
+        return
+    if data is None:
+        return
+    _apply_user_document(user_id, data, current_version)
+    summary_index.update(user_id, summarize_user(
+        user_data.get(user_id, {}), user_progress.get(user_id, {}), user_reminders.get(user_id, [])
+    ))
+    reminder_scheduler.cancel_user(user_id)
+    for item in user_reminders.get(user_id, []):
+        reminder_scheduler.schedule(user_id, item)
+
+    latency_ms = max(0.0, (time.time() - noticed_at) * 1000)
+    watch_stats["reloads"] += 1
+    watch_stats["last_reload_ms"] = latency_ms
+    watch_stats["max_reload_ms"] = max(watch_stats["max_reload_ms"], latency_ms)
+    watch_stats["total_reload_ms"] += latency_ms
+    if source != WEB_SOURCE:
+        # حفظ عادي من worker تاني (رد، !daily في سيرفر...): مش تعديل إعدادات
+        print(f"🔄 تم تحديث بيانات المستخدم {user_id} من {source}.")
+        return
+    print(f"🔄 تم تحديث بيانات المستخدم {user_id} من الموقع.")
+    notify_site_update(user_id)
 
-# مهمة مراقبة التحديثات من الموقع
-@tasks.loop(seconds=2)
 async def watch_files():
-    if not os.path.exists(DATA_DIR): return
-    for filename in os.listdir(DATA_DIR):
-        if filename.endswith(".json"):
-            user_id = filename[:-5]
-            file_path = os.path.join(DATA_DIR, filename)
-            current_mtime = os.path.getmtime(file_path)
-
-            if user_id in file_last_modified:
-                if current_mtime > file_last_modified[user_id]:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        user_data[user_id] = data.get("user_data", {})
-                        user_progress[user_id] = data.get("user_progress", {})
-                        user_reminders[user_id] = data.get("user_reminders", {})
-                        user_conversation_history[user_id] = data.get("user_conversation_history", [])
-
-                    file_last_modified[user_id] = current_mtime
-                    print(f"🔄 تم تحديث بيانات المستخدم {user_id} من الموقع.")
-                    try:
-                        user = await bot.fetch_user(int(user_id))
-                        await user.send("```css\n[ ✨ تم تحديث إعداداتي من الموقع بنجاح! ]\n```")
-                    except: pass
-            else:
-                file_last_modified[user_id] = current_mtime
+    await bot.wait_until_ready()
 
-@tasks.loop(hours=24)
-async def cleanup_old_data():
-    """تنظيف المحادثات القديمة"""
-    try:
-        for user_id in list(user_conversation_history.keys()):
-            if len(user_conversation_history[user_id]) > 50:
-                user_conversation_history[user_id] = user_conversation_history[user_id][-30:]
-                save_user_data(user_id)
-                print(f"🔄 تنظيف محادثات المستخدم {user_id}")
-    except Exception as e:
-        print(f"❌ خطأ في التنظيف: {e}")
+    # inotify مش بيقول مين كتب: مع worker واحد أي تغيير مش بتاعنا يبقى من الموقع،
+    # لكن مع أكتر من worker الطابور هو اللي فيه المصدر (الموقع ولا worker تاني)
+    if WORKER_COUNT > 1 and WATCH_MODE == "inotify":
+        print("⚠️ WATCH_MODE=inotify متجاهل مع أكتر من worker، البوت هيقرا طابور التغييرات")
+    if awatch is not None and storage.watch_dir and WATCH_MODE in ("auto", "inotify") and WORKER_COUNT == 1:
+        watch_stats["mode"] = "inotify"
+        try:
+            async for changes in awatch(storage.watch_dir, recursive=False):
+                now = time.time()
+                user_ids = {_user_id_from_path(path) for _, path in changes}
+                await reload_changed_users([(uid, now, WEB_SOURCE) for uid in user_ids if uid])
+            return
+        except Exception as e:
+            print(f"⚠️ inotify غير متاح ({e})، الرجوع لطابور التغييرات")
 
-@bot.event
-async def on_ready():
-    print(f"✨ **البوت شغال** دلوقتي كـ {bot.user}")
-    load_data()
-    watch_files.start()
-    cleanup_old_data.start()
-    bot.loop.create_task(check_inactive_users())
-    bot.loop.create_task(check_reminders_task())
-    print(f"✅ تم تحميل {len(user_data)} مستخدم")
+    watch_stats["mode"] = "queue"
+    while not bot.is_closed():
+        try:
+            await reload_changed_users(change_queue.read_changes())
+        except Exception as e:
+            print(f"❌ خطأ في مراقبة التغييرات: {e}")
+        await asyncio.sleep(2)
+
+async def _summarize(uid, messages, max_tokens):
+    # مفتاح منفصل في الطابور عشان الملخص ميحجزش دور رد المستخدم نفسه
+    response = await llm_pool.chat(f"{uid}:summary", model="x-ai/grok-4.1-fast", messages=messages,
+                                   temperature=0.3, max_tokens=max_tokens)
+    return response.choices[0].message.content
+
+def _summary_updated(uid, summary, until):
+    if uid not in user_conversations:
+        return  # المستخدم اتشال من الذاكرة، هيتلخص تاني المرة الجاية
+    user_conversations[uid]["summary"] = summary
+    user_conversations[uid]["summary_until"] = until
+    save_user_data(uid, "user_conversations")
+
+# ملخص متجدد للكلام القديم بيتحدث في الخلفية بعيد عن الرد
+summarizer = RollingSummarizer(_summarize, _summary_updated)
+
+# أول رسالة في شباك المحادثة لكل مستخدم (وضع PROMPT_LAYOUT=cache)
+prompt_anchors = {}
+# tokens كل الطلبات، ومنها cached_tokens اللي المزود حسبها من الكاش
+usage_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+# سعر الـ token المتكاش بالنسبة للعادي (للتوفير التقريبي في الإحصائيات)
+CACHED_TOKEN_PRICE = float(os.getenv("CACHED_TOKEN_PRICE", "0.25"))
+
+def record_usage(uid, usage):
+    if not usage:
+        return
+    # بتاع المستخدم بيتحفظ مع user_progress بعد الرد
+    per_user = user_progress.setdefault(uid, {}).setdefault("usage", {})
+    for target in (usage_stats, per_user):
+        target["requests"] = target.get("requests", 0) + 1
+        for key in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+            target[key] = target.get(key, 0) + usage.get(key, 0)
+
+# ----- المقاييس: /metrics على METRICS_PORT، والموقع بيعرضها كمان على /metrics بتاعته -----
+loop_lag = LoopLagMonitor("sienna_bot")
+QUICK_REPLIES = registry.counter("sienna_bot_quick_replies_total", "Messages answered by a canned quick reply")
+DM_MESSAGES = registry.counter("sienna_bot_dm_messages_total", "Direct messages received (before coalescing)")
+DM_REPLY_SECONDS = registry.histogram("sienna_bot_dm_reply_seconds", "Replying to a batch of DMs while holding the user lock")
+PROMPT_BUILD_SECONDS = registry.histogram("sienna_bot_prompt_build_seconds", "Memory search and prompt assembly")
+COMMAND_SECONDS = registry.histogram("sienna_bot_command_seconds", "Command handler time")
+FILE_SCAN_SECONDS = registry.histogram("sienna_bot_file_scan_seconds", "Checking or reading a user file changed by the website")
+registry.gauge("sienna_bot_users_loaded", "Users loaded in memory", read=lambda: len(user_data))
+registry.gauge("sienna_bot_llm_active", "LLM requests in flight", read=lambda: llm_pool.active)
+registry.gauge("sienna_bot_llm_queued", "LLM requests waiting for a slot", read=lambda: llm_pool.queued())
+registry.gauge("sienna_bot_saves_pending", "Users waiting to be written", read=lambda: len(user_writer.dirty))
+registry.gauge("sienna_bot_history_ops_pending", "Conversation log operations waiting to be written",
+               read=lambda: len(conversation_log.ops))
+registry.gauge("sienna_bot_dm_batches_pending", "Users with DMs waiting in the coalescer",
+               read=lambda: len(message_coalescer.pending))
+registry.gauge("sienna_bot_reminders_scheduled", "Reminders in the scheduler heap",
+               read=lambda: len(reminder_scheduler.entries))
+
+# رسائل البوت اللي بيبدأها هو (تذكيرات، غياب، تحديث من الموقع) بتعدي على طابور واحد،
+# ورقم القناة الخاصة محفوظ في user_data["dm_channel_id"] فمفيش fetch_user كل مرة
+def _load_dm_channel(uid):
+    return user_data.get(uid, {}).get("dm_channel_id")
+
+def _store_dm_channel(uid, channel_id):
+    data = user_data.get(uid)
+    if data is not None and data.get("dm_channel_id") != channel_id:
+        data["dm_channel_id"] = channel_id
+        save_user_data(uid, "user_data")
+
+dm_dispatcher = DMDispatcher(bot, _load_dm_channel, _store_dm_channel)
+registry.gauge("sienna_bot_dm_dispatch_queued", "Proactive DMs waiting in the dispatch queue",
+               read=lambda: len(dm_dispatcher.queue))
+
+async def send_timed(channel, content):
+    with DISCORD_SEND_SECONDS.time(kind="send"):
+        return await channel.send(content)
+
+# اختيارات اللغة في أول خطوة من الإعداد
+ARABIC_CHOICES = frozenset(["عربي", "1", "ar"])
+ENGLISH_CHOICES = frozenset(["english", "2", "en"])
 
 def get_quick_response(message, user_data):
-    """ردود سريعة مبرمجة"""
-    message_lower = message.lower().strip()
+    """ردود سريعة مبرمجة (الـ regex متجمع مرة واحدة في quick_replies)"""
     lang = user_data.get("language", "ar")
-    
-    quick_responses = {
-        "ar": {
-            "مرحبا": ["أهلاً وسهلاً! 😊", "مرحباً بك! 🌟", "أهلين! 💫", "أهلاً بك يا صديقي! 🎉"],
-            "كيف حالك": ["تمام والحمدلله! 🙏", "بخير شكراً لك! 😄", "كويسة، وأنت؟ 💖", "أنا بخير، شكراً لسؤالك! 🌸"],
-            "احبك": ["💖 وأنت عزيز!", "أنا بحبك كمان يا غالي! 🌹", "💕 شكراً لك!", "أنت رائع! 😍"],
-            "باي": ["مع السلامة! 👋", "أشوفك بعدين! ✨", "باي، أراك قريباً! 💫", "وداعاً! 🌙"],
-            "شكرا": ["العفو! 😊", "على الرحب والسعة! 🌟", "دي فرحتي! 💖", "أنت تستاهل! 🎁"],
-            "صباح الخير": ["صباح النور! ☀️", "صباحك سعيد! 🌸", "صباح الخير يا جميل! 🌅"],
-            "مساء الخير": ["مساء النور! 🌙", "مسائك سعيد! ✨", "مساء الخير والعافية! 🌹"],
-        },
-        "en": {
-            "hi": ["Hello! 😊", "Hi there! 🌟", "Hey! 💫", "Hi, nice to see you! 🎉"],
-            "hello": ["Hello! 😊", "Hi there! 🌟", "Hey! 💫", "Hi, nice to see you! 🎉"],
-            "how are you": ["I'm good, thanks! 🙏", "Doing well! 😄", "Great, and you? 💖", "I'm fine, thank you! 🌸"],
-            "i love you": ["💖 You're sweet!", "Love you too! 🌹", "💕 Thank you!", "You're amazing! 😍"],
-            "bye": ["Goodbye! 👋", "See you later! ✨", "Bye, see you soon! 💫", "Farewell! 🌙"],
-            "thank you": ["You're welcome! 😊", "My pleasure! 🌟", "Anytime! 💖", "You deserve it! 🎁"],
-            "good morning": ["Good morning! ☀️", "Morning sunshine! 🌸", "Have a great morning! 🌅"],
-            "good evening": ["Good evening! 🌙", "Evening! ✨", "Have a lovely evening! 🌹"],
-        }
-    }
-    
-    lang_dict = quick_responses.get(lang, {})
-    for key, responses in lang_dict.items():
-        if key in message_lower:
-            return random.choice(responses)
-    
-    return None
+    reply = quick_replies.reply(message, lang)
+    if reply:
+        QUICK_REPLIES.inc(lang=lang)
+    return reply
 
-async def get_ai_response(user_message, user_id):
+async def get_ai_response(user_message, user_id, stream_to=None):
     """
     البوت يتكلم عادي (بدون Embeds) - فقط ردود OpenAI عادية
+    لو stream_to (قناة) متبعتة، رد الذكاء الاصطناعي بيتبعت عليها وهو بيتكتب وبترجع None.
     """
     uid = str(user_id)
-    if uid not in user_data:
-        load_single_user(uid)
+    ensure_user_loaded(uid)
 
     data = user_data.get(uid, {})
     state = data.get("state", "waiting_language")
     lang = data.get("language", "ar")
-    name = data.get("bot_name", "Sienna")
 
     # التحقق من الردود السريعة أولاً
     quick_reply = get_quick_response(user_message, data)
@@ -230,13 +572,13 @@ async def get_ai_response(user_message, user_id):
     # ----------------- waiting_language -----------------
     if state == "waiting_language":
         choice = user_message.strip().lower()
-        if choice in ["عربي", "1", "ar"]:
+        if choice in ARABIC_CHOICES:
             data["language"], data["state"] = "ar", "waiting_user_name"
-            save_user_data(uid)
+            save_user_data(uid, "user_data")
             return ["```diff\n+ تم اختيار اللغة العربية +\n```", "اكتب اسمك الحقيقي:"]
-        elif choice in ["english", "2", "en"]:
+        elif choice in ENGLISH_CHOICES:
             data["language"], data["state"] = "en", "waiting_user_name"
-            save_user_data(uid)
+            save_user_data(uid, "user_data")
             return ["```diff\n+ English selected +\n```", "Write your real name:"]
         return "```css\n[ ⚠️ يجب تفعيل البوت أولاً ]\n```استخدم: `!activate MYSECRET123`"
 
@@ -245,7 +587,7 @@ async def get_ai_response(user_message, user_id):
         name_candidate = user_message.strip()
         if 2 <= len(name_candidate) <= 20:
             data["user_name"], data["state"] = name_candidate, "waiting_age"
-            save_user_data(uid)
+            save_user_data(uid, "user_data")
             return [f"```css\n[ 👤 أهلاً وسهلاً يا {data['user_name']} ]\n```", "عشان نكمل، اكتب عمرك:", "`(رقم فقط)`"]
         return "```css\n[ ⚠️ الاسم لازم بين 2 و20 حرف ]\n```جرب اسماً أقصر أو أطول"
 
@@ -256,7 +598,7 @@ async def get_ai_response(user_message, user_id):
             if age < 14:
                 return "```diff\n- عذراً، السن غير مسموح\n```يجب أن يكون 14 سنة أو أكثر"
             data["age"], data["state"] = age, "waiting_bot_name"
-            save_user_data(uid)
+            save_user_data(uid, "user_data")
             return [f"```diff\n+ تم حفظ العمر : {age} سنة +\n```", "قولي اسمي اللي تحبه:", "`(بين 2 و20 حرف)`"]
         except:
             return "```css\n[ ⚠️ الرجاء إدخال عمر صحيح ]\n```أدخل رقماً فقط مثل: 18"
@@ -266,7 +608,7 @@ async def get_ai_response(user_message, user_id):
         bot_name_candidate = user_message.strip()
         if 2 <= len(bot_name_candidate) <= 20:
             data["bot_name"], data["state"], data["activated"] = bot_name_candidate, "normal", True
-            save_user_data(uid)
+            save_user_data(uid, "user_data")
             return [
                 "```css\n[ ✓ تم اكتمال الإعداد بنجاح ]\n```",
                 f"""```ini
@@ -285,45 +627,64 @@ async def get_ai_response(user_message, user_id):
         return "```css\n[ 🔒 غير مفعل ]\n```يجب إكمال عملية التفعيل أولاً\nاستخدم: `!activate MYSECRET123`"
 
     # ----------------- AI Chat Response -----------------
-    traits = data.get("traits", {"curiosity": 50, "sensitivity": 50, "happiness": 50, "sadness": 20, "boldness": 50, "kindness": 50, "shyness": 20, "intelligence": 80})
-    
-    system_prompt = f"أنت {name} بنت مصرية عادية 20-22 سنة. شخصيتك حقيقية. "
-    system_prompt += f"(الشخصية: فضول {traits['curiosity']}%، حساسية {traits['sensitivity']}%، ذكاء {traits['intelligence']}%) "
-    system_prompt += "بتزعلي بتفرحي بتضايقي بتغيري مزاجك حسب الكلام. استخدمي إيموجي واحد بس (😭 أو 🤭 أو 🤤). محترمه من غير سكس. ردي بذكاء."
+    # الشخصية بتتبني مرة واحدة لكل إعدادات (اسم، الصفات الـ 8، اللغة، الوضع)
+    system_prompt = persona_compiler.system_prompt(uid, data)
 
-    if data.get("sex_mode"):
-        system_prompt += " الآن في وضع سكس كوني جريئة جدًا وصريحة فاحشة ووصفي بالتفصيل."
-
-    if uid not in user_conversation_history:
-        user_conversation_history[uid] = []
-    user_conversation_history[uid].append({"role": "user", "content": user_message, "time": datetime.now().isoformat()})
+    remember_turn(uid, "user", user_message)
 
     try:
         # بناء سياق المحادثة
-        conversation_context = []
-        
-        # أضف ذكريات قديمة (عشوائية)
-        if len(user_conversation_history[uid]) > 15:
-            old_messages = user_conversation_history[uid][:-8]
-            if len(old_messages) > 0:
-                sample = random.sample(old_messages, min(2, len(old_messages)))
-                conversation_context.extend(sample)
-        
-        # أضف آخر 6 رسائل
-        conversation_context.extend(user_conversation_history[uid][-6:])
+        # الأولوية جوه الـ budget: الـ system، آخر الرسائل، الذكريات اللي ليها علاقة، الملخص
+        history = user_conversation_history[uid]
+        with PROMPT_BUILD_SECONDS.time():
+            memories = user_memory.search(uid, user_message, MEMORY_TOP_K, skip_recent=PROMPT_RECENT_TURNS)
+            conversation_state = user_conversations.setdefault(uid, {})
+            if PROMPT_LAYOUT == "cache":
+                messages, _, prompt_anchors[uid] = build_cached_prompt(
+                    system_prompt, history, memories, conversation_state.get("summary"), prompt_anchors.get(uid)
+                )
+                # الشباك ممكن يبقى لحد PROMPT_MAX_TURNS: اللي جواه ميدخلش الملخص
+                in_window = window_turns(history, prompt_anchors[uid])
+            else:
+                messages, _ = build_prompt(system_prompt, history, memories, conversation_state.get("summary"))
+                in_window = PROMPT_RECENT_TURNS
+        summarizer.maybe_refresh(uid, conversation_state, history, in_window)
         
-        response = await client.chat.completions.create(
+        request = dict(
             model="x-ai/grok-4.1-fast",
-            messages=[{"role": "system", "content": system_prompt}] + conversation_context,
+            messages=messages,
             temperature=0.85 if data.get("sex_mode") else 0.75,
             max_tokens=600 if data.get("sex_mode") else 350,
         )
-        ai_reply = response.choices[0].message.content.strip()
-        user_conversation_history[uid].append({"role": "assistant", "content": ai_reply, "time": datetime.now().isoformat()})
-        save_user_data(uid)
+        
+        if stream_to is not None and STREAM_RESPONSES:
+            writer = DiscordStreamWriter(stream_to)
+            usage = {}
+            stream = llm_pool.stream(uid, usage=usage, **request)
+            try:
+                async for delta in stream:
+                    await writer.feed(delta)
+            finally:
+                # لو الرد اتلغى (رسالة أحدث) لازم الـ stream يتقفل عشان مكانه في الطابور يفضى
+                await stream.aclose()
+                # حتى لو الاتصال اتقطع في النص: اللي اتكتب يتقفل ويتحفظ مرة واحدة
+                ai_reply = await writer.finish() if writer.sent else ""
+                if ai_reply:
+                    remember_turn(uid, "assistant", ai_reply)
+                record_usage(uid, usage)
+            return None
+        else:
+            response = await llm_pool.chat(uid, **request)
+            ai_reply = response.choices[0].message.content.strip()
+            record_usage(uid, usage_counts(getattr(response, "usage", None)))
+        remember_turn(uid, "assistant", ai_reply)
         
         return ai_reply
         
+    except LLMPoolBusy:
+        if lang == "ar":
+            return "```css\n[ ⏳ ضغط كبير ]\n```في ناس كتير بتكلمني دلوقتي، جرب تاني كمان شوية"
+        return "```css\n[ ⏳ Busy ]\n```Too many people are talking to me right now, try again in a moment"
     except Exception as e:
         return f"```css\n[ ⚠️ خطأ تقني ]\n```حدث خطأ: `{str(e)[:100]}`\nيرجى المحاولة مرة أخرى لاحقاً"
 
@@ -352,7 +713,7 @@ async def activate(ctx, *, code: str):
             "joined_at": datetime.now().isoformat(),
             "traits": {"curiosity": 50, "sensitivity": 50, "happiness": 50, "sadness": 20, "boldness": 50, "kindness": 50, "shyness": 20, "intelligence": 80}
         }
-        user_last_active[user_id_str] = datetime.now()
+        user_cache.touch(user_id_str, loaded=True)
         save_user_data(user_id_str)
 
         # إنشاء Embed للتفعيل الناجح
@@ -489,12 +850,14 @@ async def sex(ctx, mode: str = None):
 
         user_id_str = str(ctx.author.id)
         if not data.get("sex_mode"):
-            try:
-                user_conversation_history[user_id_str] = []
-            except Exception:
-                user_conversation_history[user_id_str] = []
-
-        save_user_data(user_id_str)
+            user_conversation_history[user_id_str] = []
+            conversation_log.clear(user_id_str)
+            user_memory.forget(user_id_str)
+            user_conversations.get(user_id_str, {}).pop("summary", None)
+            user_conversations.get(user_id_str, {}).pop("summary_until", None)
+            save_user_data(user_id_str, "user_conversations")
+
+        save_user_data(user_id_str, "user_data")
         await ctx.send(embed=embed)
     else:
         embed = discord.Embed(
@@ -1336,7 +1699,7 @@ async def daily_reward(ctx):
         user_progress[user_id_str] = {"level": 1, "xp": 0, "messages": 0}
     
     user_progress[user_id_str]["xp"] = user_progress[user_id_str].get("xp", 0) + total_xp
-    save_user_data(user_id_str)
+    save_user_data(user_id_str, "user_data", "user_progress")
     
     if lang == "ar":
         embed = discord.Embed(
@@ -1480,16 +1843,30 @@ async def reminder(ctx, time: str, *, message: str):
         if user_id_str not in user_reminders:
             user_reminders[user_id_str] = []
         
+        # تذكير متكرر: !reminder 08:00 daily رسالة
+        repeat = None
+        first_word, _, rest = message.partition(" ")
+        if first_word.lower() in REPEAT_WORDS and rest.strip():
+            repeat = REPEAT_WORDS[first_word.lower()]
+            message = rest.strip()
+        
+        tz_name = user_data[user_id_str].get("timezone")
+        due = next_occurrence(time, get_zone(tz_name), datetime.now(timezone.utc))
+        
         # إضافة التذكير
         reminder_data = {
             "time": time,
             "message": message,
             "created_at": datetime.now().isoformat(),
-            "id": len(user_reminders[user_id_str]) + 1
+            "id": max([r.get("id", 0) for r in user_reminders[user_id_str]] + [0]) + 1,
+            "due_at": due.isoformat(),
+            "repeat": repeat,
+            "tz": tz_name
         }
         
         user_reminders[user_id_str].append(reminder_data)
-        save_user_data(user_id_str)
+        reminder_scheduler.schedule(user_id_str, reminder_data)
+        save_user_data(user_id_str, "user_reminders")
         
         lang = user_data[user_id_str].get("language", "ar")
         
@@ -1503,7 +1880,7 @@ async def reminder(ctx, time: str, *, message: str):
             
             embed.add_field(
                 name="🕐 **الوقت**",
-                value=f"**`{time}`**",
+                value=f"**`{time}`**" + (" 🔁" if repeat else ""),
                 inline=True
             )
             
@@ -1537,7 +1914,7 @@ async def reminder(ctx, time: str, *, message: str):
             
             embed.add_field(
                 name="🕐 **Time**",
-                value=f"**`{time}`**",
+                value=f"**`{time}`**" + (" 🔁" if repeat else ""),
                 inline=True
             )
             
@@ -1704,8 +2081,13 @@ async def show_reminders(ctx):
             else:
                 time_text = f"منذ {time_diff.seconds // 60} دقيقة"
             
+            next_due = reminder_scheduler.next_due(user_id_str, reminder.get("id"))
+            if next_due is not None:
+                time_text += f" • الجاي: <t:{int(next_due.timestamp())}:R>"
+            repeat_mark = " 🔁" if reminder.get("repeat") else ""
+            
             embed.add_field(
-                name=f"⏰ **#{reminder.get('id', '?')} • {reminder.get('time', '??:??')}**",
+                name=f"⏰ **#{reminder.get('id', '?')} • {reminder.get('time', '??:??')}{repeat_mark}**",
                 value=f"""
                 ```{reminder.get('message', 'بدون رسالة')}```
                 **{time_text}**
@@ -1741,8 +2123,13 @@ async def show_reminders(ctx):
             else:
                 time_text = f"{time_diff.seconds // 60} minutes ago"
             
+            next_due = reminder_scheduler.next_due(user_id_str, reminder.get("id"))
+            if next_due is not None:
+                time_text += f" • Next: <t:{int(next_due.timestamp())}:R>"
+            repeat_mark = " 🔁" if reminder.get("repeat") else ""
+            
             embed.add_field(
-                name=f"⏰ **#{reminder.get('id', '?')} • {reminder.get('time', '??:??')}**",
+                name=f"⏰ **#{reminder.get('id', '?')} • {reminder.get('time', '??:??')}{repeat_mark}**",
                 value=f"""
                 ```{reminder.get('message', 'No message')}```
                 **{time_text}**
@@ -1761,6 +2148,84 @@ async def show_reminders(ctx):
     
     await ctx.send(embed=embed)
 
+@bot.command(name='timezone', aliases=['توقيت', 'tz'])
+async def timezone_cmd(ctx, zone_name: str = None):
+    if ctx.guild is not None:
+        return
+    
+    user_id_str = str(ctx.author.id)
+    if user_id_str not in user_data or not user_data[user_id_str].get("activated", False):
+        return
+    
+    lang = user_data[user_id_str].get("language", "ar")
+    
+    if zone_name is None:
+        current = user_data[user_id_str].get("timezone") or DEFAULT_TIMEZONE or "server"
+        if lang == "ar":
+            embed = discord.Embed(
+                title="🌍 **المنطقة الزمنية**",
+                description=f"**منطقتك الحالية:** `{current}`",
+                color=discord.Color.blue()
+            )
+            embed.add_field(
+                name="💡 **التغيير**",
+                value="```!timezone Africa/Cairo```",
+                inline=False
+            )
+        else:
+            embed = discord.Embed(
+                title="🌍 **Timezone**",
+                description=f"**Your current timezone:** `{current}`",
+                color=discord.Color.blue()
+            )
+            embed.add_field(
+                name="💡 **Change it**",
+                value="```!timezone Europe/London```",
+                inline=False
+            )
+        await ctx.send(embed=embed)
+        return
+    
+    if get_zone(zone_name) is None:
+        if lang == "ar":
+            embed = discord.Embed(
+                title="⚠️ **منطقة غير معروفة**",
+                description=f"**`{zone_name}` مش منطقة زمنية صحيحة**\nمثال: `Africa/Cairo` أو `Asia/Riyadh`",
+                color=discord.Color.red()
+            )
+        else:
+            embed = discord.Embed(
+                title="⚠️ **Unknown Timezone**",
+                description=f"**`{zone_name}` is not a valid timezone**\nExample: `Europe/London` or `America/New_York`",
+                color=discord.Color.red()
+            )
+        await ctx.send(embed=embed)
+        return
+    
+    user_data[user_id_str]["timezone"] = zone_name
+    
+    # التذكيرات بتترن على الساعة المكتوبة في المنطقة الجديدة
+    now = datetime.now(timezone.utc)
+    for item in user_reminders.get(user_id_str, []):
+        item["tz"] = zone_name
+        item["due_at"] = next_occurrence(item.get("time", "00:00"), get_zone(zone_name), now).isoformat()
+        reminder_scheduler.schedule(user_id_str, item)
+    save_user_data(user_id_str, "user_data", "user_reminders")
+    
+    if lang == "ar":
+        embed = discord.Embed(
+            title="✅ **تم تغيير المنطقة الزمنية**",
+            description=f"**المنطقة الجديدة:** `{zone_name}`",
+            color=discord.Color.green()
+        )
+    else:
+        embed = discord.Embed(
+            title="✅ **Timezone Updated**",
+            description=f"**New timezone:** `{zone_name}`",
+            color=discord.Color.green()
+        )
+    await ctx.send(embed=embed)
+
 @bot.command(aliases=['مسح_شات', 'clearchat'])
 async def clear_chat(ctx, limit: int = 50):
     if ctx.guild is not None:
@@ -1958,15 +2423,19 @@ async def format_user(ctx):
         response = await bot.wait_for('message', timeout=30.0, check=check)
         
         if response.content.lower() in ["نعم", "yes", "y", "✅"]:
-            # حذف البيانات
-            user_data.pop(user_id_str, None)
-            user_progress.pop(user_id_str, None)
-            user_reminders.pop(user_id_str, None)
-            user_conversation_history.pop(user_id_str, None)
-
-            file_path = os.path.join(DATA_DIR, f"{user_id_str}.json")
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # حذف البيانات (بعد ما أي رد شغال يخلص)
+            async with user_locks.hold(user_id_str):
+                # الملخص اللي شغال ميرجعش يكتب الملف بعد ما اتمسح
+                summarizer.cancel(user_id_str)
+                _unload_user(user_id_str)
+                await user_writer.forget(user_id_str)
+                reminder_scheduler.cancel_user(user_id_str)
+                inactivity_notifier.cancel(user_id_str)
+                dm_dispatcher.forget(user_id_str)
+                await conversation_log.forget(user_id_str)
+                user_cache.forget(user_id_str)
+                summary_index.remove(user_id_str)
+                storage.delete_user(user_id_str)
             
             if lang == "ar":
                 embed = discord.Embed(
@@ -2041,16 +2510,16 @@ async def leaderboard(ctx, page: int = 1):
     if ctx.guild is not None:
         return
     
-    # جمع بيانات جميع المستخدمين
+    # جمع بيانات جميع المستخدمين (من الفهرس، من غير تحميل كل مستخدم)
     leaderboard_data = []
-    for user_id, progress in user_progress.items():
-        if user_data.get(user_id, {}).get("activated", False):
+    for user_id, summary in summary_index.items():
+        if summary.get("activated", False):
             leaderboard_data.append({
                 "user_id": user_id,
-                "level": progress.get("level", 1),
-                "xp": progress.get("xp", 0),
-                "messages": progress.get("messages", 0),
-                "user_name": user_data.get(user_id, {}).get("user_name", f"User{user_id[-4:]}")
+                "level": summary.get("level", 1),
+                "xp": summary.get("xp", 0),
+                "messages": summary.get("messages", 0),
+                "user_name": summary.get("user_name") or f"User{user_id[-4:]}"
             })
     
     # ترتيب حسب المستوى ثم XP
@@ -2208,19 +2677,23 @@ async def leaderboard(ctx, page: int = 1):
 async def bot_stats(ctx):
     """إحصائيات البوت (للمالك فقط)"""
     try:
-        total_users = len([uid for uid, data in user_data.items() if data.get("activated", False)])
-        active_today = len([uid for uid, data in user_data.items() 
-                           if data.get("activated", False) and 
-                           datetime.fromisoformat(data.get("joined_at", "2023-01-01")).date() == datetime.now().date()])
-        
-        total_messages = sum([p.get("messages", 0) for p in user_progress.values()])
+        summaries = [summary for _, summary in summary_index.items()]
+        today = datetime.now().date().isoformat()
+        total_users = len([s for s in summaries if s.get("activated", False)])
+        active_today = len([s for s in summaries
+                           if s.get("activated", False) and
+                           (s.get("joined_at") or "2023-01-01")[:10] == today])
+        
+        total_messages = sum([s.get("messages", 0) for s in summaries])
         uptime = datetime.now() - bot_start_time
         
         # تحليل الذاكرة
         memory_info = ""
-        memory_info += f"• المستخدمون: {len(user_data)}\n"
-        memory_info += f"• المحادثات: {sum([len(h) for h in user_conversation_history.values()])}\n"
-        memory_info += f"• الملفات: {len([f for f in os.listdir(DATA_DIR) if f.endswith('.json')]) if os.path.exists(DATA_DIR) else 0}"
+        memory_info += f"• المستخدمون: {len(user_data)} محمل من {len(summaries)} • ~{user_cache.total_bytes // 1024}KB\n"
+        memory_info += f"• الكاش: {user_cache.stats['loads']} تحميل • {user_cache.stats['evictions']} تفريغ\n"
+        memory_info += f"• المحادثات: {sum([len(h) for h in user_conversation_history.values()])} في الذاكرة • {conversation_log.stats['appended']} مضافة • {conversation_log.stats['compactions']} ضغط\n"
+        memory_info += f"• المخزن ({storage.name}): {storage.count_users()}\n"
+        memory_info += f"• الحفظ: {user_writer.stats['flushed']} كتابة • {user_writer.stats['coalesced']} مدمجة • {len(user_writer.dirty)} مستنية"
         
         embed = discord.Embed(
             title="📊 **إحصائيات البوت**",
@@ -2259,11 +2732,70 @@ async def bot_stats(ctx):
             inline=False
         )
         
+        reloads = watch_stats["reloads"]
+        avg_reload_ms = watch_stats["total_reload_ms"] / reloads if reloads else 0
+        embed.add_field(
+            name="🔄 **مراقبة التحديثات**",
+            value=f"""
+            ```css
+            [👁️] الوضع: {watch_stats['mode'] or '-'}
+            [📂] ملفات اتفحصت: {watch_stats['files_scanned']}
+            [♻️] إعادة تحميل: {reloads}
+            [⏱️] التأخير: آخر {watch_stats['last_reload_ms']:.0f}ms • متوسط {avg_reload_ms:.0f}ms • أقصى {watch_stats['max_reload_ms']:.0f}ms
+            ```
+            """,
+            inline=False
+        )
+        
+        prompt_total = usage_stats["prompt_tokens"]
+        cache_hit = usage_stats["cached_tokens"] / prompt_total * 100 if prompt_total else 0
+        saved = cache_hit * (1 - CACHED_TOKEN_PRICE)
+        embed.add_field(
+            name="🧾 **الـ Tokens**",
+            value=f"""
+            ```css
+            [📥] prompt: {prompt_total} • من الكاش: {usage_stats['cached_tokens']} ({cache_hit:.1f}%)
+            [📤] الردود: {usage_stats['completion_tokens']} • طلبات: {usage_stats['requests']}
+            [💰] توفير تقريبي في الـ prompt: {saved:.1f}% • الترتيب: {PROMPT_LAYOUT}
+            ```
+            """,
+            inline=False
+        )
+        
+        pool_stats = llm_pool.stats
+        embed.add_field(
+            name="🤖 **طلبات الذكاء الاصطناعي**",
+            value=f"""
+            ```css
+            [⚙️] شغالة: {llm_pool.active}/{llm_pool.max_concurrency} • مستنية: {llm_pool.queued()}
+            [📨] طلبات: {pool_stats['requests']} • إعادة: {pool_stats['retries']} • 429: {pool_stats['rate_limited']} • 5xx: {pool_stats['server_errors']}
+            [❌] فشلت: {pool_stats['failures']} • اترفضت: {pool_stats['rejected']} • أقصى انتظار {pool_stats['max_wait_ms']:.0f}ms
+            ```
+            """,
+            inline=False
+        )
+        
+        reminder_stats = reminder_scheduler.stats
+        embed.add_field(
+            name="⏰ **التذكيرات**",
+            value=f"""
+            ```css
+            [📌] مجدولة: {len(reminder_scheduler.entries)}
+            [🔔] اتبعتت: {reminder_stats['fired']} • متأخرة: {reminder_stats['late']} • أقصى تأخير {reminder_stats['max_late_s']:.0f}s
+            [💭] رسائل الغياب: مستنية {len(inactivity_notifier.due)} • اتبعتت {inactivity_notifier.stats['sent']} • فشلت {inactivity_notifier.stats['failed']}
+            [📬] طابور الخاص: {len(dm_dispatcher.queue)} مستنية • {dm_dispatcher.stats['sent']} اتبعتت • {dm_dispatcher.stats['failed']} فشلت • REST {dm_dispatcher.stats['rest_lookups']}
+            ```
+            """,
+            inline=False
+        )
+        
         embed.add_field(
             name="📈 **الأداء**",
             value=f"""
             ```css
             [⚡] البوت: {'🟢 Online' if bot.is_ready() else '🔴 Offline'}
+            [🐢] تأخير الـ loop: آخر {loop_lag.last * 1000:.0f}ms • أقصى {loop_lag.max * 1000:.0f}ms
+            [🧩] worker {WORKER_INDEX + 1}/{WORKER_COUNT} • shards: {sorted(bot.shards) if SHARD_OPTIONS else '-'}
             [🔧] المهام: {len(bot.cogs)} مهمة نشطة
             [💬] القنوات: {len(bot.guilds)} سيرفر
             ```
@@ -2292,81 +2824,78 @@ async def bot_stats(ctx):
         )
         await ctx.send(embed=embed)
 
+# رسائل "انت رحت فين؟" في heap حسب ميعاد كل مستخدم، والحالة بتتحفظ مع user_progress
+inactivity_notifier = InactivityNotifier()
+
+INACTIVE_MESSAGES = {
+    "ar": [
+        "💭 **انت رحت فين؟** أنتظر ردك!",
+        "😢 **انت زعلت مني ولا حاجه؟** ما تتغيبش عليا!",
+        "✨ **فينك كل ده؟** اشتقتلك!",
+        "🎭 **كارف وا كدا يعني؟** تعال كلمني!",
+        "💔 **زهقت مني ولا ايه؟** ما تسيبنيش!"
+    ],
+    "en": [
+        "💭 **Where did you go?** Waiting for your reply!",
+        "😢 **Are you upset with me?** Don't disappear on me!",
+        "✨ **Where have you been?** I miss you!",
+        "🎭 **Ignoring me like that?** Come talk to me!",
+        "💔 **Getting tired of me?** Don't leave me!"
+    ],
+}
+
+async def notify_inactive_user(user_id_str):
+    ensure_user_loaded(user_id_str, create=False)
+    data = user_data.get(user_id_str)
+    progress = user_progress.get(user_id_str)
+    if not data or not data.get("activated") or progress is None:
+        return None
+    state = progress.get("inactivity") or {}
+    if state.get("nudged") or state.get("busy"):
+        return None
+    lang = data.get("language", "ar")
+    message = random.choice(INACTIVE_MESSAGES["ar" if lang == "ar" else "en"])
+    if not await dm_dispatcher.send(user_id_str, f"```css\n[ ⏰ إشعار ]\n```{message}"):
+        return False
+    # dict جديد: الحالة ممكن متكونش متسجلة في progress أصلاً
+    progress["inactivity"] = dict(state, nudged=True)
+    save_user_data(user_id_str, "user_progress")
+    return True
+
 async def check_inactive_users():
     await bot.wait_until_ready()
-    while not bot.is_closed():
-        try:
-            now = datetime.now()
-            for user_id_str, last_active in list(user_last_active.items()):
-                if user_id_str in user_data and user_data[user_id_str].get("activated"):
-                    inactive_time = (now - last_active).total_seconds()
-                    if inactive_time > 120 and user_id_str not in notified_users:
-                        user_convo = user_conversation_history.get(user_id_str, [])
-                        if user_convo:
-                            last_user_msg = ""
-                            for msg in reversed(user_convo):
-                                if isinstance(msg, dict) and msg.get("role") == "user":
-                                    last_user_msg = msg.get("content", "").lower()
-                                    break
-                            busy_keywords = ["نوم", "نام", "هنام", "هريح", "مشغول", "شغل", "تعبت", "تعبان", "دور", "هروح"]
-                            english_busy = ["sleep", "sleeping", "tired", "busy", "work", "rest", "go", "leave", "bed"]
-                            lang = user_data[user_id_str].get("language", "ar")
-                            keywords = busy_keywords if lang == "ar" else english_busy
-                            should_notify = not any(keyword in last_user_msg for keyword in keywords)
-                            if should_notify:
-                                try:
-                                    user = await bot.fetch_user(int(user_id_str))
-                                    if lang == "ar":
-                                        messages = [
-                                            "💭 **انت رحت فين؟** أنتظر ردك!",
-                                            "😢 **انت زعلت مني ولا حاجه؟** ما تتغيبش عليا!",
-                                            "✨ **فينك كل ده؟** اشتقتلك!",
-                                            "🎭 **كارف وا كدا يعني؟** تعال كلمني!",
-                                            "💔 **زهقت مني ولا ايه؟** ما تسيبنيش!"
-                                        ]
-                                    else:
-                                        messages = [
-                                            "💭 **Where did you go?** Waiting for your reply!",
-                                            "😢 **Are you upset with me?** Don't disappear on me!",
-                                            "✨ **Where have you been?** I miss you!",
-                                            "🎭 **Ignoring me like that?** Come talk to me!",
-                                            "💔 **Getting tired of me?** Don't leave me!"
-                                        ]
-                                    
-                                    message = random.choice(messages)
-                                    
-                                    await user.send(f"```css\n[ ⏰ إشعار ]\n```{message}")
-                                    notified_users.add(user_id_str)
-                                except:
-                                    pass
-        except:
-            pass
-        await asyncio.sleep(60)
+    await inactivity_notifier.run(notify_inactive_user)
+
+# التذكيرات في heap حسب الميعاد، والمهمة بتنام لحد أقرب تذكير
+reminder_scheduler = ReminderScheduler()
+
+async def fire_reminder(user_id_str, reminder_id, late):
+    ensure_user_loaded(user_id_str, create=False)
+    reminders = user_reminders.get(user_id_str, [])
+    reminder = next((r for r in reminders if r.get("id") == reminder_id), None)
+    if reminder is None:
+        return
+
+    lang = user_data.get(user_id_str, {}).get("language", "ar")
+    late_note = ""
+    if late > 60:
+        late_note = f"\n*(متأخر {int(late // 60)} دقيقة)*" if lang == "ar" else f"\n*({int(late // 60)} min late)*"
+    # الطابور بيبعت بالدور، فدقيقة فيها تذكيرات كتير مش بتوقف الجدولة
+    if lang == "ar":
+        dm_dispatcher.send(user_id_str, f"```css\n[ ⏰ تذكير ]\n```**{reminder.get('message', 'بدون رسالة')}**{late_note}")
+    else:
+        dm_dispatcher.send(user_id_str, f"```css\n[ ⏰ Reminder ]\n```**{reminder.get('message', 'No message')}**{late_note}")
+
+    if reminder.get("repeat") == "daily":
+        reminder["due_at"] = next_occurrence(reminder["time"], get_zone(reminder.get("tz")), datetime.now(timezone.utc)).isoformat()
+        reminder_scheduler.schedule(user_id_str, reminder)
+    else:
+        reminders.remove(reminder)
+    save_user_data(user_id_str, "user_reminders")
 
 async def check_reminders_task():
     await bot.wait_until_ready()
-    while not bot.is_closed():
-        try:
-            now = datetime.now().strftime("%H:%M")
-            for user_id_str, reminders in list(user_reminders.items()):
-                for reminder in reminders[:]:
-                    if reminder.get("time") == now:
-                        try:
-                            user = await bot.fetch_user(int(user_id_str))
-                            lang = user_data.get(user_id_str, {}).get("language", "ar")
-                            
-                            if lang == "ar":
-                                await user.send(f"```css\n[ ⏰ تذكير ]\n```**{reminder.get('message', 'بدون رسالة')}**")
-                            else:
-                                await user.send(f"```css\n[ ⏰ Reminder ]\n```**{reminder.get('message', 'No message')}**")
-                            
-                            reminders.remove(reminder)
-                            save_user_data(user_id_str)
-                        except:
-                            pass
-            await asyncio.sleep(60)
-        except:
-            await asyncio.sleep(60)
+    await reminder_scheduler.run(fire_reminder)
 
 @bot.event
 async def on_message(message):
@@ -2379,69 +2908,91 @@ async def on_message(message):
         await bot.invoke(ctx)
         return
 
-    # رسائل الخاص (DM)
+    # رسائل الخاص (DM): بتتجمع لو المستخدم بعت كذا رسالة ورا بعض
     if message.guild is None:
+        DM_MESSAGES.inc()
         uid = str(message.author.id)
+        ensure_user_loaded(uid)
+        dm_dispatcher.remember(uid, message.channel.id)
+        data = user_data.get(uid, {})
+        chatting = data.get("activated") and data.get("state", "normal") == "normal"
+        # خطوات الإعداد كل رسالة ليها رد لوحدها
+        message_coalescer.submit(uid, message, immediate=not chatting)
+        return
 
-        if uid not in user_data:
-            load_single_user(uid)
-
-        user_last_active[uid] = datetime.now()
-        if uid in notified_users:
-            notified_users.discard(uid)
-
-        reply = await get_ai_response(message.content, message.author.id)
+    # الرسائل في السيرفرات: تعامل مع الأوامر فقط
+    await bot.process_commands(message)
 
-        # التعامل مع الردود العادية (بدون Embeds)
-        if isinstance(reply, (list, tuple)):
-            for r in reply:
-                if r:
-                    await message.channel.send(r)
-                    await asyncio.sleep(0.12)
-        else:
-            if reply:
-                await message.channel.send(reply)
-            
-        # تحديث XP والمستوى
-        if uid in user_progress:
-            user_progress[uid]["messages"] = user_progress[uid].get("messages", 0) + 1
-            user_progress[uid]["xp"] = user_progress[uid].get("xp", 0) + random.randint(2, 8)
-            
-            # تحقق من الترقية
-            current_level = user_progress[uid].get("level", 1)
-            xp_needed = current_level * 100
-            if user_progress[uid]["xp"] >= xp_needed:
-                user_progress[uid]["level"] = current_level + 1
-                user_progress[uid]["xp"] = 0
-                
-                # إرسال رسالة ترقية
-                lang = user_data.get(uid, {}).get("language", "ar")
-                if lang == "ar":
-                    await message.channel.send(f"```css\n[ 🎉 تهانينا! ]\n```**لقد ارتقيت إلى المستوى {current_level + 1}!** ⭐")
-                else:
-                    await message.channel.send(f"```css\n[ 🎉 Congratulations! ]\n```**You leveled up to Level {current_level + 1}!** ⭐")
+async def handle_direct_message(uid, messages):
+    """
+    رد واحد على رسالة خاصة أو أكتر ورا بعض وحدث الخبرة.
+    الـ lock بتاع المستخدم ممسوك طول الرد، فإعادة التحميل من الموقع أو الفرمتة بيستنوا يخلص.
+    """
+    with user_cache.pinned(uid):
+        async with user_locks.hold(uid):
+            with DM_REPLY_SECONDS.time():
+                await _reply_to_messages(uid, messages)
+
+async def _reply_to_messages(uid, messages):
+    ensure_user_loaded(uid)
+    message = messages[-1]
+
+    content = "\n".join(m.content for m in messages if m.content)
+    if uid in user_progress and user_data.get(uid, {}).get("activated"):
+        # بيتحفظ مع user_progress آخر الرد، وآخر رسالة متخزنة فمش محتاجين ندور في المحادثة
+        user_progress[uid]["inactivity"] = inactivity_notifier.activity(uid, content, user_data[uid].get("language", "ar"))
+    reply = None
+    with message_coalescer.generating(uid):
+        reply = await get_ai_response(content, message.author.id, stream_to=message.channel)
+
+    # التعامل مع الردود العادية (بدون Embeds)
+    if isinstance(reply, (list, tuple)):
+        for r in reply:
+            if r:
+                await send_timed(message.channel, r)
+                await asyncio.sleep(0.12)
+    else:
+        if reply:
+            await send_timed(message.channel, reply)
+        
+    # تحديث XP والمستوى
+    if uid in user_progress:
+        user_progress[uid]["messages"] = user_progress[uid].get("messages", 0) + len(messages)
+        user_progress[uid]["xp"] = user_progress[uid].get("xp", 0) + sum(random.randint(2, 8) for _ in messages)
+        
+        # تحقق من الترقية
+        current_level = user_progress[uid].get("level", 1)
+        xp_needed = current_level * 100
+        if user_progress[uid]["xp"] >= xp_needed:
+            user_progress[uid]["level"] = current_level + 1
+            user_progress[uid]["xp"] = 0
             
-            save_user_data(uid)
+            # إرسال رسالة ترقية
+            lang = user_data.get(uid, {}).get("language", "ar")
+            if lang == "ar":
+                await send_timed(message.channel, f"```css\n[ 🎉 تهانينا! ]\n```**لقد ارتقيت إلى المستوى {current_level + 1}!** ⭐")
+            else:
+                await send_timed(message.channel, f"```css\n[ 🎉 Congratulations! ]\n```**You leveled up to Level {current_level + 1}!** ⭐")
         
-        return
+        save_user_data(uid, "user_progress")
 
-    # الرسائل في السيرفرات: تعامل مع الأوامر فقط
-    await bot.process_commands(message)
+# الرسائل السريعة ورا بعض بتتجمع في رد واحد، والرد القديم بيتلغي لو جت رسالة أحدث
+message_coalescer = MessageCoalescer(handle_direct_message)
+# lock لكل مستخدم حوالين أي تغيير في حالته بيعدي على await
+user_locks = UserLocks()
 
 @bot.event
 async def on_disconnect():
-    save_data()
+    await user_writer.flush()
+    await conversation_log.flush()
+    # الـ worker ممكن يقفل قبل الدورة الجاية بتاعة evict_idle_users
+    await save_summary_index()
 
 def load_single_user(user_id):
-    file_path = os.path.join(DATA_DIR, f"{user_id}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            user_data[user_id] = data.get("user_data", {})
-            user_progress[user_id] = data.get("user_progress", {})
-            user_reminders[user_id] = data.get("user_reminders", {})
-            user_conversation_history[user_id] = data.get("user_conversation_history", [])
-            file_last_modified[user_id] = os.path.getmtime(file_path)
+    version = storage.user_version(user_id)
+    data = storage.load_user(user_id) if version is not None else None
+    if data is not None:
+        _apply_user_document(user_id, data, version)
     else:
         user_data[user_id] = {
             "activated": False,
@@ -2460,40 +3011,81 @@ def load_single_user(user_id):
         save_user_data(user_id)
     return True
 
+async def update_status():
+    while True:
+        await bot.change_presence(activity=discord.Streaming(
+            name="Sienna AI This Frist", 
+            url="https://twitch.tv/discord"
+        ))
+        await asyncio.sleep(15)
+        
+        await bot.change_presence(activity=discord.Activity(
+            type=discord.ActivityType.listening, 
+            name="!ask for help"
+        ))
+        await asyncio.sleep(15)
+        
+        await bot.change_presence(activity=discord.Activity(
+            type=discord.ActivityType.watching, 
+            name="120 Servers"
+        ))
+        await asyncio.sleep(15)
+
+background_started = False
+
 @bot.event
 async def on_ready():
-    print(f'Logged in as {bot.user}')
-    
-    async def update_status():
-        while True:
-            await bot.change_presence(activity=discord.Streaming(
-                name="Sienna AI This Frist", 
-                url="https://twitch.tv/discord"
-            ))
-            await asyncio.sleep(15)
-            
-            await bot.change_presence(activity=discord.Activity(
-                type=discord.ActivityType.listening, 
-                name="!ask for help"
-            ))
-            await asyncio.sleep(15)
-            
-            await bot.change_presence(activity=discord.Activity(
-                type=discord.ActivityType.watching, 
-                name="120 Servers"
-            ))
-            await asyncio.sleep(15)
-    
-    # Start the status update loop
+    # on_ready بتتنده تاني بعد كل reconnect، فنشغل المهام مرة واحدة بس
+    global background_started
+    print(f"✨ **البوت شغال** دلوقتي كـ {bot.user}")
+    if background_started:
+        return
+    background_started = True
+
+    count = await asyncio.to_thread(summary_index.load_or_rebuild, storage)
+    print(f"✅ فهرس المستخدمين جاهز: {count} مستخدم")
+    bot.loop.create_task(watch_files())
+    bot.loop.create_task(evict_idle_users())
+    if OWNS_DMS:
+        # الخاص كله على shard 0: التذكيرات ورسائل الغياب في worker واحد بس عشان متتبعتش مرتين
+        scheduled = reminder_scheduler.rebuild((uid, s.get("reminders")) for uid, s in summary_index.items())
+        print(f"⏰ تم جدولة {scheduled} تذكير")
+        waiting = inactivity_notifier.rebuild((uid, s.get("inactivity")) for uid, s in summary_index.items())
+        print(f"💭 {waiting} مستخدم مستني رسالة غياب")
+        bot.loop.create_task(check_inactive_users())
+        bot.loop.create_task(check_reminders_task())
     bot.loop.create_task(update_status())
+    bot.loop.create_task(loop_lag.run())
+    # كل worker على بورت لوحده
+    await serve_metrics(port=METRICS_PORT + WORKER_INDEX if METRICS_PORT else 0)
+
+@bot.before_invoke
+async def load_invoker(ctx):
+    # الأوامر بتقرا user_data[...] مباشرة، فنحمل صاحب الأمر الأول
+    ctx.started_at = time.perf_counter()
+    ensure_user_loaded(ctx.author.id, create=False)
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    # بتتنده حتى لو الأمر فشل
+    started = getattr(ctx, "started_at", None)
+    if started is not None and ctx.command is not None:
+        COMMAND_SECONDS.observe(time.perf_counter() - started, command=ctx.command.qualified_name,
+                                outcome="error" if ctx.command_failed else "ok")
 
 if __name__ == "__main__":
     if DISCORD_TOKEN:
-        bot.run(DISCORD_TOKEN)
+        try:
+            bot.run(DISCORD_TOKEN)
+        finally:
+            # أي حفظ لسه مستني يتكتب قبل ما البروسيس يقفل
+            user_writer.flush_sync()
+            conversation_log.flush_sync()
+            # بعد الحفظ عشان الفهرس يبقى فيه آخر تغييرات (التذكيرات وحالة الغياب لما start.sh يعيد التشغيل)
+            summary_index.save()
     else:
         print("❌ Cannot start bot: DISCORD_TOKEN not provided.")
         print("ℹ️ Web server will still run. Configure DISCORD_TOKEN in Railway variables.")
         # Keep the process alive so Railway doesn't restart
-        import time
         while True:
             time.sleep(60)
\ No newline at end of file
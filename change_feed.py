@@ -0,0 +1,97 @@
+import os
+import time
+
+# مجلد تخزين بيانات المستخدمين (نفس المجلد اللي بيستخدمه bot.py و main.py)
+DATA_DIR = "users_data"
+
+# طابور التغييرات: سطر لكل حفظ "<user_id> <timestamp> <source>"
+CHANGES_FILE = os.path.join(DATA_DIR, ".changes.log")
+MAX_CHANGES_BYTES = 1024 * 1024
+# source: الموقع، أو worker<N> لما البوت شغال بأكتر من worker (أسطر قديمة من غيره = الموقع)
+WEB_SOURCE = "web"
+
+
+def notify_change(user_id, source=WEB_SOURCE):
+    """
+    سجل إن ملف المستخدم اتغير من برا البوت (الموقع، أو worker تاني).
+    الكتابة append لسطر صغير فبتبقى آمنة حتى مع أكتر من worker.
+    """
+    try:
+        if not os.path.exists(DATA_DIR):
+            os.makedirs(DATA_DIR)
+        if os.path.exists(CHANGES_FILE) and os.path.getsize(CHANGES_FILE) > MAX_CHANGES_BYTES:
+            os.replace(CHANGES_FILE, CHANGES_FILE + ".1")
+        with open(CHANGES_FILE, "a", encoding="utf-8") as f:
+            f.write(f"{user_id} {time.time():.3f} {source}\n")
+    except Exception as e:
+        print(f"❌ خطأ في تسجيل تغيير المستخدم {user_id}: {e}")
+
+
+class ChangeQueueReader:
+    """
+    بيقرا الأسطر الجديدة بس من طابور التغييرات (من آخر offset)،
+    فتكلفة كل قراءة على قد عدد التغييرات مش على قد عدد المستخدمين.
+    """
+
+    def __init__(self, path=CHANGES_FILE):
+        self.path = path
+        self.offset = None
+        self.inode = None
+
+    def _read_from(self, path, offset):
+        with open(path, "rb") as f:
+            f.seek(offset)
+            chunk = f.read()
+        # نقرا الأسطر الكاملة بس، والسطر الناقص يتقري المرة الجاية
+        end = chunk.rfind(b"\n") + 1
+        return chunk[:end], offset + end
+
+    def read_changes(self):
+        """رجع [(user_id, وقت_التغيير, source), ...] من آخر قراءة."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.offset, self.inode = 0, None
+            return []
+
+        # أول قراءة: نبدأ من آخر الملف، التغييرات القديمة اتحملت مع load_data
+        if self.offset is None:
+            self.offset, self.inode = st.st_size, st.st_ino
+            return []
+
+        data = b""
+        if self.inode is not None and st.st_ino != self.inode:
+            # الملف اتعمله rotate: كمل اللي فاضل في النسخة القديمة وابدأ الجديدة من الأول
+            try:
+                old = self.path + ".1"
+                if os.stat(old).st_ino == self.inode:
+                    data, _ = self._read_from(old, self.offset)
+            except (FileNotFoundError, OSError):
+                pass
+            self.offset = 0
+        elif st.st_size < self.offset:
+            self.offset = 0
+        self.inode = st.st_ino
+
+        if st.st_size > self.offset:
+            chunk, self.offset = self._read_from(self.path, self.offset)
+            data += chunk
+
+        changes = {}
+        for line in data.decode("utf-8", errors="ignore").splitlines():
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                changed_at = float(parts[1]) if len(parts) > 1 else time.time()
+            except ValueError:
+                changed_at = time.time()
+            source = parts[2] if len(parts) > 2 else WEB_SOURCE
+            # لو المستخدم اتغير كذا مرة نحمله مرة واحدة بأقدم وقت، ولو أي مرة منهم من الموقع تتحسب من الموقع
+            previous = changes.get(parts[0])
+            if previous is not None:
+                changed_at = previous[0]
+                if previous[1] == WEB_SOURCE:
+                    source = WEB_SOURCE
+            changes[parts[0]] = (changed_at, source)
+        return [(user_id, changed_at, source) for user_id, (changed_at, source) in changes.items()]
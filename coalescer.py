@@ -0,0 +1,94 @@
+import os
+import time
+import asyncio
+from contextlib import contextmanager
+
+# الرسائل اللي بتوصل ورا بعض في الفترة دي بتتجمع في رد واحد
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "1.2"))
+# أقصى انتظار من أول رسالة مستنية (عشان اللي بيكتب على طول ياخد رد برضه)
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", "4"))
+
+
+class MessageCoalescer:
+    """
+    debounce لكل مستخدم: الرسائل بتتجمع لحد ما المستخدم يسكت window ثانية
+    وبعدين handler(user_id, messages) بيتنده مرة واحدة بيهم كلهم.
+    الـ handler لنفس المستخدم بيشتغل واحد ورا التاني عمره ما يتداخل،
+    ولو رسالة جديدة وصلت والرد لسه بيتولد (جوه generating) الرد القديم بيتلغي.
+    """
+
+    def __init__(self, handler, window=COALESCE_WINDOW, max_wait=COALESCE_MAX_WAIT):
+        self.handler = handler
+        self.window = window
+        self.max_wait = max_wait
+        self.pending = {}  # user_id -> (وقت أول رسالة، [الرسائل])
+        self.timers = {}
+        self.running = {}
+        self.generating_users = set()
+        self.superseded = set()
+        self.stats = {"messages": 0, "batches": 0, "cancelled": 0}
+
+    def submit(self, user_id, message, immediate=False):
+        """immediate=True: من غير استنا (خطوات الإعداد مثلاً) بس برضه بالدور."""
+        uid = str(user_id)
+        self.stats["messages"] += 1
+        first, messages = self.pending.setdefault(uid, (time.monotonic(), []))
+        messages.append(message)
+
+        task = self.running.get(uid)
+        if uid in self.generating_users and task is not None and not task.done():
+            # الرد اللي بيتولد بقى قديم: الرد الجاي هيشوف الكلام كله
+            self.superseded.add(uid)
+            task.cancel()
+            self.stats["cancelled"] += 1
+
+        timer = self.timers.get(uid)
+        if timer is not None:
+            timer.cancel()
+        delay = 0 if immediate else max(0.0, min(self.window, first + self.max_wait - time.monotonic()))
+        self.timers[uid] = asyncio.get_running_loop().create_task(self._dispatch_later(uid, delay))
+
+    async def _dispatch_later(self, uid, delay):
+        if delay:
+            await asyncio.sleep(delay)
+        task = self.running.get(uid)
+        if task is not None and not task.done():
+            # asyncio.wait مش بيلغي الـ task لو التايمر نفسه اتلغى
+            await asyncio.wait({task})
+        self.timers.pop(uid, None)
+        _, messages = self.pending.pop(uid, (None, []))
+        if not messages:
+            return
+        self.stats["batches"] += 1
+        task = asyncio.get_running_loop().create_task(self._run(uid, messages))
+        self.running[uid] = task
+
+    async def _run(self, uid, messages):
+        try:
+            await self.handler(uid, messages)
+        except Exception as e:
+            print(f"❌ خطأ في الرد على المستخدم {uid}: {e}")
+        finally:
+            if self.running.get(uid) is asyncio.current_task():
+                del self.running[uid]
+
+    @contextmanager
+    def generating(self, user_id):
+        """
+        الجزء اللي ينفع يتلغي لو رسالة أحدث وصلت (توليد الرد).
+        الإلغاء ده بيتبلع هنا والـ handler بيكمل عادي (الخبرة وغيره).
+        """
+        uid = str(user_id)
+        self.generating_users.add(uid)
+        try:
+            yield
+        except asyncio.CancelledError:
+            if uid not in self.superseded:
+                raise
+            self.superseded.discard(uid)
+            task = asyncio.current_task()
+            if hasattr(task, "uncancel"):
+                task.uncancel()
+        finally:
+            self.generating_users.discard(uid)
+            self.superseded.discard(uid)
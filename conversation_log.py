@@ -0,0 +1,154 @@
+import os
+import asyncio
+
+from metrics import registry
+
+# عدد الرسائل اللي بتفضل في الذاكرة لكل مستخدم (الباقي في السجل على الديسك)
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "30"))
+# أول ما سجل المستخدم يعدي HISTORY_MAX_TURNS بيتقص لآخر HISTORY_KEEP_TURNS
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "50"))
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "30"))
+
+DISK_WRITE_SECONDS = registry.histogram("sienna_bot_disk_write_seconds", "Time of one storage write")
+
+
+class ConversationLog:
+    """
+    سجل المحادثة append-only فوق الـ storage.
+    append/clear بيتحطوا في طابور على الـ event loop، وworker بيكتبهم بالترتيب من thread.
+    كتابة رسالة جديدة = append واحد مهما كان طول المحادثة، والـ compaction بيحصل
+    لكل مستخدم لوحده أول ما سجله يعدي الحد بدل مهمة يومية بتعيد كتابة الكل.
+    """
+
+    def __init__(self, storage, max_turns=HISTORY_MAX_TURNS, keep_turns=HISTORY_KEEP_TURNS):
+        self.storage = storage
+        self.max_turns = max_turns
+        self.keep_turns = keep_turns
+        self.ops = []  # (نوع العملية، المستخدم، الرسائل)
+        self.queued = {}  # المستخدم -> عدد عملياته في ops (عشان is_pending متلفش على الطابور)
+        self.in_flight = set()
+        self.stats = {"appended": 0, "compactions": 0, "errors": 0}
+        self._wakeup = None
+        self._idle = None
+        self._drained = None  # الطابور فاضي ومفيش كتابة شغالة
+        self._task = None
+
+    def append(self, user_id, turn):
+        uid = str(user_id)
+        if self.ops and self.ops[-1][0] == "append" and self.ops[-1][1] == uid:
+            self.ops[-1][2].append(turn)
+        else:
+            self._enqueue([("append", uid, [turn])])
+        self._kick()
+
+    def extend(self, user_id, turns):
+        for turn in turns:
+            self.append(user_id, turn)
+
+    def clear(self, user_id):
+        self._enqueue([("clear", str(user_id), None)])
+        self._kick()
+
+    def tail(self, user_id, n=HISTORY_WINDOW):
+        """آخر n رسالة من الديسك (بيتنده وقت تحميل المستخدم)."""
+        return self.storage.tail_turns(str(user_id), n)
+
+    def is_pending(self, user_id):
+        uid = str(user_id)
+        return uid in self.in_flight or uid in self.queued
+
+    def _enqueue(self, ops, front=False):
+        for op in ops:
+            self.queued[op[1]] = self.queued.get(op[1], 0) + 1
+        self.ops = ops + self.ops if front else self.ops + ops
+
+    def _take_all(self):
+        batch, self.ops = self.ops, []
+        for op in batch:
+            count = self.queued.get(op[1], 0) - 1
+            if count > 0:
+                self.queued[op[1]] = count
+            else:
+                self.queued.pop(op[1], None)
+        return batch
+
+    def _kick(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_sync()
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._drained = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        if self.ops:
+            self._drained.clear()
+        self._wakeup.set()
+
+    def _apply(self, batch):
+        """بتشتغل في thread. بترجع العمليات اللي مخلصتش عشان تتعاد."""
+        for i, (op, uid, turns) in enumerate(batch):
+            try:
+                if op == "append":
+                    with DISK_WRITE_SECONDS.time(kind="history_append"):
+                        count = self.storage.append_turns(uid, turns)
+                    self.stats["appended"] += len(turns)
+                    if count > self.max_turns:
+                        with DISK_WRITE_SECONDS.time(kind="history_compact"):
+                            self.storage.compact_history(uid, self.keep_turns)
+                        self.stats["compactions"] += 1
+                else:
+                    with DISK_WRITE_SECONDS.time(kind="history_clear"):
+                        self.storage.clear_history(uid)
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"❌ خطأ في سجل محادثة المستخدم {uid}: {e}")
+                return batch[i:]
+        return []
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.ops:
+                await self._write_batch()
+            self._drained.set()
+
+    async def _write_batch(self):
+        batch = self._take_all()
+        self.in_flight = {op[1] for op in batch}
+        self._idle.clear()
+        try:
+            failed = await asyncio.to_thread(self._apply, batch)
+        finally:
+            self.in_flight = set()
+            self._idle.set()
+        if failed:
+            # نرجعهم قدام عشان الترتيب يفضل زي ما هو، ونستنى شوية قبل المحاولة
+            self._enqueue(failed, front=True)
+            await asyncio.sleep(1)
+
+    async def flush(self):
+        """
+        استنى الـ worker يكتب كل اللي في الطابور (on_disconnect). منكتبش batch من هنا،
+        عشان مفيش اتنين يكتبوا في سجل نفس المستخدم والـ index بتاعه في نفس الوقت.
+        """
+        if not self.ops and not self.in_flight:
+            return
+        self._kick()
+        await self._drained.wait()
+
+    def flush_sync(self):
+        batch = self._take_all()
+        self._enqueue(self._apply(batch), front=True)
+
+    async def forget(self, user_id):
+        """شيل أي عمليات مستنية للمستخدم واستنى الكتابة الجارية (قبل حذف بياناته)."""
+        uid = str(user_id)
+        self.ops = [op for op in self.ops if op[1] != uid]
+        self.queued.pop(uid, None)
+        while uid in self.in_flight:
+            await self._idle.wait()
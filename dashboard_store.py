@@ -0,0 +1,268 @@
+import os
+import copy
+import asyncio
+from collections import OrderedDict
+
+from change_feed import notify_change
+
+# عدد المستخدمين اللي إعداداتهم بتفضل في كاش الموقع
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "2048"))
+
+# اللوحة محتاجة الإعدادات وعدد الرسائل بس (SQLite بيقرا الجداول دي بس، وJSON بيقرا الملف كله)
+PROJECTION_SECTIONS = ("user_data", "user_progress")
+
+TRAITS = ("curiosity", "sensitivity", "happiness", "sadness", "boldness", "kindness", "shyness", "intelligence")
+LANGUAGES = ("ar", "en")
+# القوالب الجاهزة في dashboard_script.js: مينفعش تتحفظ كقالب خاص
+LOCKED_PRESETS = {"sienna", "roxy", "laila", "maya", "sarah", "luna", "raven", "zara", "ivy", "cleo"}
+BOT_NAME_MAX = 32
+# مفاتيح user_data اللي الموقع بيكتبها (/save و/api/v1)، والباقي بيعدله البوت بس
+SITE_KEYS = ("bot_name", "language", "sex_mode", "notifications", "traits", "custom_presets")
+MAX_PRESETS = 50
+# البوت كتب المستخدم بين القراية والكتابة: نقرا تاني ونعيد التعديل كام مرة
+SAVE_ATTEMPTS = 10
+
+
+def project(doc):
+    """الجزء اللي اللوحة بتعرضه من مستند المستخدم."""
+    return {
+        "user_data": doc.get("user_data") or {},
+        "messages": (doc.get("user_progress") or {}).get("messages", 0),
+    }
+
+
+def _trait(name, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} لازم يكون رقم")
+    value = int(value)
+    if not 0 <= value <= 100:
+        raise ValueError(f"{name} لازم يكون من 0 لـ 100")
+    return value
+
+
+def _name(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("الاسم فاضي")
+    value = value.strip()
+    if len(value) > BOT_NAME_MAX:
+        raise ValueError(f"الاسم أطول من {BOT_NAME_MAX} حرف")
+    return value
+
+
+def clean_patch(body):
+    """
+    PATCH الإعدادات من /api/v1/settings بعد التحقق: bot_name, language (أو lang),
+    sex_mode, notifications, وtraits جزئية. بترمي ValueError لو فيه حاجة غلط.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("المتوقع JSON object")
+    body = dict(body)
+    if "lang" in body:
+        body.setdefault("language", body.pop("lang"))
+    unknown = set(body) - {"bot_name", "language", "sex_mode", "notifications", "traits"}
+    if unknown:
+        raise ValueError(f"حقول مش معروفة: {', '.join(sorted(unknown))}")
+    patch = {}
+    if "bot_name" in body:
+        patch["bot_name"] = _name(body["bot_name"])
+    if "language" in body:
+        if body["language"] not in LANGUAGES:
+            raise ValueError("language لازم تكون ar أو en")
+        patch["language"] = body["language"]
+    for key in ("sex_mode", "notifications"):
+        if key in body:
+            if not isinstance(body[key], bool):
+                raise ValueError(f"{key} لازم يكون true أو false")
+            patch[key] = body[key]
+    if "traits" in body:
+        traits = body["traits"]
+        if not isinstance(traits, dict) or set(traits) - set(TRAITS):
+            raise ValueError(f"traits المسموحة: {', '.join(TRAITS)}")
+        patch["traits"] = {name: _trait(name, value) for name, value in traits.items()}
+    return patch
+
+
+def apply_patch(user_data, patch):
+    """طبق الـ patch على user_data ورجع اللي اتغير فعلاً بس (فاضي = مفيش كتابة)."""
+    changed = {}
+    for key, value in patch.items():
+        if key == "traits":
+            traits = user_data.setdefault("traits", {})
+            diff = {name: v for name, v in value.items() if traits.get(name) != v}
+            if diff:
+                traits.update(diff)
+                changed["traits"] = diff
+        elif user_data.get(key) != value:
+            user_data[key] = value
+            changed[key] = value
+    return changed
+
+
+def clean_preset(body, name=None):
+    """قالب خاص: {"name", الصفات الـ 8, "locked": False} بنفس شكل /save."""
+    if not isinstance(body, dict):
+        raise ValueError("المتوقع JSON object")
+    name = _name(body.get("name", name))
+    if name.lower() in LOCKED_PRESETS:
+        raise ValueError(f"{name} قالب جاهز ومقفول")
+    traits = body.get("traits", body)
+    missing = [trait for trait in TRAITS if trait not in traits]
+    if missing:
+        raise ValueError(f"ناقص: {', '.join(missing)}")
+    preset = {"name": name}
+    preset.update({trait: _trait(trait, traits[trait]) for trait in TRAITS})
+    preset["locked"] = False
+    return preset
+
+
+def find_preset(presets, name):
+    return next((p for p in presets if p.get("name", "").lower() == name.lower()), None)
+
+
+class DashboardStore:
+    """
+    طبقة بيانات لوحة التحكم فوق الـ storage:
+    - كل القراءة والكتابة في thread (asyncio.to_thread) بعيد عن الـ event loop
+    - كاش LRU للإعدادات بس، متعلم بنسخة المستخدم (mtime في JSON، version في SQLite)،
+      فالصفحة لو الملف متغيرش = stat واحد بدل قراءة وparse المستند كله
+    - أي تغيير من البوت بيغير النسخة فالكاش عمره ما يرجع داتا قديمة
+    القيم اللي بترجع نسخة، فالـ handler يقدر يعدل فيها براحته.
+    """
+
+    def __init__(self, storage, size=DASHBOARD_CACHE_SIZE):
+        self.storage = storage
+        self.size = size
+        self.entries = OrderedDict()  # user_id -> (النسخة، project(doc))
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def _put(self, uid, version, view):
+        self.entries[uid] = (version, view)
+        self.entries.move_to_end(uid)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    async def settings(self, user_id):
+        """إعدادات المستخدم وعدد رسائله، أو None لو ملوش ملف."""
+        uid = str(user_id)
+        version = await asyncio.to_thread(self.storage.user_version, uid)
+        if version is None:
+            self.entries.pop(uid, None)
+            return None
+        cached = self.entries.get(uid)
+        if cached is not None and cached[0] == version:
+            self.entries.move_to_end(uid)
+            self.stats["hits"] += 1
+            return copy.deepcopy(cached[1])
+
+        self.stats["misses"] += 1
+        doc = await asyncio.to_thread(self.storage.load_user, uid, PROJECTION_SECTIONS)
+        if doc is None:
+            return None
+        # النسخة اتقرت قبل المستند: لو الملف اتغير في النص، الطلب الجاي هيلاقيها مختلفة ويقرا تاني
+        view = project(doc)
+        self._put(uid, version, view)
+        return copy.deepcopy(view)
+
+    async def create(self, user_id, doc):
+        """اكتب مستند جديد (أول دخول للوحة) ورجع الإعدادات."""
+        uid = str(user_id)
+        version = await asyncio.to_thread(self.storage.save_user, uid, doc)
+        view = project(doc)
+        self._put(uid, version, copy.deepcopy(view))
+        self.stats["writes"] += 1
+        return view
+
+    async def update_settings(self, user_id, apply, new_document):
+        """
+        اقرا user_data من التخزين، عدله بـ apply(user_data)، واكتب القسم ده بس
+        وبلغ البوت (طابور التغييرات). new_document() لو المستخدم ملوش ملف.
+        لو apply رجعت False (مفيش تغيير) مفيش كتابة ولا تبليغ.
+        """
+        uid = str(user_id)
+
+        def update():
+            # JSON بيعيد كتابة الملف كله: load_user/save_user بينقلوا المحادثة المدمجة في الملف القديم
+            # لسجلها الأول، فالكتابة هنا عمرها ما تشيلها (متكتبش المستند بـ storage.write مباشرة)
+            for _ in range(SAVE_ATTEMPTS):
+                # النسخة قبل المستند: لو البوت حفظ (XP مثلاً) في النص الكتابة بتترفض ونقرا من الأول،
+                # بدل ما ملف JSON يتكتب كله بالتقدم القديم
+                expected = self.storage.user_version(uid)
+                doc = self.storage.load_user(uid, ("user_data",))
+                is_new = doc is None
+                if is_new:
+                    doc = new_document()
+                if apply(doc.setdefault("user_data", {})) is False and not is_new:
+                    return None, doc
+                version = self.storage.save_user(uid, doc, None if is_new else ("user_data",),
+                                                 None if is_new else expected)
+                if version is not None:
+                    # البوت يعرف إن المستخدم ده بس اللي اتغير (من غير ما يلف على المجلد)
+                    notify_change(uid)
+                    return version, doc
+            raise RuntimeError(f"المستخدم {uid} بيتكتب من البوت طول الوقت، جرب تاني")
+
+        version, doc = await asyncio.to_thread(update)
+        if version is None:
+            return doc["user_data"]
+        self.stats["writes"] += 1
+        if "messages" in (doc.get("user_progress") or {}):
+            self._put(uid, version, copy.deepcopy(project(doc)))
+        else:
+            # SQLite قرا الإعدادات بس: عدد الرسائل يتقري في العرض الجاي
+            self.entries.pop(uid, None)
+        return doc["user_data"]
+
+    async def patch_settings(self, user_id, patch, new_document):
+        """patch من clean_patch: بيرجع اللي اتغير بس."""
+        changed = {}
+
+        def apply(user_data):
+            changed.update(apply_patch(user_data, patch))
+            return bool(changed)
+
+        await self.update_settings(user_id, apply, new_document)
+        return changed
+
+    async def save_preset(self, user_id, preset, new_document, create=False):
+        """
+        أضف أو استبدل قالب خاص بنفس الاسم. create=True بترمي KeyError لو موجود.
+        بيرجع (القالب، اتعمل جديد ولا لأ).
+        """
+        result = {}
+
+        def apply(user_data):
+            presets = user_data.setdefault("custom_presets", [])
+            existing = find_preset(presets, preset["name"])
+            if existing is None:
+                if len(presets) >= MAX_PRESETS:
+                    raise ValueError(f"أقصى عدد قوالب {MAX_PRESETS}")
+                presets.append(dict(preset))
+                result["created"] = True
+                return True
+            if create:
+                raise KeyError(preset["name"])
+            result["created"] = False
+            if existing == preset:
+                return False
+            existing.clear()
+            existing.update(preset)
+            return True
+
+        await self.update_settings(user_id, apply, new_document)
+        return preset, result["created"]
+
+    async def delete_preset(self, user_id, name, new_document):
+        """امسح قالب خاص بالاسم، بيرجع False لو مش موجود."""
+        result = {"deleted": False}
+
+        def apply(user_data):
+            presets = user_data.get("custom_presets") or []
+            existing = find_preset(presets, name)
+            if existing is None:
+                return False
+            presets.remove(existing)
+            result["deleted"] = True
+            return True
+
+        await self.update_settings(user_id, apply, new_document)
+        return result["deleted"]
@@ -0,0 +1,239 @@
+import os
+import time
+import asyncio
+import hashlib
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx محتاجها عشان HTTP/2)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+DISCORD_API = "https://discord.com/api"
+# بروفايل Discord (الاسم والصورة) بيفضل في الذاكرة قد إيه بالثواني
+PROFILE_TTL = float(os.getenv("PROFILE_TTL", "300"))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "4096"))
+# كوكي "افتكرني": المستخدم الراجع بيدخل بالـ refresh token من غير صفحة Discord
+REMEMBER_COOKIE = "sienna_remember"
+REMEMBER_DAYS = int(os.getenv("REMEMBER_DAYS", "30"))
+OAUTH_DB = os.getenv("OAUTH_DB", os.path.join("users_data", "oauth.db"))
+
+
+class ProfileCache:
+    """بروفايلات /users/@me حسب رقم المستخدم لمدة ttl ثانية (LRU محدود)."""
+
+    def __init__(self, ttl=PROFILE_TTL, size=PROFILE_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()  # user_id -> (وقت الانتهاء، البروفايل)
+
+    def get(self, user_id):
+        entry = self.entries.get(str(user_id))
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[str(user_id)]
+            return None
+        self.entries.move_to_end(str(user_id))
+        return entry[1]
+
+    def put(self, profile):
+        uid = str(profile["id"])
+        self.entries[uid] = (time.monotonic() + self.ttl, profile)
+        self.entries.move_to_end(uid)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def forget(self, user_id):
+        self.entries.pop(str(user_id), None)
+
+
+def _hash(selector):
+    # الكوكي نفسها مش بتتخزن، عشان لو الداتابيز اتسربت متتستخدمش
+    return hashlib.sha256(selector.encode("utf-8")).hexdigest()
+
+
+class TokenStore:
+    """
+    refresh tokens بتاعة Discord في SQLite، متربوطة بكوكي "افتكرني" عشوائية.
+    بتشتغل في thread (connection لكل thread زي SQLiteStorage).
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS remembered_logins (
+        selector_hash TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        refresh_token TEXT NOT NULL,
+        access_token TEXT,
+        expires_at REAL NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_remembered_logins_user ON remembered_logins(user_id);
+    """
+
+    def __init__(self, path=OAUTH_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def save(self, user_id, token):
+        """سجل login جديد ورجع الـ selector اللي بيتحط في الكوكي."""
+        selector = secrets.token_urlsafe(32)
+        self._conn().execute(
+            "INSERT INTO remembered_logins (selector_hash, user_id, refresh_token, access_token, expires_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (_hash(selector), str(user_id), token["refresh_token"], token.get("access_token"),
+             time.time() + float(token.get("expires_in", 0)), time.time()),
+        )
+        return selector
+
+    def load(self, selector):
+        row = self._conn().execute(
+            "SELECT user_id, refresh_token, access_token, expires_at, created_at FROM remembered_logins "
+            "WHERE selector_hash = ?", (_hash(selector),)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[4] + REMEMBER_DAYS * 86400 < time.time():
+            self.delete(selector)
+            return None
+        return {"user_id": row[0], "refresh_token": row[1], "access_token": row[2], "expires_at": row[3]}
+
+    def update(self, selector, token):
+        # Discord بيغير الـ refresh token مع كل استخدام
+        self._conn().execute(
+            "UPDATE remembered_logins SET refresh_token = ?, access_token = ?, expires_at = ? WHERE selector_hash = ?",
+            (token["refresh_token"], token.get("access_token"), time.time() + float(token.get("expires_in", 0)),
+             _hash(selector)),
+        )
+
+    def delete(self, selector):
+        self._conn().execute("DELETE FROM remembered_logins WHERE selector_hash = ?", (_hash(selector),))
+
+
+class DiscordOAuth:
+    """
+    تسجيل الدخول بـ Discord فوق httpx.AsyncClient واحد طول عمر التطبيق
+    (keep-alive و HTTP/2 لو h2 متسطبة)، فكل login مش بيدفع TLS handshake جديد.
+    start() و close() بيتندهوا من lifespan بتاع FastAPI.
+    """
+
+    def __init__(self, client_id, client_secret, redirect_uri, tokens=None, profiles=None):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.redirect_uri = redirect_uri
+        self.tokens = tokens
+        self.profiles = profiles or ProfileCache()
+        self.client = None
+        self.stats = {"logins": 0, "resumed": 0, "refreshed": 0, "profile_hits": 0, "profile_fetches": 0}
+
+    @property
+    def configured(self):
+        return bool(self.client_id and self.redirect_uri)
+
+    async def start(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=DISCORD_API, http2=HTTP2, timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60),
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def authorize_url(self):
+        query = urlencode({"client_id": self.client_id, "redirect_uri": self.redirect_uri,
+                           "response_type": "code", "scope": "identify"})
+        return f"https://discord.com/api/oauth2/authorize?{query}"
+
+    async def _token(self, data):
+        await self.start()
+        data = dict(data, client_id=self.client_id, client_secret=self.client_secret)
+        res = await self.client.post("/oauth2/token", data=data,
+                                     headers={"Content-Type": "application/x-www-form-urlencoded"})
+        try:
+            token = res.json()
+        except ValueError:
+            return None
+        return token if isinstance(token, dict) and "access_token" in token else None
+
+    async def profile(self, access_token, user_id=None):
+        """/users/@me، من الكاش لو رقم المستخدم معروف وبروفايله لسه جديد."""
+        if user_id is not None:
+            cached = self.profiles.get(user_id)
+            if cached is not None:
+                self.stats["profile_hits"] += 1
+                return cached
+        await self.start()
+        self.stats["profile_fetches"] += 1
+        res = await self.client.get("/users/@me", headers={"Authorization": f"Bearer {access_token}"})
+        if res.status_code != 200:
+            return None
+        profile = res.json()
+        self.profiles.put(profile)
+        return profile
+
+    async def login(self, code):
+        """
+        الـ code من /callback -> (البروفايل، selector لكوكي افتكرني أو None).
+        بيرجع (None, None) لو Discord رفض.
+        """
+        token = await self._token({"grant_type": "authorization_code", "code": code, "redirect_uri": self.redirect_uri})
+        if token is None:
+            return None, None
+        profile = await self.profile(token["access_token"])
+        if profile is None:
+            return None, None
+        self.stats["logins"] += 1
+        selector = None
+        if self.tokens is not None and token.get("refresh_token"):
+            selector = await asyncio.to_thread(self.tokens.save, profile["id"], token)
+        return profile, selector
+
+    async def resume(self, selector):
+        """مستخدم راجع بكوكي افتكرني: البروفايل من غير صفحة Discord، أو None."""
+        if self.tokens is None or not selector:
+            return None
+        row = await asyncio.to_thread(self.tokens.load, selector)
+        if row is None:
+            return None
+        access_token = row["access_token"]
+        if not access_token or row["expires_at"] < time.time() + 60:
+            token = await self._token({"grant_type": "refresh_token", "refresh_token": row["refresh_token"]})
+            if token is None:
+                # المستخدم شال صلاحية التطبيق: يسجل دخول من الأول
+                await asyncio.to_thread(self.tokens.delete, selector)
+                return None
+            self.stats["refreshed"] += 1
+            token.setdefault("refresh_token", row["refresh_token"])
+            await asyncio.to_thread(self.tokens.update, selector, token)
+            access_token = token["access_token"]
+        profile = await self.profile(access_token, row["user_id"])
+        if profile is not None:
+            self.stats["resumed"] += 1
+        return profile
+
+    async def forget(self, selector):
+        if self.tokens is not None and selector:
+            await asyncio.to_thread(self.tokens.delete, selector)
@@ -0,0 +1,148 @@
+import os
+import asyncio
+from collections import OrderedDict, deque
+
+import discord
+
+from llm_pool import TokenBucket
+from metrics import registry
+from streaming import DISCORD_SEND_SECONDS
+
+# الرسائل اللي البوت بيبعتها من نفسه (تذكيرات، غياب، تحديث من الموقع) في الثانية
+DM_RATE_PER_SEC = float(os.getenv("DM_RATE_PER_SEC", "5"))
+DM_BURST = int(os.getenv("DM_BURST", "5"))
+# أقصى رسائل مستنية في الطابور (0 = مفتوح)، بعدها الجديد بيترفض بدل ما الذاكرة تكبر
+DM_MAX_QUEUE = int(os.getenv("DM_MAX_QUEUE", "5000"))
+# عدد أرقام القنوات الخاصة اللي بتفضل في الذاكرة (الباقي محفوظ مع المستخدم)
+DM_CHANNEL_CACHE = int(os.getenv("DM_CHANNEL_CACHE", "50000"))
+
+DM_DISPATCH = registry.counter("sienna_bot_dm_dispatch_total", "Proactive DMs by outcome")
+DM_CHANNEL_LOOKUPS = registry.counter("sienna_bot_dm_channel_lookups_total",
+                                      "DM channel resolutions by source (cache, stored, rest)")
+
+
+class DMDispatcher:
+    """
+    طابور واحد لكل الرسائل الخاصة اللي البوت بيبدأها هو، بـ token bucket قدامه،
+    فدقيقة فيها تذكيرات كتير أو حفظ كتير من الموقع متتحولش لسيل طلبات REST.
+
+    القناة الخاصة بتتبعت عليها على طول برقمها (get_partial_messageable) من غير
+    fetch_user ولا create_dm. الرقم بيتجاب من:
+    كاش LRU محدود، وإلا load_channel_id(user_id) (محفوظ مع المستخدم)، وإلا REST مرة واحدة
+    وبيتحفظ بـ store_channel_id(user_id, channel_id).
+    """
+
+    def __init__(self, bot, load_channel_id=None, store_channel_id=None, rate=DM_RATE_PER_SEC,
+                 burst=DM_BURST, max_queue=DM_MAX_QUEUE, cache_size=DM_CHANNEL_CACHE):
+        self.bot = bot
+        self.load_channel_id = load_channel_id
+        self.store_channel_id = store_channel_id
+        self.bucket = TokenBucket(rate, burst)
+        self.max_queue = max_queue
+        self.cache_size = cache_size
+        self.channels = OrderedDict()  # user_id -> رقم القناة الخاصة (الأقدم استخدام الأول)
+        self.queue = deque()  # (user_id، kwargs بتاعة send، future)
+        self._wakeup = None
+        self._task = None
+        self.stats = {"queued": 0, "sent": 0, "failed": 0, "rejected": 0, "rest_lookups": 0, "stale_channels": 0}
+
+    def _cache(self, uid, channel_id):
+        self.channels[uid] = channel_id
+        self.channels.move_to_end(uid)
+        while len(self.channels) > self.cache_size:
+            self.channels.popitem(last=False)
+
+    def remember(self, user_id, channel_id):
+        """رقم القناة من رسالة خاصة جت من المستخدم (مجاناً من غير REST)."""
+        uid = str(user_id)
+        if self.channels.get(uid) == channel_id:
+            self.channels.move_to_end(uid)
+            return
+        self._cache(uid, channel_id)
+        if self.store_channel_id:
+            self.store_channel_id(uid, channel_id)
+
+    def forget(self, user_id):
+        self.channels.pop(str(user_id), None)
+
+    def send(self, user_id, content=None, **kwargs):
+        """
+        حط رسالة في الطابور وارجع future بـ True لو اتبعتت أو False لو فشلت/اترفضت.
+        اللي مش محتاج النتيجة يسيبها من غير await.
+        """
+        fut = asyncio.get_running_loop().create_future()
+        if self.max_queue and len(self.queue) >= self.max_queue:
+            self.stats["rejected"] += 1
+            DM_DISPATCH.inc(outcome="rejected")
+            fut.set_result(False)
+            return fut
+        if content is not None:
+            kwargs["content"] = content
+        self.queue.append((str(user_id), kwargs, fut))
+        self.stats["queued"] += 1
+        self._ensure_worker()
+        self._wakeup.set()
+        return fut
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _channel(self, uid):
+        channel_id = self.channels.get(uid)
+        if channel_id is not None:
+            self.channels.move_to_end(uid)
+            DM_CHANNEL_LOOKUPS.inc(source="cache")
+        elif self.load_channel_id is not None:
+            channel_id = self.load_channel_id(uid)
+            if channel_id is not None:
+                self._cache(uid, channel_id)
+                DM_CHANNEL_LOOKUPS.inc(source="stored")
+        if channel_id is not None:
+            return self.bot.get_partial_messageable(int(channel_id), type=discord.ChannelType.private)
+
+        # أول مرة: المستخدم من كاش discord.py لو موجود، والقناة من REST
+        self.stats["rest_lookups"] += 1
+        DM_CHANNEL_LOOKUPS.inc(source="rest")
+        user = self.bot.get_user(int(uid)) or await self.bot.fetch_user(int(uid))
+        channel = user.dm_channel or await user.create_dm()
+        self.remember(uid, channel.id)
+        return channel
+
+    async def _deliver(self, uid, kwargs):
+        await self.bucket.acquire()
+        channel = await self._channel(uid)
+        try:
+            with DISCORD_SEND_SECONDS.time(kind="dm"):
+                await channel.send(**kwargs)
+        except discord.NotFound:
+            # القناة المحفوظة اتمسحت: نجيب واحدة جديدة مرة واحدة بس
+            self.stats["stale_channels"] += 1
+            self.forget(uid)
+            if self.store_channel_id:
+                self.store_channel_id(uid, None)
+            await self.bucket.acquire()
+            channel = await self._channel(uid)
+            with DISCORD_SEND_SECONDS.time(kind="dm"):
+                await channel.send(**kwargs)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.queue:
+                uid, kwargs, fut = self.queue.popleft()
+                if fut.done():
+                    continue  # اللي طلبها لغاها
+                try:
+                    await self._deliver(uid, kwargs)
+                    ok = True
+                except Exception as e:
+                    # Forbidden = الخاص مقفول، وأي خطأ تاني ميوقفش الطابور
+                    print(f"❌ خطأ في إرسال رسالة خاصة للمستخدم {uid}: {e}")
+                    ok = False
+                self.stats["sent" if ok else "failed"] += 1
+                DM_DISPATCH.inc(outcome="sent" if ok else "failed")
+                if not fut.done():
+                    fut.set_result(ok)
@@ -0,0 +1,119 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+
+# بعد قد إيه من آخر رسالة البوت يسأل المستخدم راح فين (بالثواني)
+INACTIVE_AFTER = float(os.getenv("INACTIVE_AFTER", "120"))
+# لو الإرسال فشل (الخاص مقفول مثلاً) نجرب تاني بعد قد إيه
+INACTIVE_RETRY = float(os.getenv("INACTIVE_RETRY", "600"))
+# بعد restart طويل: اللي غايب أكتر من كده مش هيتبعتله (رسالة "رحت فين" بعد أيام ملهاش معنى)
+INACTIVE_STALE = float(os.getenv("INACTIVE_STALE", str(6 * 3600)))
+
+BUSY_KEYWORDS = {
+    "ar": ["نوم", "نام", "هنام", "هريح", "مشغول", "شغل", "تعبت", "تعبان", "دور", "هروح"],
+    "en": ["sleep", "sleeping", "tired", "busy", "work", "rest", "go", "leave", "bed"],
+}
+
+
+def is_busy(text, lang):
+    """المستخدم قال إنه رايح ينام/مشغول في آخر رسالة؟"""
+    text = (text or "").lower()
+    return any(keyword in text for keyword in BUSY_KEYWORDS["ar" if lang == "ar" else "en"])
+
+
+class InactivityNotifier:
+    """
+    رسائل "انت رحت فين؟": heap حسب ميعاد كل مستخدم (آخر رسالة + INACTIVE_AFTER)،
+    فالمهمة بتنام لحد أقرب ميعاد بدل ما تلف على كل المستخدمين كل دقيقة.
+
+    حالة كل مستخدم dict صغير بيتحفظ مع user_progress["inactivity"]:
+    {"last_active": timestamp، "busy": آخر رسالة فيها نوم/شغل، "nudged": اتبعتله خلاص}
+    فبعد الـ restart مفيش حد بيتبعتله تاني، ومش محتاجين ندور في المحادثة على آخر رسالة.
+    """
+
+    def __init__(self, after=INACTIVE_AFTER, retry=INACTIVE_RETRY, stale=INACTIVE_STALE):
+        self.after = after
+        self.retry = retry
+        self.stale = stale
+        self.heap = []  # (الميعاد، رقم، المستخدم)
+        self.due = {}  # المستخدم -> الميعاد الحالي
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.stats = {"sent": 0, "skipped": 0, "failed": 0, "stale": 0}
+
+    def activity(self, user_id, text, lang, now=None):
+        """المستخدم بعت رسالة: رجع الحالة الجديدة (تتحفظ مع user_progress) وحرك ميعاده."""
+        now = now or time.time()
+        state = {"last_active": now, "busy": is_busy(text, lang), "nudged": False}
+        if state["busy"]:
+            self.cancel(user_id)
+        else:
+            self.schedule(user_id, now + self.after)
+        return state
+
+    def schedule(self, user_id, due):
+        uid = str(user_id)
+        self.due[uid] = due
+        heapq.heappush(self.heap, (due, next(self._seq), uid))
+        self._wakeup.set()
+
+    def cancel(self, user_id):
+        # بيتشال من الـ heap لما ييجي دوره (lazy delete)
+        self.due.pop(str(user_id), None)
+
+    def rebuild(self, users):
+        """users: [(user_id, الحالة المحفوظة), ...] من فهرس المستخدمين وقت التشغيل."""
+        self.heap, self.due = [], {}
+        for user_id, state in users:
+            if not state or state.get("nudged") or state.get("busy"):
+                continue
+            try:
+                self.schedule(user_id, float(state["last_active"]) + self.after)
+            except (KeyError, TypeError, ValueError):
+                continue
+        return len(self.due)
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            ts, _, uid = heapq.heappop(self.heap)
+            if self.due.get(uid) != ts:
+                continue  # اتكلم تاني أو اتلغى
+            del self.due[uid]
+            due.append((uid, ts))
+        return due
+
+    async def run(self, notify):
+        """
+        notify(user_id) بتتنده لكل مستخدم جه ميعاده وبترجع True لو اتبعت،
+        None لو مفيش داعي (مش مفعل مثلاً)، وFalse لو الإرسال فشل (بيتجرب تاني بعد retry ثانية).
+        """
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            for uid, ts in self._pop_due(now):
+                if now - ts > self.stale:
+                    self.stats["stale"] += 1
+                    continue
+                try:
+                    ok = await notify(uid)
+                except Exception as e:
+                    print(f"❌ خطأ في تنبيه المستخدم {uid}: {e}")
+                    ok = False
+                if ok:
+                    self.stats["sent"] += 1
+                elif ok is None:
+                    self.stats["skipped"] += 1
+                elif uid not in self.due:
+                    self.stats["failed"] += 1
+                    self.schedule(uid, time.time() + self.retry)
+
+            timeout = None
+            if self.heap:
+                timeout = max(0.0, self.heap[0][0] - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,268 @@
+import os
+import time
+import random
+import asyncio
+from collections import OrderedDict, deque
+
+from metrics import registry
+
+# أقصى عدد طلبات شغالة للـ API في نفس الوقت (لكل البوت)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# أقصى عدد طلبات شغالة لنفس المستخدم
+LLM_PER_USER_CONCURRENCY = int(os.getenv("LLM_PER_USER_CONCURRENCY", "1"))
+# token bucket: عدد الطلبات في الثانية والـ burst المسموح
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+# لو الطابور عدى الرقم ده بنرفض الطلب على طول بدل ما المستخدم يستنى كتير
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+
+RETRY_STATUS = {408, 409, 429}
+
+LLM_SECONDS = registry.histogram("sienna_bot_llm_request_seconds",
+                                 "LLM request time after getting a pool slot (streams until the last chunk)")
+LLM_FIRST_TOKEN_SECONDS = registry.histogram("sienna_bot_llm_first_token_seconds",
+                                             "Time from getting a pool slot to the first streamed chunk")
+LLM_QUEUE_SECONDS = registry.histogram("sienna_bot_llm_queue_wait_seconds", "Time waiting for an LLM pool slot")
+LLM_ERRORS = registry.counter("sienna_bot_llm_errors_total", "LLM call errors by HTTP status (retried or not)")
+
+
+class LLMPoolBusy(Exception):
+    """الطابور مليان."""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def block(self, seconds):
+        """وقف كل الطلبات شوية (بعد 429 من السيرفر)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _status_of(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def usage_counts(usage):
+    """tokens الطلب من usage (object أو dict)، ومنها cached_tokens اللي جت من كاش المزود."""
+    if usage is None:
+        return None
+    get = usage.get if isinstance(usage, dict) else (lambda key, default=None: getattr(usage, key, default))
+    details = get("prompt_tokens_details") or {}
+    if isinstance(details, dict):
+        cached = details.get("cached_tokens")
+    else:
+        cached = getattr(details, "cached_tokens", None)
+    return {
+        "prompt_tokens": get("prompt_tokens", 0) or 0,
+        "completion_tokens": get("completion_tokens", 0) or 0,
+        "cached_tokens": cached or 0,
+    }
+
+
+def is_retryable(error):
+    status = _status_of(error)
+    if status is None:
+        # مشكلة اتصال أو timeout
+        return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+    return status in RETRY_STATUS or status >= 500
+
+
+class LLMPool:
+    """
+    طابور محدود قدام الـ AsyncOpenAI client:
+    - حد أقصى للطلبات الشغالة لكل البوت ولكل مستخدم
+    - token bucket عشان منعديش rate limit بتاع OpenRouter
+    - إعادة المحاولة على 429/5xx بـ exponential backoff مع jitter
+    - الطابور بيلف على المستخدمين بالدور، فمستخدم بيبعت كتير مش بياخد دور الباقيين
+    """
+
+    def __init__(self, client, max_concurrency=LLM_MAX_CONCURRENCY, per_user=LLM_PER_USER_CONCURRENCY,
+                 rate=LLM_RATE_PER_SEC, burst=LLM_BURST, max_retries=LLM_MAX_RETRIES,
+                 max_queue=LLM_MAX_QUEUE, base_delay=0.5, max_delay=20.0):
+        self.client = client
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_user = max(1, per_user)
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.waiting = OrderedDict()  # user_id -> deque(futures) بترتيب الدور
+        self.active = 0
+        self.active_per_user = {}
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "server_errors": 0,
+                      "failures": 0, "rejected": 0, "max_wait_ms": 0.0}
+
+    def queued(self):
+        return sum(len(q) for q in self.waiting.values())
+
+    def _grant(self):
+        while self.active < self.max_concurrency and self.waiting:
+            uid = next((u for u in self.waiting if self.active_per_user.get(u, 0) < self.per_user), None)
+            if uid is None:
+                return
+            queue = self.waiting[uid]
+            fut = queue.popleft()
+            if queue:
+                self.waiting.move_to_end(uid)
+            else:
+                del self.waiting[uid]
+            if fut.done():
+                continue  # الطلب اتلغى وهو مستني
+            self.active += 1
+            self.active_per_user[uid] = self.active_per_user.get(uid, 0) + 1
+            fut.set_result(None)
+
+    def _release(self, uid):
+        self.active -= 1
+        count = self.active_per_user.get(uid, 0) - 1
+        if count > 0:
+            self.active_per_user[uid] = count
+        else:
+            self.active_per_user.pop(uid, None)
+        self._grant()
+
+    async def _acquire(self, uid):
+        if self.max_queue and self.queued() >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise LLMPoolBusy()
+        fut = asyncio.get_running_loop().create_future()
+        self.waiting.setdefault(uid, deque()).append(fut)
+        self._grant()
+        started = time.monotonic()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # أخد الدور في نفس اللحظة اللي اتلغى فيها
+                self._release(uid)
+            raise
+        wait_ms = (time.monotonic() - started) * 1000
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+        LLM_QUEUE_SECONDS.observe(wait_ms / 1000)
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    async def _call(self, create, kwargs):
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                return await create(**kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                status = _status_of(e)
+                LLM_ERRORS.inc(status=status or type(e).__name__)
+                if status == 429:
+                    self.stats["rate_limited"] += 1
+                elif status is not None and status >= 500:
+                    self.stats["server_errors"] += 1
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                if status == 429:
+                    # السيرفر قال كفاية: نهدي كل الطلبات مش الطلب ده بس
+                    self.bucket.block(delay)
+                self.stats["retries"] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def chat(self, user_id, **kwargs):
+        """زي client.chat.completions.create بس جوه الطابور."""
+        uid = str(user_id)
+        await self._acquire(uid)
+        self.stats["requests"] += 1
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await self._call(self.client.chat.completions.create, kwargs)
+            outcome = "ok"
+            return response
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, kind="chat", outcome=outcome)
+            self._release(uid)
+
+    async def stream(self, user_id, usage=None, **kwargs):
+        """
+        نفس chat بس stream=True: بترجع أجزاء النص أول بأول.
+        إعادة المحاولة بتحصل بس قبل أول جزء، والمكان في الطابور محجوز لحد آخر جزء.
+        لو usage (dict) متبعت بيتملى بأرقام الـ tokens من آخر جزء.
+        """
+        uid = str(user_id)
+        await self._acquire(uid)
+        self.stats["requests"] += 1
+        if usage is not None:
+            kwargs["stream_options"] = {"include_usage": True}
+        started = time.perf_counter()
+        first = True
+        outcome = "error"
+        try:
+            stream = await self._call(self.client.chat.completions.create, dict(kwargs, stream=True))
+            async for chunk in stream:
+                if first:
+                    first = False
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                if usage is not None and getattr(chunk, "usage", None):
+                    usage.update(usage_counts(chunk.usage))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            # الرد اتلغى أو اتقفل من برة قبل ما يخلص
+            outcome = "cancelled"
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, kind="stream", outcome=outcome)
+            self._release(uid)
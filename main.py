@@ -1,29 +1,79 @@
 import os
-import json
+import secrets
+import time
+import asyncio
 import httpx
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
+from storage import get_storage
+from dashboard_store import DashboardStore, LOCKED_PRESETS, clean_patch, clean_preset
+from static_assets import AssetManifest, AssetFiles
+from session_store import ServerSessionMiddleware, get_session_store
+from discord_oauth import DiscordOAuth, TokenStore, REMEMBER_COOKIE, REMEMBER_DAYS
+from metrics import registry, LoopLagMonitor, merge_expositions, CONTENT_TYPE, METRICS_HOST, METRICS_PORT, METRICS_TOKEN
 
 load_dotenv()
 
-app = FastAPI()
-app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "sienna_key_999"))
+# /metrics بتاعة البوت بتتضاف لـ /metrics بتاعة الموقع: كل worker (start.sh بيشغل BOT_WORKERS)
+# على METRICS_PORT + رقمه، وBOT_METRICS_URL (لينكات مفصولة بفاصلة) بيغير الأماكن دي
+BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1")))
+BOT_METRICS_URLS = [url.strip() for url in os.getenv("BOT_METRICS_URL", "").split(",") if url.strip()] or [
+    f"http://{METRICS_HOST}:{METRICS_PORT + index}/metrics" for index in range(BOT_WORKERS)
+]
+# one keep-alive client for every scrape instead of a new connection each time
+bot_metrics_client = httpx.AsyncClient(timeout=2)
+loop_lag = LoopLagMonitor("sienna_web")
+REQUEST_SECONDS = registry.histogram("sienna_web_request_seconds", "Dashboard request handling time")
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(loop_lag.run())
+    # client واحد لـ discord.com طول عمر التطبيق (keep-alive/HTTP2)
+    await oauth.start()
+    # الجلسات اللي خلصت وهي مقفولة
+    await sessions.purge()
+    yield
+    task.cancel()
+    await oauth.close()
+    await bot_metrics_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
+# الكوكي فيها رقم الجلسة بس، والجلسة نفسها في SESSION_BACKEND (memory | sqlite)
+sessions = get_session_store()
+app.add_middleware(ServerSessionMiddleware, store=sessions,
+                   https_only=os.getenv("REDIRECT_URI", "").startswith("https://"))
 
 # التأكد من المجلدات
 for folder in ["static", "templates", "users_data"]:
     if not os.path.exists(folder): os.makedirs(folder)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# content-hashed copies of static/ (+ gzip/brotli), linked from the templates via asset()
+assets = AssetManifest().build()
+app.mount("/static", AssetFiles(assets), name="static")
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # مسار الـ route مش الـ URL نفسه، عشان عدد الـ labels ميكبرش
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                            route=getattr(route, "path", "other"), status=response.status_code)
+    return response
 templates = Jinja2Templates(directory="templates")
+templates.env.globals["asset"] = assets.url
 
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
 REDIRECT_URI = os.getenv("REDIRECT_URI")
 DATA_DIR = "users_data"
+storage = get_storage()
+oauth = DiscordOAuth(CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, tokens=TokenStore())
+# القراءة والكتابة في thread + كاش للإعدادات متعلم بنسخة الملف
+dashboard_store = DashboardStore(storage)
 
 # ----- Translations dictionary -----
 TRANSLATIONS = {
@@ -108,26 +158,51 @@ async def index(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "t": t, "lang": lang})
 
 @app.get("/login")
-async def login():
-    if not CLIENT_ID or not REDIRECT_URI:
+async def login(request: Request):
+    if not oauth.configured:
         return RedirectResponse(url="/?error=missing_config")
-    url = f"https://discord.com/api/oauth2/authorize?client_id={CLIENT_ID}&redirect_uri={REDIRECT_URI}&response_type=code&scope=identify"
-    return RedirectResponse(url=url)
+    # returning user: refresh token instead of the Discord consent page
+    selector = request.cookies.get(REMEMBER_COOKIE)
+    if selector:
+        try:
+            profile = await oauth.resume(selector)
+        except httpx.HTTPError:
+            profile = None
+        if profile:
+            request.session["user"] = profile
+            request.session.setdefault("lang", "ar")
+            return RedirectResponse(url="/dashboard")
+    response = RedirectResponse(url=oauth.authorize_url())
+    if selector:
+        response.delete_cookie(REMEMBER_COOKIE)
+    return response
 
 @app.get("/callback")
 async def callback(request: Request, code: str):
-    async with httpx.AsyncClient() as client:
-        data = {"client_id": CLIENT_ID, "client_secret": CLIENT_SECRET, "grant_type": "authorization_code", "code": code, "redirect_uri": REDIRECT_URI}
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        res = await client.post("https://discord.com/api/oauth2/token", data=data, headers=headers)
-        token_json = res.json()
-        if "access_token" not in token_json: return RedirectResponse(url="/?error=failed")
-        
-        user_res = await client.get("https://discord.com/api/users/@me", headers={"Authorization": f"Bearer {token_json['access_token']}"})
-        request.session["user"] = user_res.json()
-        # store language choice if present in session already, else default
-        request.session.setdefault("lang", "ar")
-        return RedirectResponse(url="/dashboard")
+    try:
+        profile, selector = await oauth.login(code)
+    except httpx.HTTPError:
+        profile, selector = None, None
+    if profile is None: return RedirectResponse(url="/?error=failed")
+
+    request.session["user"] = profile
+    # store language choice if present in session already, else default
+    request.session.setdefault("lang", "ar")
+    response = RedirectResponse(url="/dashboard")
+    if selector:
+        response.set_cookie(REMEMBER_COOKIE, selector, max_age=REMEMBER_DAYS * 86400, httponly=True,
+                            samesite="lax", secure=(REDIRECT_URI or "").startswith("https://"))
+    return response
+
+async def load_view(user_id):
+    view = await dashboard_store.settings(user_id)
+    if view is None:
+        # create default file for this user
+        data = default_user_file_structure()
+        # set joined_at
+        data["user_data"]["joined_at"] = None
+        view = await dashboard_store.create(user_id, data)
+    return view
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
@@ -141,22 +216,10 @@ async def dashboard(request: Request):
     lang = request.session.get("lang", "ar")
     t = TRANSLATIONS.get(lang, TRANSLATIONS["ar"])
 
-    file_path = os.path.join(DATA_DIR, f"{user['id']}.json")
-    data = None
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        # create default file for this user
-        data = default_user_file_structure()
-        # set joined_at
-        data["user_data"]["joined_at"] = None
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-
-    settings = data.get("user_data", {})
+    view = await load_view(user["id"])
+    settings = view["user_data"]
     activated = settings.get("activated", False)
-    settings["messages"] = data.get("user_progress", {}).get("messages", 0)
+    settings["messages"] = view["messages"]
     # ensure defaults
     default_traits = {"curiosity": 50, "sensitivity": 50, "happiness": 50, "sadness": 20, "boldness":50,"kindness":50,"shyness":20,"intelligence":80}
     for k,v in default_traits.items():
@@ -199,57 +262,153 @@ async def save(request: Request):
     shyness = int_field("shyness", 20)
     intelligence = int_field("intelligence", 80)
 
-    file_path = os.path.join(DATA_DIR, f"{user['id']}.json")
-    if os.path.exists(file_path):
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        data = default_user_file_structure()
-
-    # Update fields
-    user_data = data.setdefault("user_data", {})
-    user_data["bot_name"] = bot_name
-    user_data["language"] = lang
-    user_data["sex_mode"] = sex_mode
-    user_data["notifications"] = notifications
-    user_data["traits"] = {
-        "curiosity": curiosity, "sensitivity": sensitivity,
-        "happiness": happiness, "sadness": sadness,
-        "boldness": boldness, "kindness": kindness,
-        "shyness": shyness, "intelligence": intelligence
-    }
-
-    # Save custom preset if bot_name not one of locked built-in presets (Sienna, Roxy, ...)
-    locked_names = {"sienna","roxy","laila","maya","sarah","luna","raven","zara","ivy","cleo"}
-    if bot_name.lower() not in locked_names:
-        custom_presets = user_data.setdefault("custom_presets", [])
-        # replace existing with same name or append
-        existing = next((p for p in custom_presets if p.get("name","").lower() == bot_name.lower()), None)
-        preset_obj = {
-            "name": bot_name,
-            "curiosity": curiosity, "sensitivity": sensitivity, "intelligence": intelligence,
-            "kindness": kindness, "happiness": happiness, "sadness": sadness,
-            "boldness": boldness, "shyness": shyness,
-            "locked": False
+    # Update fields (runs in a worker thread on the freshly loaded settings)
+    def apply(user_data):
+        user_data["bot_name"] = bot_name
+        user_data["language"] = lang
+        user_data["sex_mode"] = sex_mode
+        user_data["notifications"] = notifications
+        user_data["traits"] = {
+            "curiosity": curiosity, "sensitivity": sensitivity,
+            "happiness": happiness, "sadness": sadness,
+            "boldness": boldness, "kindness": kindness,
+            "shyness": shyness, "intelligence": intelligence
         }
-        if existing:
-            existing.update(preset_obj)
-        else:
-            custom_presets.append(preset_obj)
 
-    # persist
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+        # Save custom preset if bot_name not one of locked built-in presets (Sienna, Roxy, ...)
+        if bot_name.lower() not in LOCKED_PRESETS:
+            custom_presets = user_data.setdefault("custom_presets", [])
+            # replace existing with same name or append
+            existing = next((p for p in custom_presets if p.get("name","").lower() == bot_name.lower()), None)
+            preset_obj = {
+                "name": bot_name,
+                "curiosity": curiosity, "sensitivity": sensitivity, "intelligence": intelligence,
+                "kindness": kindness, "happiness": happiness, "sadness": sadness,
+                "boldness": boldness, "shyness": shyness,
+                "locked": False
+            }
+            if existing:
+                existing.update(preset_obj)
+            else:
+                custom_presets.append(preset_obj)
+
+    # persist only the settings section (whole file for a brand-new user) and tell the bot
+    await dashboard_store.update_settings(user["id"], apply, default_user_file_structure)
 
     # update session language
     request.session["lang"] = lang
 
     return RedirectResponse(url="/dashboard?success=1", status_code=303)
 
+# ----- JSON API (dashboard_script.js) -----
+# every write persists only the settings section, and nothing at all when the patch changes nothing
+API_FIELDS = ("bot_name", "language", "sex_mode", "notifications", "traits", "custom_presets", "activated")
+
+def api_user(request: Request):
+    user = request.session.get("user")
+    if not user:
+        raise HTTPException(status_code=401, detail="not logged in")
+    return user
+
+async def api_body(request: Request):
+    # JSON only: a cross-site <form> can't send it without a CORS preflight
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/json":
+        raise HTTPException(status_code=415, detail="expected application/json")
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid JSON")
+
+@app.get("/api/v1/settings")
+async def api_settings(request: Request):
+    user = api_user(request)
+    view = await load_view(user["id"])
+    settings = {k: view["user_data"][k] for k in API_FIELDS if k in view["user_data"]}
+    return {"settings": settings, "messages": view["messages"]}
+
+@app.patch("/api/v1/settings")
+async def api_patch_settings(request: Request):
+    user = api_user(request)
+    try:
+        patch = clean_patch(await api_body(request))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    changed = await dashboard_store.patch_settings(user["id"], patch, default_user_file_structure)
+    if "language" in changed:
+        request.session["lang"] = changed["language"]
+    return {"changed": changed}
+
+@app.get("/api/v1/presets")
+async def api_presets(request: Request):
+    user = api_user(request)
+    view = await load_view(user["id"])
+    return {"presets": view["user_data"].get("custom_presets", [])}
+
+@app.post("/api/v1/presets", status_code=201)
+async def api_create_preset(request: Request):
+    user = api_user(request)
+    try:
+        preset = clean_preset(await api_body(request))
+        preset, _ = await dashboard_store.save_preset(user["id"], preset, default_user_file_structure, create=True)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except KeyError:
+        raise HTTPException(status_code=409, detail="preset already exists")
+    return {"preset": preset}
+
+@app.put("/api/v1/presets/{name}")
+async def api_put_preset(request: Request, name: str):
+    user = api_user(request)
+    try:
+        preset = clean_preset(await api_body(request), name)
+        if preset["name"].lower() != name.strip().lower():
+            raise ValueError("name in body doesn't match the URL")
+        preset, created = await dashboard_store.save_preset(user["id"], preset, default_user_file_structure)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"preset": preset, "created": created}
+
+@app.delete("/api/v1/presets/{name}")
+async def api_delete_preset(request: Request, name: str):
+    user = api_user(request)
+    if not await dashboard_store.delete_preset(user["id"], name, default_user_file_structure):
+        raise HTTPException(status_code=404, detail="preset not found")
+    return {"deleted": name}
+
 @app.get("/logout")
 async def logout(request: Request):
     request.session.clear()
-    return RedirectResponse(url="/")
+    await oauth.forget(request.cookies.get(REMEMBER_COOKIE))
+    response = RedirectResponse(url="/")
+    response.delete_cookie(REMEMBER_COOKIE)
+    return response
+
+async def metrics(request: Request):
+    # Authorization: Bearer <METRICS_TOKEN>
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip(), METRICS_TOKEN):
+        return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    body = registry.render()
+    workers = []
+    if METRICS_PORT:
+        # كل الـ workers في نفس الوقت، وكل sample بياخد worker="رقمه"
+        texts = await asyncio.gather(*(scrape_bot(url) for url in BOT_METRICS_URLS))
+        workers = [(str(index), text) for index, text in enumerate(texts)]
+        body += merge_expositions([(index, text) for index, text in workers if text is not None])
+    body += "# HELP sienna_bot_up Whether the bot metrics endpoint answered\n# TYPE sienna_bot_up gauge\n"
+    body += "".join(f'sienna_bot_up{{worker="{index}"}} {int(text is not None)}\n' for index, text in workers)
+    return Response(content=body, media_type=CONTENT_TYPE)
+
+async def scrape_bot(url):
+    try:
+        res = await bot_metrics_client.get(url)
+    except httpx.HTTPError:
+        return None
+    return res.text if res.status_code == 200 else None
+
+# the bot's internals are not public: the route only exists when a token is configured
+if METRICS_TOKEN:
+    app.get("/metrics")(metrics)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,130 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+# عدد أبعاد الـ vector (الـ n-grams بتتعمل hash جواه)
+MEMORY_DIM = int(os.getenv("MEMORY_DIM", "512"))
+# أقصى عدد رسائل قديمة بتتضاف للـ prompt
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "2"))
+# أقل تشابه (cosine) عشان الرسالة القديمة تتحسب ليها علاقة
+MEMORY_MIN_SCORE = float(os.getenv("MEMORY_MIN_SCORE", "0.2"))
+
+_TASHKEEL = re.compile("[\u064b-\u0652\u0640]")
+_ARABIC_FOLD = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ة": "ه", "ى": "ي", "ؤ": "و", "ئ": "ي"})
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """توحيد الكتابة عشان (أحبك/احبك) و(مدرسة/مدرسه) يطلعوا نفس الحاجة."""
+    return _TASHKEEL.sub("", text.lower()).translate(_ARABIC_FOLD)
+
+
+def _features(text):
+    for word in _WORD.findall(normalize(text)):
+        yield "w:" + word
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+def embed(text, dim=MEMORY_DIM):
+    """
+    hashed n-grams: كل كلمة وكل 3 حروف منها بيتعمل لهم hash لخانة في vector ثابت الطول.
+    بيشتغل مع العربي والإنجليزي من غير tokenizer أو خدمة embeddings.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in _features(text):
+        vector[zlib.crc32(feature.encode("utf-8")) % dim] += 1.0
+    np.log1p(vector, out=vector)  # tf لوغاريتمي عشان كلمة متكررة متغطيش على الباقي
+    return vector
+
+
+class MemoryIndex:
+    """
+    فهرس رسائل مستخدم واحد: vector لكل رسالة + عدد الرسائل اللي فيها كل خانة (للـ idf).
+    الإضافة بتحدث الاتنين على طول من غير ما نعيد بناء حاجة.
+    """
+
+    def __init__(self, dim=MEMORY_DIM, capacity=None):
+        self.dim = dim
+        self.capacity = capacity
+        self.turns = []
+        self.vectors = np.zeros((8, dim), dtype=np.float16)
+        self.df = np.zeros(dim, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.turns)
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes + self.df.nbytes
+
+    def add(self, turn):
+        content = turn.get("content") if isinstance(turn, dict) else None
+        if not content:
+            return
+        vector = embed(content, self.dim)
+        if self.capacity and len(self.turns) >= self.capacity:
+            # أقدم رسالة بتخرج
+            self.df -= self.vectors[0] > 0
+            self.vectors[:len(self.turns) - 1] = self.vectors[1:len(self.turns)]
+            self.turns.pop(0)
+        n = len(self.turns)
+        if n == len(self.vectors):
+            grown = np.zeros((n * 2, self.dim), dtype=np.float16)
+            grown[:n] = self.vectors
+            self.vectors = grown
+        self.vectors[n] = vector
+        self.df += vector > 0
+        self.turns.append(turn)
+
+    def search(self, text, k=MEMORY_TOP_K, skip_recent=0, min_score=MEMORY_MIN_SCORE):
+        """أقرب k رسائل لـ text (من غير آخر skip_recent رسالة) بالترتيب الزمني."""
+        n = len(self.turns) - skip_recent
+        if n <= 0 or k <= 0:
+            return []
+        idf = np.log((1 + len(self.turns)) / (1 + self.df)).astype(np.float32) + 1.0
+        query = embed(text, self.dim) * idf
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+        matrix = self.vectors[:n].astype(np.float32) * idf
+        norms = np.linalg.norm(matrix, axis=1)
+        norms[norms == 0] = 1.0
+        scores = matrix @ query / (norms * query_norm)
+        top = np.argsort(scores)[::-1][:k]
+        return [self.turns[i] for i in sorted(int(i) for i in top if scores[i] >= min_score)]
+
+
+class UserMemory:
+    """فهرس لكل مستخدم محمل في الذاكرة (بيتشال معاه)."""
+
+    def __init__(self, dim=MEMORY_DIM, capacity=None):
+        self.dim = dim
+        self.capacity = capacity
+        self.indexes = {}
+
+    def load(self, user_id, turns):
+        index = MemoryIndex(self.dim, self.capacity)
+        for turn in turns or []:
+            index.add(turn)
+        self.indexes[str(user_id)] = index
+
+    def add(self, user_id, turn):
+        index = self.indexes.get(str(user_id))
+        if index is None:
+            index = self.indexes[str(user_id)] = MemoryIndex(self.dim, self.capacity)
+        index.add(turn)
+
+    def search(self, user_id, text, k=MEMORY_TOP_K, skip_recent=0):
+        index = self.indexes.get(str(user_id))
+        return index.search(text, k, skip_recent) if index is not None else []
+
+    def nbytes(self, user_id):
+        index = self.indexes.get(str(user_id))
+        return index.nbytes if index is not None else 0
+
+    def forget(self, user_id):
+        self.indexes.pop(str(user_id), None)
@@ -0,0 +1,258 @@
+import os
+import time
+import asyncio
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# البوت بيعرض /metrics على العنوان ده (0 = مقفول)، والموقع بيجيبها منه ويضيفها لـ /metrics بتاعته
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# /metrics بتاعة الموقع عامة على الإنترنت: مش بتتفتح غير لو التوكن ده متحدد
+# (Prometheus: authorization: {credentials: ...} أو bearer_token)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# كل قد إيه نقيس تأخير الـ event loop
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+
+# بالثواني، من 5ms لحد دقيقة (طلبات الذكاء الاصطناعي ممكن تطول)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in list(self.values.items()):
+            yield self.name, key, value
+
+
+class Gauge:
+    """
+    قيمة بتطلع وتنزل. read (لو متبعتة) بتتنده وقت العرض بس،
+    فحاجات زي عدد المستخدمين المحملين مش محتاجة تتحدث في كل مكان بتتغير فيه.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read=None):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.read is not None:
+            try:
+                yield self.name, (), self.read()
+            except Exception:
+                pass
+        for key, value in list(self.values.items()):
+            yield self.name, key, value
+
+
+class Histogram:
+    """توزيع الأوقات على buckets ثابتة زي Prometheus (كل bucket فيه اللي أقل من أو يساوي حده)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # labels -> [عدد كل bucket و+Inf، المجموع]
+        # الكتابة على الديسك بتتقاس جوه threads
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        bounds = self.buckets + (float("inf"),)
+        with self._lock:
+            snapshot = [(key, list(counts), total) for key, (counts, total) in self.series.items()]
+        for key, counts, total in snapshot:
+            running = 0
+            for bound, count in zip(bounds, counts):
+                running += count
+                yield self.name + "_bucket", key + (("le", _format_value(float(bound))),), running
+            yield self.name + "_sum", key, total
+            yield self.name + "_count", key, running
+
+
+class Registry:
+    """
+    كل المقاييس بتاعة البروسيس. نفس الاسم مرتين بيرجع نفس المقياس،
+    فأكتر من module ممكن يسجل في نفس الـ histogram (مثلاً الكتابة على الديسك).
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, cls, name, help, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name, help):
+        return self._register(Counter, name, help)
+
+    def gauge(self, name, help, read=None):
+        return self._register(Gauge, name, help, read=read)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, buckets=buckets)
+
+    def render(self):
+        """النص بصيغة Prometheus."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def merge_expositions(bodies, label="worker"):
+    """
+    نصوص /metrics من كذا بروسيس (كل worker بنفس الأسماء) -> نص واحد.
+    [(قيمة الـ label، النص)]: كل sample بياخد label="قيمة" عشان ميتلخبطوش مع بعض،
+    وكل مقياس بيتكتب مرة واحدة (HELP/TYPE) وتحته samples كل البروسيسات (Prometheus مش بيقبل غير كده).
+    """
+    families = {}  # الاسم -> [سطور HELP/TYPE، samples] بترتيب أول ظهور
+    for value, text in bodies:
+        family = None
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ("HELP", "TYPE"):
+                    family = families.setdefault(parts[2], [{}, []])
+                    family[0].setdefault(parts[1], line)
+                continue
+            name, sep, rest = line.partition("{")
+            tag = f'{label}="{_escape(value)}"'
+            if sep:
+                sample = f"{name}{{{tag},{rest}"
+            else:
+                name, _, rest = line.partition(" ")
+                sample = f"{name}{{{tag}}} {rest}"
+            if family is None:
+                family = families.setdefault(name, [{}, []])
+            family[1].append(sample)
+    lines = []
+    for header, samples in families.values():
+        lines.extend(header[kind] for kind in ("HELP", "TYPE") if kind in header)
+        lines.extend(samples)
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class LoopLagMonitor:
+    """
+    بينام interval ويشوف صحي متأخر قد إيه: التأخير ده هو الوقت اللي الـ loop
+    كان مشغول فيه بكود مش بيعمل await (json كبير، لفة على كل المستخدمين...).
+    """
+
+    def __init__(self, prefix, interval=LOOP_LAG_INTERVAL, registry=registry):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.histogram = registry.histogram(
+            f"{prefix}_event_loop_lag_seconds", "Event loop lag measured by a sleeping probe",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+        )
+        registry.gauge(f"{prefix}_event_loop_lag_max_seconds", "Worst event loop lag since start",
+                       read=lambda: self.max)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.histogram.observe(lag)
+
+
+async def serve_metrics(host=METRICS_HOST, port=METRICS_PORT, registry=registry):
+    """
+    سيرفر aiohttp صغير جوه البوت بيرد على GET /metrics.
+    بيرجع الـ runner (عشان cleanup) أو None لو مقفول أو البورت مشغول.
+    """
+    if not port:
+        return None
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        print(f"⚠️ مقدرتش أفتح /metrics على {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    print(f"📈 المقاييس على http://{host}:{port}/metrics")
+    return runner
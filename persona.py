@@ -0,0 +1,117 @@
+import json
+import hashlib
+from collections import OrderedDict
+
+DEFAULT_TRAITS = {"curiosity": 50, "sensitivity": 50, "happiness": 50, "sadness": 20,
+                  "boldness": 50, "kindness": 50, "shyness": 20, "intelligence": 80}
+
+TRAIT_NAMES = {
+    "curiosity": "فضول", "sensitivity": "حساسية", "happiness": "سعادة", "sadness": "حزن",
+    "boldness": "جرأة", "kindness": "طيبة", "shyness": "خجل", "intelligence": "ذكاء",
+}
+
+# (لو الصفة قليلة، لو عالية) — الوسط مش محتاج وصف
+TRAIT_PHRASES = {
+    "curiosity": ("مش بتسألي كتير", "بتسألي كتير عن تفاصيل حياته"),
+    "sensitivity": ("مش بتاخدي الكلام على أعصابك", "بتتأثري بسرعة من الكلام"),
+    "happiness": ("مش بتضحكي بسهولة", "مزاجك غالباً حلو وبتهزري"),
+    "sadness": ("نادراً ما بتحزني", "فيكي حزن وبتميلي للكآبة أحياناً"),
+    "boldness": ("بتتجنبي المواجهة", "صريحة وجريئة في رأيك"),
+    "kindness": ("ناشفة شوية وردودك حادة", "حنينة وبتطبطبي"),
+    "shyness": ("مش بتتكسفي خالص", "بتتكسفي وردودك فيها تردد"),
+    "intelligence": ("بسيطة في كلامك", "ردودك ذكية وعميقة"),
+}
+
+LOW_TRAIT = 35
+HIGH_TRAIT = 65
+
+LANGUAGE_LINES = {
+    "en": "ردي بالإنجليزي دايماً.",
+}
+
+
+def _clamp(value, default):
+    try:
+        return max(0, min(100, int(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def persona_settings(data):
+    """الإعدادات اللي بتأثر على الـ system prompt بس (بعد توحيدها)."""
+    traits = data.get("traits") or {}
+    return {
+        "bot_name": data.get("bot_name") or "Sienna",
+        "traits": {k: _clamp(traits.get(k, v), v) for k, v in DEFAULT_TRAITS.items()},
+        "language": data.get("language") or "ar",
+        "sex_mode": bool(data.get("sex_mode")),
+    }
+
+
+def persona_key(settings):
+    raw = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def compile_persona(settings):
+    traits = settings["traits"]
+    prompt = f"أنت {settings['bot_name']} بنت مصرية عادية 20-22 سنة. شخصيتك حقيقية. "
+    prompt += "(الشخصية: " + "، ".join(f"{TRAIT_NAMES[k]} {traits[k]}%" for k in DEFAULT_TRAITS) + ") "
+
+    described = []
+    for key, (low, high) in TRAIT_PHRASES.items():
+        if traits[key] <= LOW_TRAIT:
+            described.append(low)
+        elif traits[key] >= HIGH_TRAIT:
+            described.append(high)
+    if described:
+        prompt += "، ".join(described) + ". "
+
+    prompt += "بتزعلي بتفرحي بتضايقي بتغيري مزاجك حسب الكلام. استخدمي إيموجي واحد بس (😭 أو 🤭 أو 🤤). محترمه من غير سكس. ردي بذكاء."
+
+    language_line = LANGUAGE_LINES.get(settings["language"])
+    if language_line:
+        prompt += " " + language_line
+
+    if settings["sex_mode"]:
+        prompt += " الآن في وضع سكس كوني جريئة جدًا وصريحة فاحشة ووصفي بالتفصيل."
+    return prompt
+
+
+class PersonaCompiler:
+    """
+    الـ system prompt بيتبني مرة واحدة لكل مجموعة إعدادات ويتخزن بـ hash بتاعها.
+    أي تغيير من الموقع (اسم، صفات، لغة، وضع) بيطلع hash جديد فالنسخة القديمة
+    مبتتستخدمش تاني وبتخرج من الكاش لوحدها.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.prompts = OrderedDict()  # hash -> prompt
+        self.user_keys = {}  # user_id -> (الإعدادات، hash) آخر مرة
+        self.stats = {"hits": 0, "compiles": 0}
+
+    def system_prompt(self, user_id, data):
+        settings = persona_settings(data)
+        cached = self.user_keys.get(user_id)
+        if cached is not None and cached[0] == settings:
+            key = cached[1]
+        else:
+            key = persona_key(settings)
+            self.user_keys[user_id] = (settings, key)
+
+        prompt = self.prompts.get(key)
+        if prompt is not None:
+            self.prompts.move_to_end(key)
+            self.stats["hits"] += 1
+            return prompt
+
+        prompt = compile_persona(settings)
+        self.prompts[key] = prompt
+        self.stats["compiles"] += 1
+        while len(self.prompts) > self.max_entries:
+            self.prompts.popitem(last=False)
+        return prompt
+
+    def forget(self, user_id):
+        self.user_keys.pop(user_id, None)
@@ -0,0 +1,241 @@
+import os
+import math
+import asyncio
+
+# أقصى عدد tokens للـ prompt كله (من غير الرد)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+# أقصى عدد رسائل أخيرة في الـ prompt
+PROMPT_RECENT_TURNS = int(os.getenv("PROMPT_RECENT_TURNS", "6"))
+# cache: الثابت الأول والمتغير في الآخر عشان كاش المزود يشتغل. classic: الترتيب القديم
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "cache")
+# في وضع cache أول رسالة في الشباك بتفضل ثابتة لحد ما الشباك يوصل للعدد ده
+PROMPT_MAX_TURNS = int(os.getenv("PROMPT_MAX_TURNS", "12"))
+# الملخص بيتحدث أول ما يتجمع العدد ده من الرسائل اللي خرجت برا الرسائل الأخيرة
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "10"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "200"))
+
+MESSAGE_OVERHEAD = 4  # role والفواصل لكل رسالة
+
+SUMMARY_INSTRUCTIONS = (
+    "لخص المحادثة دي في فقرة قصيرة بنفس لغتها: أهم المعلومات عن المستخدم "
+    "(اسمه، اهتماماته، مشاكله، حاجات وعدته بيها) واللي اتكلمتوا فيه. "
+    "لو في ملخص قديم ادمجه مع الجديد. من غير مقدمات."
+)
+
+
+def estimate_tokens(text):
+    """
+    تقدير تقريبي محلي من غير tokenizer: الإنجليزي حوالي 4 حروف للـ token،
+    والعربي والإيموجي أغلى (حوالي حرفين للـ token).
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+
+def message_tokens(message):
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text, tokens):
+    """قص النص من الآخر لحد ما ييجي في tokens."""
+    if estimate_tokens(text) <= tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) < tokens:  # مكان للـ "…"
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + "…"
+
+
+def turn_key(turn):
+    return (turn.get("role"), turn.get("time"), turn.get("content", "")[:32])
+
+
+def _as_message(turn):
+    # الـ API محتاج role و content بس
+    return {"role": turn.get("role", "user"), "content": turn.get("content", "")}
+
+
+def build_prompt(system_prompt, history, memories=(), summary=None,
+                 budget=PROMPT_TOKEN_BUDGET, recent_turns=PROMPT_RECENT_TURNS):
+    """
+    بيملا الـ budget بالأولوية: الـ system prompt، الرسائل الأخيرة (من الأحدث)،
+    الذكريات القديمة، وبعدين ملخص المحادثة اللي فاتت.
+    آخر رسالة في history (رسالة المستخدم الحالية) بتدخل دايماً وبتتقص لو أطول من المتاح.
+    بيرجع (messages, عدد الـ tokens التقريبي).
+    """
+    system = {"role": "system", "content": system_prompt}
+    used = message_tokens(system)
+
+    recent = []
+    window = list(history[-recent_turns:]) if recent_turns > 0 else []
+    for i, turn in enumerate(reversed(window)):
+        message = _as_message(turn)
+        cost = message_tokens(message)
+        if used + cost > budget:
+            if i > 0:
+                break
+            message["content"] = truncate_to_tokens(message["content"], max(0, budget - used - MESSAGE_OVERHEAD))
+            cost = message_tokens(message)
+        recent.append(message)
+        used += cost
+    recent.reverse()
+
+    recalled = []
+    in_window = {id(turn) for turn in window}
+    for turn in memories:
+        if id(turn) in in_window:
+            continue
+        message = _as_message(turn)
+        cost = message_tokens(message)
+        if used + cost > budget:
+            continue
+        recalled.append(message)
+        used += cost
+
+    if summary:
+        note = f"\nملخص كلامكم اللي فات: {summary}"
+        cost = estimate_tokens(note)
+        if used + cost <= budget:
+            system["content"] += note
+            used += cost
+
+    return [system] + recalled + recent, used
+
+
+def window_turns(history, anchor):
+    """
+    عدد الرسائل اللي شباك build_cached_prompt بيبعتها فعلاً (من الـ anchor لآخر رسالة)،
+    عشان الملخص ميلخصش رسائل لسه موجودة بنصها في الشباك.
+    """
+    if anchor is not None:
+        for i in range(len(history) - 2, -1, -1):
+            if isinstance(history[i], dict) and turn_key(history[i]) == anchor:
+                return len(history) - i
+    # مفيش anchor = رسالة المستخدم الحالية بس
+    return min(1, len(history))
+
+
+def build_cached_prompt(system_prompt, history, memories=(), summary=None, anchor=None,
+                        budget=PROMPT_TOKEN_BUDGET, recent_turns=PROMPT_RECENT_TURNS, max_turns=PROMPT_MAX_TURNS):
+    """
+    ترتيب مناسب لكاش المزود (prefix cache): الـ system والملخص الأول (ثابتين بين الطلبات)،
+    بعدين الرسائل من anchor ثابت، والذكريات ورسالة المستخدم الحالية في الآخر.
+    الشباك مش بيتزحلق مع كل رسالة: بيبدأ من نفس الرسالة (anchor) وبيكبر لحد max_turns
+    وبعدين بيقفز مرة واحدة لآخر recent_turns، فأغلب الطلبات بتبدأ بنفس البايتات بالظبط.
+    بيرجع (messages, عدد الـ tokens التقريبي، anchor الجديد).
+    """
+    content = system_prompt
+    if summary:
+        content += f"\nملخص كلامكم اللي فات: {summary}"
+    system = {"role": "system", "content": content}
+    used = message_tokens(system)
+
+    history = list(history)
+    current = _as_message(history[-1]) if history else None
+    past = history[:-1]
+
+    keys = [turn_key(t) for t in past]
+    start = keys.index(anchor) if anchor in keys else None
+    if start is None or len(past) - start > max_turns:
+        start = max(0, len(past) - max(0, recent_turns - 1))
+
+    if current is not None:
+        room = max(0, budget - used - MESSAGE_OVERHEAD)
+        current["content"] = truncate_to_tokens(current["content"], room)
+        used += message_tokens(current)
+
+    window = [_as_message(t) for t in past[start:]]
+    cost = sum(message_tokens(m) for m in window)
+    while window and used + cost > budget:
+        # مفيش مكان: نقص من أول الشباك (الـ prefix هيتغير المرة دي بس)
+        cost -= message_tokens(window.pop(0))
+        start += 1
+    used += cost
+
+    # الذكريات في رسالة system واحدة قبل رسالة المستخدم (عشان متلخبطش ترتيب المحادثة)
+    lines = []
+    in_window = set(keys[start:])
+    for turn in memories:
+        if turn_key(turn) in in_window or (history and turn is history[-1]):
+            continue
+        line = f"- {turn.get('role')}: {turn.get('content', '')}"
+        cost = estimate_tokens(line) + 1
+        if used + MESSAGE_OVERHEAD + cost > budget:
+            continue
+        lines.append(line)
+        used += cost
+    recalled = []
+    if lines:
+        recalled.append({"role": "system", "content": "من كلامكم القديم:\n" + "\n".join(lines)})
+        used += MESSAGE_OVERHEAD + estimate_tokens("من كلامكم القديم:")
+
+    new_anchor = keys[start] if start < len(keys) else None
+    messages = [system] + window + recalled
+    if current is not None:
+        messages.append(current)
+    return messages, used, new_anchor
+
+
+class RollingSummarizer:
+    """
+    ملخص متجدد لكل مستخدم للرسائل اللي خرجت برا الرسائل الأخيرة.
+    التحديث بيحصل في task في الخلفية بعد ما يتجمع SUMMARY_BATCH رسالة،
+    فالرد نفسه عمره ما بيستنى الملخص.
+
+    complete(user_id, messages, max_tokens) -> نص الملخص
+    on_update(user_id, summary, until)   (until = وقت آخر رسالة اتلخصت)
+    """
+
+    def __init__(self, complete, on_update, batch=SUMMARY_BATCH, max_tokens=SUMMARY_MAX_TOKENS):
+        self.complete = complete
+        self.on_update = on_update
+        self.batch = batch
+        self.max_tokens = max_tokens
+        self.running = {}  # user_id -> task الملخص الشغال
+        self.stats = {"refreshes": 0, "errors": 0}
+
+    def pending_turns(self, history, until, recent_turns=PROMPT_RECENT_TURNS):
+        older = history[:-recent_turns] if recent_turns > 0 else list(history)
+        return [t for t in older if isinstance(t, dict) and t.get("time", "") > (until or "")]
+
+    def maybe_refresh(self, user_id, state, history, recent_turns=PROMPT_RECENT_TURNS):
+        """state: القاموس اللي فيه summary و summary_until للمستخدم."""
+        uid = str(user_id)
+        if uid in self.running:
+            return False
+        turns = self.pending_turns(history, state.get("summary_until"), recent_turns)
+        if len(turns) < self.batch:
+            return False
+        self.running[uid] = asyncio.get_running_loop().create_task(self._refresh(uid, state.get("summary"), turns))
+        return True
+
+    def cancel(self, user_id):
+        """الغي الملخص الشغال للمستخدم (اتمسح مثلاً) عشان on_update متتندهش بعده."""
+        task = self.running.pop(str(user_id), None)
+        if task is not None:
+            task.cancel()
+
+    async def _refresh(self, uid, previous, turns):
+        try:
+            transcript = "\n".join(f"{t.get('role')}: {t.get('content', '')}" for t in turns)
+            if previous:
+                transcript = f"الملخص القديم: {previous}\n\n{transcript}"
+            summary = await self.complete(uid, [
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": transcript},
+            ], self.max_tokens)
+            if summary:
+                self.on_update(uid, summary.strip(), turns[-1].get("time", ""))
+                self.stats["refreshes"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ خطأ في تحديث ملخص المحادثة للمستخدم {uid}: {e}")
+        finally:
+            if self.running.get(uid) is asyncio.current_task():
+                del self.running[uid]
@@ -0,0 +1,65 @@
+import re
+import random
+
+QUICK_RESPONSES = {
+    "ar": {
+        "مرحبا": ["أهلاً وسهلاً! 😊", "مرحباً بك! 🌟", "أهلين! 💫", "أهلاً بك يا صديقي! 🎉"],
+        "كيف حالك": ["تمام والحمدلله! 🙏", "بخير شكراً لك! 😄", "كويسة، وأنت؟ 💖", "أنا بخير، شكراً لسؤالك! 🌸"],
+        "احبك": ["💖 وأنت عزيز!", "أنا بحبك كمان يا غالي! 🌹", "💕 شكراً لك!", "أنت رائع! 😍"],
+        "باي": ["مع السلامة! 👋", "أشوفك بعدين! ✨", "باي، أراك قريباً! 💫", "وداعاً! 🌙"],
+        "شكرا": ["العفو! 😊", "على الرحب والسعة! 🌟", "دي فرحتي! 💖", "أنت تستاهل! 🎁"],
+        "صباح الخير": ["صباح النور! ☀️", "صباحك سعيد! 🌸", "صباح الخير يا جميل! 🌅"],
+        "مساء الخير": ["مساء النور! 🌙", "مسائك سعيد! ✨", "مساء الخير والعافية! 🌹"],
+    },
+    "en": {
+        "hi": ["Hello! 😊", "Hi there! 🌟", "Hey! 💫", "Hi, nice to see you! 🎉"],
+        "hello": ["Hello! 😊", "Hi there! 🌟", "Hey! 💫", "Hi, nice to see you! 🎉"],
+        "how are you": ["I'm good, thanks! 🙏", "Doing well! 😄", "Great, and you? 💖", "I'm fine, thank you! 🌸"],
+        "i love you": ["💖 You're sweet!", "Love you too! 🌹", "💕 Thank you!", "You're amazing! 😍"],
+        "bye": ["Goodbye! 👋", "See you later! ✨", "Bye, see you soon! 💫", "Farewell! 🌙"],
+        "thank you": ["You're welcome! 😊", "My pleasure! 🌟", "Anytime! 💖", "You deserve it! 🎁"],
+        "good morning": ["Good morning! ☀️", "Morning sunshine! 🌸", "Have a great morning! 🌅"],
+        "good evening": ["Good evening! 🌙", "Evening! ✨", "Have a lovely evening! 🌹"],
+    }
+}
+
+
+class QuickReplyMatcher:
+    """
+    الكلمات والردود بتتجهز مرة واحدة لكل لغة وقت الـ import.
+    regex واحد متجمع من كل الكلمات بيرفض الرسائل اللي مفيهاش ولا كلمة (أغلب الرسائل)
+    في لفة واحدة على النص، ولو في تطابق بنرجع أول كلمة بالترتيب زي الطريقة القديمة بالظبط.
+    """
+
+    def __init__(self, table=QUICK_RESPONSES):
+        self.keys = {}
+        self.responses = {}
+        self.patterns = {}
+        for lang, entries in table.items():
+            keys = tuple(entries)
+            self.keys[lang] = keys
+            self.responses[lang] = tuple(tuple(entries[k]) for k in keys)
+            self.patterns[lang] = re.compile("|".join(re.escape(k) for k in keys))
+
+    def match_index(self, message, lang):
+        pattern = self.patterns.get(lang)
+        if pattern is None:
+            return None
+        message_lower = message.lower()
+        if pattern.search(message_lower) is None:
+            return None
+        for index, key in enumerate(self.keys[lang]):
+            if key in message_lower:
+                return index
+        return None
+
+    def match(self, message, lang):
+        index = self.match_index(message, lang)
+        return None if index is None else self.keys[lang][index]
+
+    def reply(self, message, lang):
+        index = self.match_index(message, lang)
+        return None if index is None else random.choice(self.responses[lang][index])
+
+
+quick_replies = QuickReplyMatcher()
@@ -0,0 +1,142 @@
+import os
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+# المنطقة الزمنية لو المستخدم ما اختارش (فاضية = توقيت السيرفر زي الأول)
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "")
+
+REPEAT_WORDS = {"daily": "daily", "يومي": "daily", "يوميا": "daily", "يومياً": "daily", "everyday": "daily"}
+
+
+def get_zone(name=None):
+    """ZoneInfo من الاسم (مثلاً Africa/Cairo)، أو توقيت السيرفر. بترجع None لو الاسم غلط."""
+    name = name or DEFAULT_TIMEZONE
+    if not name:
+        return datetime.now().astimezone().tzinfo
+    if ZoneInfo is None:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def next_occurrence(hhmm, tz, after):
+    """أول مرة الساعة تبقى hhmm في المنطقة tz بعد after (datetime بتوقيت)."""
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    local = after.astimezone(tz)
+    due = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due <= local:
+        due += timedelta(days=1)
+    return due.astimezone(timezone.utc)
+
+
+def reminder_due(reminder, tz):
+    """ميعاد التذكير الجاي (UTC). التذكيرات القديمة من غير due_at بتتحسب من وقت إنشائها."""
+    due_at = reminder.get("due_at")
+    if due_at:
+        return datetime.fromisoformat(due_at)
+    created = reminder.get("created_at")
+    try:
+        created = datetime.fromisoformat(created)
+        if created.tzinfo is None:
+            created = created.astimezone()
+    except (TypeError, ValueError):
+        created = datetime.now(timezone.utc)
+    return next_occurrence(reminder.get("time", "00:00"), tz, created)
+
+
+def compact_reminder(reminder):
+    """اللي الجدولة محتاجاه بس (بيتحفظ في فهرس المستخدمين)."""
+    return {k: reminder.get(k) for k in ("id", "time", "due_at", "repeat", "tz")}
+
+
+class ReminderScheduler:
+    """
+    جدولة التذكيرات بـ min-heap حسب الميعاد: المهمة بتنام لحد أقرب تذكير بالظبط
+    بدل ما تصحى كل دقيقة وتلف على كل المستخدمين. التذكير اللي ميعاده فات
+    (البوت كان واقف مثلاً) بيتبعت متأخر بدل ما يضيع.
+    """
+
+    def __init__(self):
+        self.heap = []  # (الميعاد timestamp، رقم، المستخدم، رقم التذكير)
+        self.entries = {}  # (المستخدم، رقم التذكير) -> الميعاد الحالي
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self.stats = {"fired": 0, "late": 0, "max_late_s": 0.0}
+
+    def schedule(self, user_id, reminder, tz=None):
+        """ضيف أو حرك تذكير. بيرجع الميعاد (UTC)."""
+        tz = tz or get_zone(reminder.get("tz"))
+        due = reminder_due(reminder, tz)
+        key = (str(user_id), reminder.get("id"))
+        self.entries[key] = due.timestamp()
+        heapq.heappush(self.heap, (due.timestamp(), next(self._seq), key[0], key[1]))
+        self._wakeup.set()
+        return due
+
+    def cancel(self, user_id, reminder_id):
+        # بيتشال من الـ heap لما ييجي دوره (lazy delete)
+        self.entries.pop((str(user_id), reminder_id), None)
+
+    def cancel_user(self, user_id):
+        uid = str(user_id)
+        for key in [k for k in self.entries if k[0] == uid]:
+            del self.entries[key]
+
+    def next_due(self, user_id, reminder_id):
+        ts = self.entries.get((str(user_id), reminder_id))
+        return datetime.fromtimestamp(ts, timezone.utc) if ts is not None else None
+
+    def rebuild(self, users):
+        """users: [(user_id, [تذكيرات]), ...] من التخزين وقت التشغيل."""
+        self.heap, self.entries = [], {}
+        for user_id, reminders in users:
+            for reminder in reminders or []:
+                try:
+                    self.schedule(user_id, reminder)
+                except Exception as e:
+                    print(f"⚠️ تذكير غير صالح للمستخدم {user_id}: {e}")
+        return len(self.entries)
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            ts, _, uid, rid = heapq.heappop(self.heap)
+            if self.entries.get((uid, rid)) != ts:
+                continue  # اتلغى أو اتحرك
+            del self.entries[(uid, rid)]
+            due.append((uid, rid, ts))
+        return due
+
+    async def run(self, fire):
+        """fire(user_id, reminder_id, late_seconds) بتتنده لكل تذكير جه ميعاده."""
+        while True:
+            self._wakeup.clear()
+            now = datetime.now(timezone.utc).timestamp()
+            for uid, rid, ts in self._pop_due(now):
+                late = max(0.0, now - ts)
+                self.stats["fired"] += 1
+                if late > 60:
+                    self.stats["late"] += 1
+                self.stats["max_late_s"] = max(self.stats["max_late_s"], late)
+                try:
+                    await fire(uid, rid, late)
+                except Exception as e:
+                    print(f"❌ خطأ في إرسال تذكير {rid} للمستخدم {uid}: {e}")
+
+            timeout = None
+            if self.heap:
+                timeout = max(0.0, self.heap[0][0] - datetime.now(timezone.utc).timestamp())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,235 @@
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+# الكوكي فيها رقم عشوائي بس، والجلسة نفسها (بروفايل Discord واللغة) على السيرفر
+SESSION_COOKIE = os.getenv("SESSION_COOKIE", "sienna_session")
+# كوكي SessionMiddleware القديمة (الجلسة كلها موقعة جوه الكوكي): بتتمسح من المتصفح
+LEGACY_SESSION_COOKIE = "session"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # memory | sqlite
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", str(14 * 24 * 3600)))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_DB = os.getenv("SESSION_DB", os.path.join("users_data", "sessions.db"))
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+def _hash(session_id):
+    # الرقم نفسه مش بيتخزن، عشان لو الداتابيز اتسربت الجلسات متتسرقش
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+
+class MemorySessionStore:
+    """
+    الجلسات في الذاكرة (LRU محدود). أسرع حاجة بس بتضيع مع الـ restart
+    ومش بتتشارك بين أكتر من بروسيس.
+    load/save/delete كلهم async عشان أي backend تاني يقدر يعمل I/O.
+    """
+
+    def __init__(self, max_age=SESSION_MAX_AGE, size=SESSION_CACHE_SIZE):
+        self.max_age = max_age
+        self.size = size
+        self.entries = OrderedDict()  # رقم الجلسة -> (وقت الانتهاء، الداتا)
+
+    def _get(self, session_id):
+        entry = self.entries.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            del self.entries[session_id]
+            return None
+        self.entries.move_to_end(session_id)
+        return entry
+
+    def _put(self, session_id, expires_at, data):
+        self.entries[session_id] = (expires_at, data)
+        self.entries.move_to_end(session_id)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    async def load(self, session_id):
+        """(الداتا، وقت الانتهاء) أو None لو الجلسة مش موجودة أو خلصت."""
+        entry = self._get(session_id)
+        return None if entry is None else (dict(entry[1]), entry[0])
+
+    async def save(self, session_id, data):
+        self._put(session_id, time.time() + self.max_age, dict(data))
+
+    async def delete(self, session_id):
+        self.entries.pop(session_id, None)
+
+    async def purge(self):
+        now = time.time()
+        expired = [sid for sid, entry in self.entries.items() if entry[0] < now]
+        for sid in expired:
+            del self.entries[sid]
+        return len(expired)
+
+
+class SQLiteSessionStore(MemorySessionStore):
+    """
+    الجلسات في SQLite (بتعيش بعد الـ restart) وكاش LRU في الذاكرة قدامها،
+    فالطلب العادي مش بيلمس الديسك. الكتابة بتحصل لما الجلسة تتغير بس، في thread.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id_hash TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+    """
+
+    def __init__(self, path=SESSION_DB, max_age=SESSION_MAX_AGE, size=SESSION_CACHE_SIZE):
+        super().__init__(max_age, size)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _read(self, session_id):
+        row = self._conn().execute(
+            "SELECT data, expires_at FROM sessions WHERE id_hash = ?", (_hash(session_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self._conn().execute("DELETE FROM sessions WHERE id_hash = ?", (_hash(session_id),))
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, session_id, data, expires_at):
+        self._conn().execute(
+            "INSERT INTO sessions (id_hash, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(id_hash) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (_hash(session_id), json.dumps(data, ensure_ascii=False), expires_at),
+        )
+
+    def _delete(self, session_id):
+        self._conn().execute("DELETE FROM sessions WHERE id_hash = ?", (_hash(session_id),))
+
+    def _purge(self):
+        return self._conn().execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
+
+    async def load(self, session_id):
+        entry = self._get(session_id)
+        if entry is None:
+            row = await asyncio.to_thread(self._read, session_id)
+            if row is None:
+                return None
+            self._put(session_id, row[1], row[0])
+            entry = (row[1], row[0])
+        return dict(entry[1]), entry[0]
+
+    async def save(self, session_id, data):
+        expires_at = time.time() + self.max_age
+        data = dict(data)
+        self._put(session_id, expires_at, data)
+        await asyncio.to_thread(self._write, session_id, data, expires_at)
+
+    async def delete(self, session_id):
+        self.entries.pop(session_id, None)
+        await asyncio.to_thread(self._delete, session_id)
+
+    async def purge(self):
+        await super().purge()
+        return await asyncio.to_thread(self._purge)
+
+
+def get_session_store(backend=None):
+    backend = (backend or SESSION_BACKEND).lower()
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"SESSION_BACKEND غير معروف: {backend}")
+
+
+class ServerSessionMiddleware:
+    """
+    بديل SessionMiddleware بتاع Starlette: request.session شغالة زي ما هي،
+    بس الكوكي فيها رقم الجلسة بس بدل الجلسة كلها موقعة (مفيش HMAC ولا base64 مع كل طلب).
+    - المسارات اللي في skip_paths (/static) مش بتقرا الجلسة خالص
+    - الجلسة بتتكتب لما تتغير بس، أو لما نص عمرها يعدي (عشان متخلصش على مستخدم نشط)
+    - session فاضية بعد ما كانت مليانة (logout) = الجلسة بتتمسح والكوكي كمان
+    - الدخول بحساب بياخد رقم جلسة جديد
+    """
+
+    def __init__(self, app, store, cookie=SESSION_COOKIE, max_age=SESSION_MAX_AGE,
+                 https_only=False, skip_paths=("/static",)):
+        self.app = app
+        self.store = store
+        self.cookie = cookie
+        self.max_age = max_age
+        self.skip_paths = tuple(skip_paths)
+        self.flags = "path=/; httponly; samesite=lax" + ("; secure" if https_only else "")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        if scope["path"].startswith(self.skip_paths):
+            scope["session"] = {}
+            await self.app(scope, receive, send)
+            return
+
+        cookies = HTTPConnection(scope).cookies
+        session_id = cookies.get(self.cookie)
+        loaded = await self.store.load(session_id) if session_id else None
+        if loaded is None:
+            session_id, original, expires_at = None, {}, 0
+        else:
+            original, expires_at = loaded
+        scope["session"] = copy.deepcopy(original)
+        legacy = LEGACY_SESSION_COOKIE in cookies
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                await self._commit(scope["session"], session_id, original, expires_at, legacy,
+                                   MutableHeaders(scope=message))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _commit(self, session, session_id, original, expires_at, legacy, headers):
+        if legacy:
+            headers.append("Set-Cookie", f"{LEGACY_SESSION_COOKIE}=null; expires=Thu, 01 Jan 1970 00:00:00 GMT; path=/")
+        if not session:
+            if session_id:
+                await self.store.delete(session_id)
+                headers.append("Set-Cookie", f"{self.cookie}=null; expires=Thu, 01 Jan 1970 00:00:00 GMT; {self.flags}")
+            return
+        if session_id and session == original and expires_at - time.time() > self.max_age / 2:
+            return
+        if session_id is not None and session.get("user") != original.get("user"):
+            # دخول أو تغيير حساب: رقم جديد، فرقم اتعرف قبل الدخول ميبقاش جلسة لحد
+            await self.store.delete(session_id)
+            session_id = None
+        if session_id is None:
+            session_id = new_session_id()
+        await self.store.save(session_id, session)
+        headers.append("Set-Cookie", f"{self.cookie}={session_id}; Max-Age={self.max_age}; {self.flags}")
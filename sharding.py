@@ -0,0 +1,57 @@
+import os
+
+from discord.ext import commands
+
+# عدد الـ shards الكلي: فاضي = بوت عادي بـ gateway واحد زي الأول، auto = Discord يحدد العدد
+SHARD_COUNT = os.getenv("SHARD_COUNT", "").strip()
+# الـ shards اللي البروسيس ده بيشغلها ("0,2,4")، فاضي = كلهم
+SHARD_IDS = os.getenv("SHARD_IDS", "").strip()
+# رقم الـ worker وعدد الـ workers (start.sh بيحددهم لما BOT_WORKERS > 1)
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = max(1, int(os.getenv("WORKER_COUNT", "1")))
+
+
+def parse_shard_ids(text):
+    if not text:
+        return None
+    return sorted({int(part) for part in text.replace(" ", "").split(",") if part})
+
+
+def shard_options(shard_count=SHARD_COUNT, shard_ids=SHARD_IDS):
+    """
+    رجع kwargs الـ AutoShardedBot أو None لو التقسيم مقفول.
+    shard_count=None مع AutoShardedBot معناها Discord يحدد العدد المقترح.
+    """
+    if not shard_count:
+        return None
+    ids = parse_shard_ids(shard_ids)
+    if shard_count == "auto":
+        if ids:
+            raise ValueError("SHARD_IDS محتاج SHARD_COUNT رقم مش auto")
+        return {"shard_count": None, "shard_ids": None}
+    count = int(shard_count)
+    if ids and (ids[0] < 0 or ids[-1] >= count):
+        raise ValueError(f"SHARD_IDS {ids} برة المدى 0..{count - 1}")
+    return {"shard_count": count, "shard_ids": ids}
+
+
+def owns_direct_messages(options):
+    """
+    Discord بيبعت كل الرسائل الخاصة على shard 0، فالـ worker اللي معاه shard 0
+    هو اللي بيرد على الخاص ويشغل التذكيرات ورسائل الغياب.
+    """
+    return options is None or not options["shard_ids"] or 0 in options["shard_ids"]
+
+
+def create_bot(**kwargs):
+    """commands.Bot زي الأول، أو AutoShardedBot لو SHARD_COUNT متحدد."""
+    options = SHARD_OPTIONS
+    if options is None:
+        return commands.Bot(**kwargs)
+    shards = options["shard_ids"] or "all"
+    print(f"🧩 worker {WORKER_INDEX + 1}/{WORKER_COUNT}: shards {shards} من {options['shard_count'] or 'auto'}")
+    return commands.AutoShardedBot(**options, **kwargs)
+
+
+SHARD_OPTIONS = shard_options()
+OWNS_DMS = owns_direct_messages(SHARD_OPTIONS)
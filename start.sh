@@ -4,11 +4,53 @@ echo "===================="
 echo "🚀 Starting AI Bot Services"
 echo "===================="
 
-# Start bot (with or without token)
-echo "🤖 Starting Discord Bot..."
-python bot.py &
-BOT_PID=$!
-echo "   Bot PID: $BOT_PID"
+# Bot workers: BOT_WORKERS=1 (default) runs one process like before.
+# BOT_WORKERS=N runs N processes with AutoShardedBot, SHARD_COUNT shards
+# (default N) split round-robin: worker i gets shards i, i+N, i+2N...
+# Discord sends every DM to shard 0, so worker 0 handles DMs/reminders.
+BOT_WORKERS=${BOT_WORKERS:-1}
+if ! [[ "$BOT_WORKERS" =~ ^[1-9][0-9]*$ ]]; then
+    echo "❌ BOT_WORKERS must be a positive integer, got '$BOT_WORKERS'"
+    exit 1
+fi
+# the web server scrapes /metrics from every worker (METRICS_PORT + index)
+export BOT_WORKERS
+
+run_worker() {
+    local index=$1
+    local shard_ids=""
+    if [ "$BOT_WORKERS" -gt 1 ]; then
+        local shard=$index
+        while [ "$shard" -lt "$SHARD_COUNT" ]; do
+            shard_ids="${shard_ids:+$shard_ids,}$shard"
+            shard=$((shard + BOT_WORKERS))
+        done
+    fi
+    # supervisor: restart the worker if it crashes
+    while true; do
+        WORKER_INDEX=$index WORKER_COUNT=$BOT_WORKERS SHARD_IDS=$shard_ids python bot.py
+        echo "⚠️ Bot worker $index exited with code $?, restarting in 5s..."
+        sleep 5
+    done
+}
+
+echo "🤖 Starting Discord Bot ($BOT_WORKERS worker(s))..."
+if [ "$BOT_WORKERS" -gt 1 ]; then
+    export SHARD_COUNT=${SHARD_COUNT:-$BOT_WORKERS}
+    # the shard ids are split here, so the total has to be a number (not auto)
+    if ! [[ "$SHARD_COUNT" =~ ^[1-9][0-9]*$ ]]; then
+        echo "❌ SHARD_COUNT must be a number when BOT_WORKERS > 1, got '$SHARD_COUNT'"
+        exit 1
+    fi
+    if [ "$SHARD_COUNT" -lt "$BOT_WORKERS" ]; then
+        echo "❌ SHARD_COUNT ($SHARD_COUNT) must be >= BOT_WORKERS ($BOT_WORKERS)"
+        exit 1
+    fi
+fi
+for ((i = 0; i < BOT_WORKERS; i++)); do
+    run_worker $i &
+    echo "   Bot worker $i PID: $!"
+done
 
 
 # Start web server
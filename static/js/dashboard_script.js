@@ -5,6 +5,8 @@
  * - "Create New" enables editing.
  * - IDs s1..s8 used for sliders.
  * - Click a preset: highlight it, switch to Characters tab, apply preset.
+ * - Saving goes through the JSON API (/api/v1): PATCH sends the fields, the server
+ *   writes only what changed and answers with that diff. No full page reload.
  */
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -64,6 +66,28 @@ document.addEventListener('DOMContentLoaded', () => {
     ];
 
     const presetsList = document.getElementById('presets-list');
+    const TRAITS = ['curiosity', 'sensitivity', 'intelligence', 'kindness', 'happiness', 'sadness', 'boldness', 'shyness'];
+    const isLockedName = (name) => characterPresets.some(p => p.locked && p.name.toLowerCase() === (name || '').toLowerCase());
+
+    // --- JSON API helper: resolves with the parsed body, rejects with the server's detail ---
+    const api = async (method, path, body) => {
+        const res = await fetch('/api/v1' + path, {
+            method,
+            credentials: 'same-origin',
+            headers: body === undefined ? {} : { 'Content-Type': 'application/json' },
+            body: body === undefined ? undefined : JSON.stringify(body)
+        });
+        const data = await res.json().catch(() => ({}));
+        if (!res.ok) {
+            const err = new Error(data.detail || res.statusText);
+            err.status = res.status;
+            throw err;
+        }
+        return data;
+    };
+
+    // last settings the server confirmed (filled from GET /api/v1/settings)
+    let saved = null;
 
     // Helper to enable/disable form inputs
     const setEditable = (editable) => {
@@ -123,20 +147,42 @@ document.addEventListener('DOMContentLoaded', () => {
         presetsList.querySelectorAll('.char-item').forEach(el => el.classList.remove('selected'));
     };
 
+    // built with textContent: custom preset names come from the user and must never be parsed as HTML
+    const el = (tag, className, text) => {
+        const node = document.createElement(tag);
+        node.className = className;
+        if (text !== undefined) node.textContent = text;
+        return node;
+    };
+
     // Load Presets into Sidebar (with selectable highlight)
-    if (presetsList) {
-        characterPresets.forEach(char => {
+    const addPresetButton = (char) => {
             const btn = document.createElement('button');
             btn.type = 'button';
             btn.dataset.name = char.name;
             btn.className = 'char-item w-full text-left p-4 rounded-2xl bg-white/5 border border-white/5 hover:border-purple-500/50 transition-all group flex justify-between items-center';
-            btn.innerHTML = `
-                <div>
-                    <p class="font-bold text-sm group-hover:text-purple-400 transition">${char.name}</p>
-                    <p class="text-[10px] text-gray-500 uppercase font-black tracking-tighter">${char.desc}</p>
-                </div>
-                <div class="text-xs ${char.locked ? 'text-yellow-300' : 'text-green-300'} font-black">${char.locked ? 'LOCKED' : 'CUSTOM'}</div>
-            `;
+            const info = el('div', '');
+            info.appendChild(el('p', 'font-bold text-sm group-hover:text-purple-400 transition', char.name));
+            info.appendChild(el('p', 'text-[10px] text-gray-500 uppercase font-black tracking-tighter', char.desc || ''));
+            const badge = el('div', `text-xs ${char.locked ? 'text-yellow-300' : 'text-green-300'} font-black`, char.locked ? 'LOCKED' : 'CUSTOM');
+            if (!char.locked) {
+                const x = el('span', 'preset-delete ml-2 text-red-400', '\u00d7');
+                x.title = 'Delete';
+                badge.appendChild(x);
+            }
+            btn.append(info, badge);
+            const del = btn.querySelector('.preset-delete');
+            if (del) {
+                del.addEventListener('click', async (e) => {
+                    e.stopPropagation();
+                    try {
+                        await api('DELETE', '/presets/' + encodeURIComponent(char.name));
+                        btn.remove();
+                    } catch (err) {
+                        showToast(false, err.message);
+                    }
+                });
+            }
             btn.addEventListener('click', (e) => {
                 // visual selection
                 clearPresetSelection();
@@ -147,8 +193,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 applyPreset(char);
             });
             presetsList.appendChild(btn);
+            return btn;
+    };
+
+    // custom presets come from the server: replace or append the sidebar entry
+    const showCustomPreset = (preset) => {
+        if (!presetsList) return;
+        presetsList.querySelectorAll('.char-item').forEach(el => {
+            if (el.dataset.name.toLowerCase() === preset.name.toLowerCase()) el.remove();
         });
-    }
+        addPresetButton(Object.assign({ desc: 'Custom' }, preset, { locked: false }));
+    };
+
+    if (presetsList) characterPresets.forEach(addPresetButton);
 
     // Create new character: reset fields and enable editing
     window.createNewChar = () => {
@@ -180,20 +237,127 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     // 5. --- Toast Notification Handler ---
+    let toastTimer = null;
+    const showToast = (ok = true, message = null) => {
+        const toast = document.getElementById('toast');
+        if (!toast) return;
+        const title = toast.querySelector('.font-bold');
+        const note = toast.querySelector('.text-gray-400');
+        if (title) title.innerText = ok ? 'Synchronized!' : 'Sync failed';
+        if (note) note.innerText = message || (ok ? 'Unit updated successfully.' : 'Please try again.');
+        toast.classList.toggle('border-green-500', ok);
+        toast.classList.toggle('border-red-500', !ok);
+        toast.style.transform = "translateX(0)";
+        document.querySelectorAll('.stat-card').forEach(card => {
+            card.classList.add('animate__animated', 'animate__pulse');
+        });
+        clearTimeout(toastTimer);
+        toastTimer = setTimeout(() => {
+            toast.style.transform = "translateX(200%)";
+        }, 4000);
+    };
+
     const urlParams = new URLSearchParams(window.location.search);
     if (urlParams.has('success')) {
-        const toast = document.getElementById('toast');
-        if (toast) {
-            toast.style.transform = "translateX(0)";
-            document.querySelectorAll('.stat-card').forEach(card => {
-                card.classList.add('animate__animated', 'animate__pulse');
+        showToast(true);
+        window.history.replaceState({}, document.title, window.location.pathname);
+    }
+
+
+    // 6. --- Saving through the JSON API ---
+    const charForm = document.querySelector('#sec-chars form');
+
+    const readForm = () => {
+        const traits = {};
+        TRAITS.forEach(field => {
+            const slider = document.querySelector(`input[type="range"][name="${field}"]`);
+            if (slider) traits[field] = parseInt(slider.value, 10);
+        });
+        const botName = document.getElementById('bot_name');
+        const lang = document.getElementById('lang');
+        const sexCb = document.querySelector('#sec-chars input[type="checkbox"][name="sex_mode"]');
+        return {
+            bot_name: (botName && botName.value.trim()) || 'Sienna',
+            language: lang ? lang.value : 'ar',
+            sex_mode: sexCb ? sexCb.checked : false,
+            traits
+        };
+    };
+
+    // PATCH the settings; a custom (non-locked) name is also kept as a preset, like /save did
+    const persist = async (patch) => {
+        const { changed } = await api('PATCH', '/settings', patch);
+        if (saved) {
+            Object.keys(changed).forEach(key => {
+                if (key === 'traits') Object.assign(saved.traits, changed.traits);
+                else saved[key] = changed[key];
             });
-            setTimeout(() => {
-                toast.style.transform = "translateX(200%)";
-                window.history.replaceState({}, document.title, window.location.pathname);
-            }, 4000);
         }
+        const name = saved ? saved.bot_name : patch.bot_name;
+        if ((patch.traits || patch.bot_name) && name && !isLockedName(name)) {
+            const { preset } = await api('PUT', '/presets/' + encodeURIComponent(name),
+                Object.assign({ name }, saved ? saved.traits : patch.traits));
+            showCustomPreset(preset);
+        }
+        return changed;
+    };
+
+    if (charForm) {
+        charForm.addEventListener('submit', async (e) => {
+            e.preventDefault();
+            try {
+                await persist(readForm());
+                showToast(true);
+            } catch (err) {
+                if (err.status) showToast(false, err.message);
+                else charForm.submit();  // network/API unavailable: plain form POST to /save
+            }
+        });
+    }
+
+    // slider released on the saved identity: send just the traits that moved
+    let pendingTraits = {};
+    let traitTimer = null;
+    document.querySelectorAll('#sec-chars input[type="range"]').forEach(slider => {
+        slider.addEventListener('change', () => {
+            const botName = document.getElementById('bot_name');
+            if (!saved || slider.disabled || !botName || botName.value.trim() !== saved.bot_name) return;
+            pendingTraits[slider.name] = parseInt(slider.value, 10);
+            clearTimeout(traitTimer);
+            traitTimer = setTimeout(async () => {
+                const traits = pendingTraits;
+                pendingTraits = {};
+                try {
+                    await persist({ traits });
+                } catch (err) {
+                    showToast(false, err.message);
+                }
+            }, 300);
+        });
+    });
+
+    // DM notifications toggle in the dropdown: one field, no reload
+    const quickForm = document.getElementById('quick-save-form');
+    const notifyCb = quickForm ? quickForm.querySelector('input[type="checkbox"][name="notifications"]') : null;
+    if (notifyCb) {
+        notifyCb.addEventListener('change', async () => {
+            try {
+                await persist({ notifications: notifyCb.checked });
+                showToast(true);
+            } catch (err) {
+                notifyCb.checked = !notifyCb.checked;
+                showToast(false, err.message);
+            }
+        });
     }
+    if (quickForm) quickForm.addEventListener('submit', (e) => e.preventDefault());
+
+    // baseline + custom presets
+    api('GET', '/settings').then(({ settings }) => {
+        saved = settings;
+        saved.traits = Object.assign({}, settings.traits);
+        (settings.custom_presets || []).forEach(showCustomPreset);
+    }).catch(() => { saved = null; });
 
     // Initialize: disable editing if current bot is one of the locked presets (Sienna)
     const initNameEl = document.getElementById('bot_name');
@@ -0,0 +1,182 @@
+import os
+import sys
+import gzip
+import time
+import hashlib
+import mimetypes
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = "static"
+# النسخ المبصومة والمضغوطة بتتكتب هنا وقت التشغيل (مش بتترفع على git)
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", ".static_build")
+# الملفات دي بس اللي بتتضغط (الصور وغيره مضغوطين أصلاً)
+COMPRESSIBLE = (".css", ".js", ".svg", ".json", ".txt", ".html")
+# النسخ القديمة بتفضل يوم عشان الصفحات المتكيشة عند الناس تلاقيها
+STALE_BUILD_AGE = 24 * 3600
+IMMUTABLE = "public, max-age=31536000, immutable"
+# ترتيب التفضيل لما المتصفح يقبل الاتنين
+ENCODINGS = ("br", "gzip")
+SUFFIX = {"br": ".br", "gzip": ".gz"}
+
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+def _write(path, data):
+    # اسم الملف فيه الـ hash، فلو موجود يبقى نفس المحتوى بالظبط
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def negotiate(accept_encoding, available):
+    """أحسن encoding المتصفح بيقبله من اللي متاحين، أو None."""
+    accepted = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for encoding in ENCODINGS:
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class AssetManifest:
+    """
+    بيلف على static/ مرة وقت التشغيل ويكتب لكل ملف نسخة باسم فيه hash المحتوى
+    (css/dashboard_style.<hash>.css) ومعاها .gz و.br (لو brotli متسطبة).
+    url("css/x.css") بيرجع اللينك المبصوم للقوالب، ولو الملف اتغير اللينك بيتغير،
+    فالمتصفح يكيشه سنة من غير ما يسأل تاني.
+    """
+
+    def __init__(self, directory=STATIC_DIR, build_dir=STATIC_BUILD_DIR, prefix="/static"):
+        self.directory = directory
+        self.build_dir = build_dir
+        self.prefix = prefix.rstrip("/")
+        self.urls = {}  # "css/x.css" -> "css/x.<hash>.css"
+        self.assets = {}  # "css/x.<hash>.css" -> {"media_type", encoding|None -> (المسار، stat)}
+        self.sizes = {}  # "css/x.css" -> {"raw": .., "gzip": .., "br": ..}
+
+    def build(self):
+        started = time.perf_counter()
+        self.urls, self.assets, self.sizes = {}, {}, {}
+        for root, _, files in os.walk(self.directory):
+            for filename in sorted(files):
+                source = os.path.join(root, filename)
+                rel = os.path.relpath(source, self.directory).replace(os.sep, "/")
+                self._add(rel, source)
+        self._prune()
+        print(f"📦 static: {len(self.urls)} ملف اتبصم في {(time.perf_counter() - started) * 1000:.0f}ms"
+              f"{'' if brotli else ' (من غير brotli)'}")
+        return self
+
+    def _add(self, rel, source):
+        with open(source, "rb") as f:
+            data = f.read()
+        name = hashed_name(rel, fingerprint(data))
+        target = os.path.join(self.build_dir, name)
+        variants = {None: data}
+        if rel.endswith(COMPRESSIBLE):
+            variants["gzip"] = gzip.compress(data, 9, mtime=0)
+            if brotli is not None:
+                variants["br"] = brotli.compress(data, quality=11)
+        asset = {"media_type": mimetypes.guess_type(rel)[0] or "application/octet-stream"}
+        sizes = {}
+        for encoding, body in variants.items():
+            # النسخة المضغوطة لو مش أصغر ملهاش لازمة
+            if encoding is not None and len(body) >= len(data):
+                continue
+            path = target + SUFFIX.get(encoding, "")
+            _write(path, body)
+            asset[encoding] = (path, os.stat(path))
+            sizes[encoding or "raw"] = len(body)
+        self.urls[rel] = name
+        self.assets[name] = asset
+        self.sizes[rel] = sizes
+
+    def _prune(self):
+        keep = {os.path.normpath(entry[0]) for asset in self.assets.values()
+                for key, entry in asset.items() if key != "media_type"}
+        cutoff = time.time() - STALE_BUILD_AGE
+        for root, _, files in os.walk(self.build_dir):
+            for filename in files:
+                path = os.path.normpath(os.path.join(root, filename))
+                try:
+                    if path not in keep and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def url(self, path):
+        """لينك الملف للقوالب: {{ asset('css/dashboard_style.css') }}."""
+        path = path.lstrip("/")
+        name = self.urls.get(path)
+        return f"{self.prefix}/{name or path}"
+
+    def report(self):
+        """[(الملف، الحجم الأصلي، gzip، br)] + الإجمالي: الفرق في البايتات اللي بتتبعت."""
+        rows = [(rel, s["raw"], s.get("gzip", s["raw"]), s.get("br", s.get("gzip", s["raw"])))
+                for rel, s in sorted(self.sizes.items())]
+        total = tuple(sum(row[i] for row in rows) for i in (1, 2, 3))
+        return rows, total
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles لـ /static: اللينكات المبصومة بتتخدم من الـ build بـ Cache-Control immutable
+    وبأصغر encoding المتصفح بيقبله (Vary: Accept-Encoding)، والـ stat متحسوب من وقت البناء.
+    أي لينك قديم من غير hash بيتخدم من static/ زي الأول.
+    """
+
+    def __init__(self, manifest, **kwargs):
+        super().__init__(directory=manifest.directory, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path, scope):
+        asset = self.manifest.assets.get(path.replace(os.sep, "/"))
+        if asset is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+        request_headers = Headers(scope=scope)
+        encoding = negotiate(request_headers.get("accept-encoding"), asset)
+        full_path, stat_result = asset[encoding]
+        headers = {"Cache-Control": IMMUTABLE}
+        if len(asset) > 2:  # فيه نسخ مضغوطة
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        response = FileResponse(full_path, stat_result=stat_result, media_type=asset["media_type"], headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    # python static_assets.py: ابني وطلع تقرير الأحجام
+    manifest = AssetManifest(*sys.argv[1:3]).build()
+    rows, total = manifest.report()
+    for rel, raw, gz, br in rows + [("TOTAL", *total)]:
+        print(f"{rel:40} {raw:>9,} B  gzip {gz:>8,} B ({gz / raw:6.1%})  br {br:>8,} B ({br / raw:6.1%})")
@@ -0,0 +1,625 @@
+import os
+import sys
+import json
+import struct
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # ويندوز: مفيش قفل بين البروسيسات
+    fcntl = None
+
+from write_behind import atomic_write, atomic_write_bytes
+
+# مجلد تخزين بيانات المستخدمين
+DATA_DIR = "users_data"
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "users.db"))
+HISTORY_DIR = os.path.join(DATA_DIR, "history")
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")  # json | sqlite
+
+# أقسام ملف المستخدم (نفس مفاتيح ملف الـ JSON)
+SECTIONS = ("user_data", "user_progress", "user_reminders", "user_conversations", "user_conversation_history")
+# المحادثة ليها سجل append-only لوحدها، فالحفظ العادي مبيلمسهاش
+DOCUMENT_SECTIONS = SECTIONS[:-1]
+
+# كل سطر في ملف الـ index هو offset بداية الرسالة في ملف الـ jsonl (8 بايت)
+OFFSET = struct.Struct("<Q")
+
+PROGRESS_COLUMNS = ("level", "xp", "messages")
+
+
+def empty_document():
+    return {
+        "user_data": {},
+        "user_progress": {},
+        "user_reminders": [],
+        "user_conversations": {},
+        "user_conversation_history": [],
+    }
+
+
+def snapshot_sections(doc, sections=None):
+    """نص JSON لكل قسم: الأساس اللي الكاتب شايفه عشان merge_value بعدين."""
+    return {section: json.dumps(doc.get(section), ensure_ascii=False, default=str, sort_keys=True)
+            for section in sections or DOCUMENT_SECTIONS}
+
+
+_MISSING = object()
+
+
+def _key(value):
+    return json.dumps(value, ensure_ascii=False, default=str, sort_keys=True)
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def merge_value(base, ours, theirs, prefer_theirs=(), counters=(), highest=()):
+    """
+    دمج تلاتي لقيمة اتعدلت من كاتبين من نفس الأساس (base):
+    - اللي اتغير من ناحية واحدة بس بياخد التغيير ده
+    - dict: مفتاح مفتاح، ولو المفتاح اتغير من الناحيتين:
+      prefer_theirs (إعدادات الموقع) بتاخد بتاعتهم، counters (xp وعدد الرسائل) الزيادتين بيتجمعوا،
+      highest (المستوى) بياخد الأكبر
+    - list: اللي اتضاف من أي ناحية بيفضل، واللي اتشال من أي ناحية بيتشال
+    - غير كده اللي في الذاكرة (ours) هو اللي بيكسب
+    القيم المفروض تكون راجعة من json.loads (التلاتة بنفس الشكل).
+    """
+    if theirs == base or theirs == ours:
+        return ours
+    if ours == base:
+        return theirs
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for key in list(ours) + [k for k in theirs if k not in ours]:
+            b, o, t = base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING)
+            if t == b or t == o:
+                value = o
+            elif o == b:
+                value = t
+            elif key in prefer_theirs:
+                value = t
+            elif _MISSING in (o, t):
+                # اتمسح من ناحية واتعدل من التانية: التعديل يفضل
+                value = t if o is _MISSING else o
+            elif key in counters and _is_count(b) and _is_count(o) and _is_count(t):
+                value = max(0, o + t - b)
+            elif key in highest and _is_count(o) and _is_count(t):
+                value = max(o, t)
+            else:
+                value = merge_value(None if b is _MISSING else b, o, t)
+            if value is not _MISSING:
+                merged[key] = value
+        return merged
+    if isinstance(ours, list) and isinstance(theirs, list):
+        base_keys = {_key(item) for item in base} if isinstance(base, list) else set()
+        their_keys = {_key(item) for item in theirs}
+        merged = [item for item in ours if _key(item) not in base_keys or _key(item) in their_keys]
+        kept = {_key(item) for item in ours}
+        merged.extend(item for item in theirs if _key(item) not in base_keys and _key(item) not in kept)
+        return merged
+    return ours
+
+
+def merge_documents(base, ours, theirs, **options):
+    """
+    merge_value لكل قسم في DOCUMENT_SECTIONS. base من snapshot_sections (ممكن يبقى ناقص أقسام)،
+    وours بيتعمله JSON round trip الأول عشان يتقارن بنفس شكل المخزن.
+    """
+    merged = {}
+    for section in DOCUMENT_SECTIONS:
+        b = json.loads(base[section]) if section in base else None
+        o = json.loads(json.dumps(ours.get(section), ensure_ascii=False, default=str))
+        merged[section] = merge_value(b, o, theirs.get(section), **options)
+    return merged
+
+
+class JsonStorage:
+    """
+    التخزين القديم: ملف JSON لكل مستخدم في users_data/.
+    أي حفظ (حتى لو قسم واحد) بيعيد كتابة الملف كله.
+    المحادثة في users_data/history/<id>.jsonl ومعاها <id>.idx فيه offset كل رسالة،
+    فإضافة رسالة = append واحد، وقراءة آخر N رسالة = seek واحد.
+    """
+
+    name = "json"
+    # الحفظ بيكتب الملف كله مهما كانت الأقسام
+    partial_writes = False
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.history_dir = os.path.join(data_dir, "history")
+        # المراقب يقدر يستخدم inotify على المجلد ده مباشرة
+        self.watch_dir = data_dir
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir, exist_ok=True)
+
+    def path_for(self, user_id):
+        return os.path.join(self.data_dir, f"{user_id}.json")
+
+    def list_user_ids(self):
+        if not os.path.exists(self.data_dir):
+            return []
+        return [f[:-5] for f in os.listdir(self.data_dir) if f.endswith(".json") and not f.startswith(".")]
+
+    def count_users(self):
+        return len(self.list_user_ids())
+
+    def user_version(self, user_id):
+        try:
+            return self._file_version(self.path_for(user_id))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _file_version(path):
+        # الـ mtime لوحده بيتكرر لو كتابتين في نفس الـ tick بتاع الكيرنل،
+        # وكل atomic_write بيعمل inode جديد
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_ino
+
+    @contextmanager
+    def _write_lock(self):
+        # البوت (كذا worker) والموقع بيكتبوا نفس الملفات: التأكد من النسخة والكتابة لازم يبقوا خطوة واحدة
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.data_dir, ".write.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load_user(self, user_id, sections=None):
+        # sections مجرد تلميح: الملف بيتقري كله، والحفظ بيكتبه كله برضه
+        file_path = self.path_for(user_id)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        doc = empty_document()
+        doc.update(data)
+        # لازم قبل أي حفظ: encode بيشيل المحادثة من الملف
+        self.migrate_history(user_id, doc["user_conversation_history"])
+        return doc
+
+    def encode(self, doc, sections=None):
+        # الملف بيتكتب كله مهما كانت الأقسام اللي اتغيرت (والمحادثة ليها سجلها)
+        data = {k: v for k, v in doc.items() if k != "user_conversation_history"}
+        data["last_save"] = datetime.now().isoformat()
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+    def write(self, user_id, payload, expected=None):
+        """
+        expected: النسخة اللي الكاتب شايفها. لو الملف اتغير بعدها مفيش كتابة وبترجع None.
+        التأكد والكتابة تحت قفل ملف users_data/.write.lock، فبين البروسيسات كمان مفيش كاتب يدخل في النص.
+        """
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir, exist_ok=True)
+        file_path = self.path_for(user_id)
+        with self._write_lock():
+            if expected is not None and self.user_version(user_id) not in (None, expected):
+                return None
+            atomic_write(file_path, payload)
+            return self._file_version(file_path)
+
+    def save_user(self, user_id, doc, sections=None, expected=None):
+        self.migrate_history(user_id, doc.get("user_conversation_history"))
+        return self.write(user_id, self.encode(doc, sections), expected)
+
+    def delete_user(self, user_id):
+        file_path = self.path_for(user_id)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.clear_history(user_id)
+
+    # ---------- سجل المحادثة ----------
+
+    def _history_paths(self, user_id):
+        base = os.path.join(self.history_dir, str(user_id))
+        return base + ".jsonl", base + ".idx"
+
+    def migrate_history(self, user_id, turns):
+        """
+        ملف قديم كانت المحادثة جواه: انقلها للسجل مرة واحدة، قبل ما أي كاتب
+        (البوت أو الموقع) يحفظ الملف من غيرها. لو السجل موجود يبقى اتنقلت خلاص.
+        """
+        turns = [t for t in turns or [] if isinstance(t, dict)]
+        if not turns:
+            return False
+        log_path, _ = self._history_paths(user_id)
+        if not os.path.exists(self.history_dir):
+            os.makedirs(self.history_dir, exist_ok=True)
+        try:
+            # "xb" بينشئ السجل بس لو مش موجود، فالبوت والموقع مينقلوش نفس المحادثة مرتين
+            open(log_path, "xb").close()
+        except FileExistsError:
+            return False
+        self.append_turns(user_id, turns)
+        return True
+
+    def append_turns(self, user_id, turns):
+        """ضيف رسائل لآخر السجل ورجع عدد الرسائل الكلي."""
+        log_path, idx_path = self._history_paths(user_id)
+        if not os.path.exists(self.history_dir):
+            os.makedirs(self.history_dir, exist_ok=True)
+        lines, offsets = [], []
+        with open(log_path, "ab") as log:
+            offset = log.tell()
+            for turn in turns:
+                line = (json.dumps(turn, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+                offsets.append(OFFSET.pack(offset))
+                offset += len(line)
+                lines.append(line)
+            log.write(b"".join(lines))
+        with open(idx_path, "ab") as idx:
+            idx.write(b"".join(offsets))
+            return idx.tell() // OFFSET.size
+
+    def count_turns(self, user_id):
+        try:
+            return os.path.getsize(self._history_paths(user_id)[1]) // OFFSET.size
+        except OSError:
+            return 0
+
+    def _rebuild_history_index(self, user_id):
+        log_path, idx_path = self._history_paths(user_id)
+        offsets, offset = [], 0
+        with open(log_path, "rb") as log:
+            for line in log:
+                offsets.append(OFFSET.pack(offset))
+                offset += len(line)
+        atomic_write_bytes(idx_path, b"".join(offsets))
+        return len(offsets)
+
+    def _tail_offset(self, user_id, n):
+        log_path, idx_path = self._history_paths(user_id)
+        if os.path.exists(idx_path) and os.path.getsize(idx_path) % OFFSET.size:
+            # كتابة الـ index اتقطعت في النص
+            self._rebuild_history_index(user_id)
+        count = self.count_turns(user_id)
+        if n is None or n >= count:
+            return 0
+        with open(idx_path, "rb") as idx:
+            idx.seek((count - n) * OFFSET.size)
+            return OFFSET.unpack(idx.read(OFFSET.size))[0]
+
+    def tail_turns(self, user_id, n=None):
+        """آخر n رسالة من السجل (أو كله لو n=None) من غير ما نقرا الملف من أوله."""
+        log_path, _ = self._history_paths(user_id)
+        if not os.path.exists(log_path) or n == 0:
+            return []
+        offset = self._tail_offset(user_id, n)
+        with open(log_path, "rb") as log:
+            if offset:
+                # الـ offset لازم يبقى بداية سطر، وإلا الـ index بايظ (مثلاً وقف أثناء compaction)
+                log.seek(offset - 1)
+                if log.read(1) != b"\n":
+                    self._rebuild_history_index(user_id)
+                    return self.tail_turns(user_id, n)
+            else:
+                log.seek(0)
+            data = log.read()
+        turns = []
+        for line in data.splitlines():
+            try:
+                turns.append(json.loads(line))
+            except ValueError:
+                continue
+        return turns[-n:] if n else turns
+
+    def compact_history(self, user_id, keep):
+        """خلي آخر keep رسالة بس (لمستخدم واحد، مش لف على الكل)."""
+        log_path, idx_path = self._history_paths(user_id)
+        turns = self.tail_turns(user_id, keep)
+        lines, offsets, offset = [], [], 0
+        for turn in turns:
+            line = (json.dumps(turn, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            offsets.append(OFFSET.pack(offset))
+            offset += len(line)
+            lines.append(line)
+        atomic_write_bytes(log_path, b"".join(lines))
+        atomic_write_bytes(idx_path, b"".join(offsets))
+        return len(turns)
+
+    def clear_history(self, user_id):
+        for path in self._history_paths(user_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class SQLiteStorage:
+    """
+    تخزين SQLite (WAL): كل قسم في جدول لوحده، فزيادة XP بتحدث صف واحد
+    بدل إعادة كتابة ملف المستخدم كله، والقراءة من أكتر من بروسيس بتبقى transactional.
+    """
+
+    name = "sqlite"
+    # كل قسم في جدوله، فالحفظ بيكتب الأقسام اللي اتطلبت بس
+    partial_writes = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        user_data TEXT NOT NULL DEFAULT '{}',
+        user_conversations TEXT NOT NULL DEFAULT '{}',
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS user_progress (
+        user_id TEXT PRIMARY KEY,
+        level INTEGER NOT NULL DEFAULT 1,
+        xp INTEGER NOT NULL DEFAULT 0,
+        messages INTEGER NOT NULL DEFAULT 0,
+        extra TEXT NOT NULL DEFAULT '{}'
+    );
+    CREATE TABLE IF NOT EXISTS user_reminders (
+        user_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        time TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (user_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_reminders_time ON user_reminders(time);
+    CREATE TABLE IF NOT EXISTS conversation_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        time TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_conversation_history_user ON conversation_history(user_id, id);
+    CREATE INDEX IF NOT EXISTS idx_user_progress_rank ON user_progress(level DESC, xp DESC);
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        # مفيش ملف لكل مستخدم، فالمراقب بيعتمد على طابور التغييرات
+        self.watch_dir = None
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        # connection لكل thread (الـ writer بيكتب من thread pool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def list_user_ids(self):
+        return [row[0] for row in self._conn().execute("SELECT user_id FROM users")]
+
+    def count_users(self):
+        return self._conn().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def user_version(self, user_id):
+        row = self._conn().execute("SELECT version FROM users WHERE user_id = ?", (str(user_id),)).fetchone()
+        return row[0] if row else None
+
+    def load_user(self, user_id, sections=None):
+        """sections: الأقسام المطلوبة بس (مثلاً لوحة التحكم)، والباقي بيرجع فاضي."""
+        uid = str(user_id)
+        wanted = set(sections or DOCUMENT_SECTIONS)
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT user_data, user_conversations FROM users WHERE user_id = ?", (uid,)).fetchone()
+            if row is None:
+                return None
+            doc = empty_document()
+            if "user_data" in wanted:
+                doc["user_data"] = json.loads(row[0] or "{}")
+            if "user_conversations" in wanted:
+                doc["user_conversations"] = json.loads(row[1] or "{}")
+
+            progress = None
+            if "user_progress" in wanted:
+                progress = conn.execute(
+                    "SELECT level, xp, messages, extra FROM user_progress WHERE user_id = ?", (uid,)
+                ).fetchone()
+            if progress:
+                doc["user_progress"] = json.loads(progress[3] or "{}")
+                doc["user_progress"].update(zip(PROGRESS_COLUMNS, progress[:3]))
+
+            if "user_reminders" in wanted:
+                doc["user_reminders"] = [
+                    json.loads(r[0]) for r in conn.execute(
+                        "SELECT data FROM user_reminders WHERE user_id = ? ORDER BY position", (uid,)
+                    )
+                ]
+            # المحادثة مش بتتحمل هنا، بتتقري بـ tail_turns على قد الحاجة
+            return doc
+        finally:
+            conn.execute("COMMIT")
+
+    def encode(self, doc, sections=None):
+        """
+        snapshot للأقسام المطلوبة بس (بيشتغل على الـ event loop)،
+        والنتيجة قيم ثابتة (نصوص وأرقام) تتكتب بعدين من thread.
+        """
+        payload = {}
+        for section in sections or DOCUMENT_SECTIONS:
+            if section not in doc:
+                continue
+            value = doc.get(section)
+            if section in ("user_data", "user_conversations"):
+                payload[section] = json.dumps(value or {}, ensure_ascii=False, default=str)
+            elif section == "user_progress":
+                value = dict(value or {})
+                columns = tuple(int(value.pop(c, d) or d) for c, d in zip(PROGRESS_COLUMNS, (1, 0, 0)))
+                payload[section] = columns + (json.dumps(value, ensure_ascii=False, default=str),)
+            elif section == "user_reminders":
+                payload[section] = [
+                    (r.get("time") if isinstance(r, dict) else None, json.dumps(r, ensure_ascii=False, default=str))
+                    for r in (value or [])
+                ]
+            elif section == "user_conversation_history":
+                payload[section] = [
+                    (m.get("role", "user"), m.get("content", ""), m.get("time"))
+                    for m in (value or []) if isinstance(m, dict)
+                ]
+        return payload
+
+    def write(self, user_id, payload, expected=None):
+        """
+        expected: النسخة اللي الكاتب شايفها. الـ UPDATE مشروط بيها جوه نفس الـ transaction،
+        فلو حد كتب بعدها مفيش كتابة خالص وبترجع None.
+        """
+        uid = str(user_id)
+        now = datetime.now().isoformat()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if expected is None:
+                conn.execute(
+                    "INSERT INTO users (user_id, version, updated_at) VALUES (?, 1, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                    (uid, now),
+                )
+            elif not conn.execute(
+                "UPDATE users SET version = version + 1, updated_at = ? WHERE user_id = ? AND version = ?",
+                (now, uid, expected),
+            ).rowcount:
+                if conn.execute("SELECT 1 FROM users WHERE user_id = ?", (uid,)).fetchone():
+                    conn.execute("ROLLBACK")
+                    return None
+                # المستخدم اتمسح من المخزن: نكتبه من جديد زي الأول
+                conn.execute("INSERT INTO users (user_id, version, updated_at) VALUES (?, 1, ?)", (uid, now))
+            for section in ("user_data", "user_conversations"):
+                if section in payload:
+                    conn.execute(f"UPDATE users SET {section} = ? WHERE user_id = ?", (payload[section], uid))
+            if "user_progress" in payload:
+                conn.execute(
+                    "INSERT INTO user_progress (user_id, level, xp, messages, extra) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET level = excluded.level, xp = excluded.xp, "
+                    "messages = excluded.messages, extra = excluded.extra",
+                    (uid,) + payload["user_progress"],
+                )
+            if "user_reminders" in payload:
+                conn.execute("DELETE FROM user_reminders WHERE user_id = ?", (uid,))
+                conn.executemany(
+                    "INSERT INTO user_reminders (user_id, position, time, data) VALUES (?, ?, ?, ?)",
+                    [(uid, i, t, d) for i, (t, d) in enumerate(payload["user_reminders"])],
+                )
+            if "user_conversation_history" in payload:
+                conn.execute("DELETE FROM conversation_history WHERE user_id = ?", (uid,))
+                conn.executemany(
+                    "INSERT INTO conversation_history (user_id, role, content, time) VALUES (?, ?, ?, ?)",
+                    [(uid,) + turn for turn in payload["user_conversation_history"]],
+                )
+            version = conn.execute("SELECT version FROM users WHERE user_id = ?", (uid,)).fetchone()[0]
+            conn.execute("COMMIT")
+            return version
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def save_user(self, user_id, doc, sections=None, expected=None):
+        return self.write(user_id, self.encode(doc, sections), expected)
+
+    def delete_user(self, user_id):
+        uid = str(user_id)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("users", "user_progress", "user_reminders", "conversation_history"):
+                conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (uid,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---------- سجل المحادثة ----------
+
+    def append_turns(self, user_id, turns):
+        uid = str(user_id)
+        conn = self._conn()
+        conn.executemany(
+            "INSERT INTO conversation_history (user_id, role, content, time) VALUES (?, ?, ?, ?)",
+            [(uid, t.get("role", "user"), t.get("content", ""), t.get("time")) for t in turns],
+        )
+        return self.count_turns(uid)
+
+    def count_turns(self, user_id):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM conversation_history WHERE user_id = ?", (str(user_id),)
+        ).fetchone()[0]
+
+    def tail_turns(self, user_id, n=None):
+        query = "SELECT role, content, time FROM conversation_history WHERE user_id = ? ORDER BY id DESC"
+        params = (str(user_id),)
+        if n is not None:
+            query += " LIMIT ?"
+            params += (n,)
+        rows = self._conn().execute(query, params).fetchall()
+        return [{"role": r[0], "content": r[1], "time": r[2]} for r in reversed(rows)]
+
+    def compact_history(self, user_id, keep):
+        uid = str(user_id)
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM conversation_history WHERE user_id = ? AND id NOT IN "
+            "(SELECT id FROM conversation_history WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+            (uid, uid, keep),
+        )
+        return self.count_turns(uid)
+
+    def clear_history(self, user_id):
+        self._conn().execute("DELETE FROM conversation_history WHERE user_id = ?", (str(user_id),))
+
+
+def get_storage(backend=None):
+    backend = backend or STORAGE_BACKEND
+    if backend == "sqlite":
+        return SQLiteStorage(SQLITE_PATH)
+    return JsonStorage(DATA_DIR)
+
+
+def migrate_json_to_sqlite(data_dir=DATA_DIR, db_path=SQLITE_PATH):
+    """
+    نقل مرة واحدة من ملفات JSON لقاعدة SQLite.
+    المستخدمين الموجودين في القاعدة بالفعل بيتسابوا زي ما هم، فالتشغيل مرتين آمن.
+    """
+    source = JsonStorage(data_dir)
+    target = SQLiteStorage(db_path)
+    existing = set(target.list_user_ids())
+    migrated = skipped = failed = 0
+    for user_id in source.list_user_ids():
+        if user_id in existing:
+            skipped += 1
+            continue
+        try:
+            doc = source.load_user(user_id)
+            if doc is not None:
+                # المحادثة من سجلها لو موجود، وإلا من جوه ملف المستخدم القديم
+                history = source.tail_turns(user_id) or doc.get("user_conversation_history", [])
+                target.save_user(user_id, doc)
+                if history:
+                    target.append_turns(user_id, history)
+                migrated += 1
+        except Exception as e:
+            failed += 1
+            print(f"❌ فشل نقل المستخدم {user_id}: {e}")
+    print(f"✅ تم نقل {migrated} مستخدم إلى {db_path} (موجود مسبقاً: {skipped}، فشل: {failed})")
+    return migrated
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        migrate_json_to_sqlite()
+    else:
+        print("الاستخدام: python storage.py migrate")
@@ -0,0 +1,89 @@
+import os
+import time
+
+from metrics import registry
+
+# ردود الذكاء الاصطناعي بتظهر وهي بتتكتب (0 = استنى الرد كامل زي الأول)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") not in ("0", "false", "no")
+# أقل وقت بين كل تعديل والتاني لنفس الرسالة (Discord بيسمح بحوالي 5 تعديلات كل 5 ثواني)
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+# أقل عدد حروف جديدة يستاهل تعديل
+STREAM_MIN_CHARS = int(os.getenv("STREAM_MIN_CHARS", "20"))
+
+DISCORD_MESSAGE_LIMIT = 2000
+CURSOR = " ▌"
+
+DISCORD_SEND_SECONDS = registry.histogram("sienna_bot_discord_send_seconds", "Discord message send/edit round trip")
+
+
+class DiscordStreamWriter:
+    """
+    بيبعت الرد على Discord وهو بيتكتب: أول رسالة مع أول كلمات،
+    وبعدين تعديل للرسالة كل interval ثانية على الأكتر. لو الرد عدى حد
+    Discord بيكمل في رسالة جديدة.
+    """
+
+    def __init__(self, channel, interval=STREAM_EDIT_INTERVAL, min_chars=STREAM_MIN_CHARS):
+        self.channel = channel
+        self.interval = interval
+        self.min_chars = min_chars
+        self.text = ""
+        self.message = None
+        self.offset = 0  # أول حرف في الرسالة الحالية
+        self.shown = 0  # لحد فين الرسالة الحالية متعدلة
+        self.last_edit = 0.0
+        self.first_token_at = None
+        self.edits = 0
+        self.messages = 0  # عدد الرسائل اللي اتبعتت فعلاً
+
+    @property
+    def sent(self):
+        # مش self.message: بعد ما الرسالة تتقفل عند حد Discord الباقي ممكن يبقى مسافات بس
+        return self.messages > 0
+
+    async def feed(self, delta):
+        if not delta:
+            return
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.text += delta
+
+        # الرسالة الحالية اتملت: نقفلها ونبدأ واحدة جديدة
+        while len(self.text) - self.offset > DISCORD_MESSAGE_LIMIT - len(CURSOR):
+            cut = self._split_point()
+            await self._show(self.text[self.offset:cut])
+            self.message = None
+            self.offset = cut
+
+        pending = len(self.text) - self.shown
+        if self.message is None:
+            if self.text[self.offset:].strip():
+                await self._show(self.text[self.offset:] + CURSOR)
+        elif pending >= self.min_chars and time.monotonic() - self.last_edit >= self.interval:
+            await self._show(self.text[self.offset:] + CURSOR)
+
+    def _split_point(self):
+        limit = self.offset + DISCORD_MESSAGE_LIMIT - len(CURSOR)
+        cut = self.text.rfind("\n", self.offset, limit)
+        if cut <= self.offset:
+            cut = self.text.rfind(" ", self.offset, limit)
+        return cut if cut > self.offset else limit
+
+    async def _show(self, content):
+        if self.message is None:
+            with DISCORD_SEND_SECONDS.time(kind="send"):
+                self.message = await self.channel.send(content)
+            self.messages += 1
+        else:
+            with DISCORD_SEND_SECONDS.time(kind="edit"):
+                await self.message.edit(content=content)
+            self.edits += 1
+        self.shown = len(self.text)
+        self.last_edit = time.monotonic()
+
+    async def finish(self):
+        """آخر تعديل بالنص الكامل (من غير المؤشر)."""
+        final = self.text[self.offset:].strip()
+        if final:
+            await self._show(final)
+        return self.text.strip()
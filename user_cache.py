@@ -0,0 +1,210 @@
+import os
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from write_behind import atomic_write
+from reminders import compact_reminder
+
+# مجلد تخزين بيانات المستخدمين
+DATA_DIR = "users_data"
+SUMMARY_PATH = os.path.join(DATA_DIR, ".summary.json")
+
+USER_CACHE_MAX_USERS = int(os.getenv("USER_CACHE_MAX_USERS", "5000"))
+USER_CACHE_MAX_MB = float(os.getenv("USER_CACHE_MAX_MB", "256"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "1800"))
+
+
+def summarize_user(data, progress, reminders):
+    """الحاجات الصغيرة اللي اللوحات والإحصائيات محتاجاها من غير تحميل المستخدم كله."""
+    return {
+        "activated": bool(data.get("activated", False)),
+        "user_name": data.get("user_name"),
+        "joined_at": data.get("joined_at"),
+        "level": progress.get("level", 1),
+        "xp": progress.get("xp", 0),
+        "messages": progress.get("messages", 0),
+        "reminders": [compact_reminder(r) for r in reminders or [] if isinstance(r, dict)],
+        # حالة رسائل الغياب (inactivity.py) عشان الجدولة تتبني وقت التشغيل.
+        # نسخة: لو اتعدلت في مكانها (nudged) الفهرس يلاحظ الفرق ويتحفظ
+        "inactivity": dict(progress.get("inactivity") or {}),
+    }
+
+SUMMARY_KEYS = frozenset(summarize_user({}, {}, []))
+
+
+class SummaryIndex:
+    """
+    فهرس صغير لكل المستخدمين (مستخدم -> summarize_user) محفوظ في ملف واحد.
+    بيتحدث في الذاكرة مع كل حفظ وبيتكتب على الديسك بشكل دوري.
+    persist=False (كل worker غير صاحب الخاص): بيقرا الملف ويحدث نسخته في الذاكرة بس،
+    عشان كذا worker ميكتبوش نفس الملف كل واحد بالمستخدمين اللي هو شايفهم.
+    """
+
+    def __init__(self, path=SUMMARY_PATH, persist=True):
+        self.path = path
+        self.persist = persist
+        self.entries = {}
+        self.dirty = False
+
+    def load_or_rebuild(self, storage):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+                # فهرس من نسخة أقدم ناقصه حقول: نبنيه من جديد
+                if all(SUMMARY_KEYS <= set(s) for s in entries.values()):
+                    self.entries = entries
+                    return len(entries)
+            except Exception as e:
+                print(f"⚠️ فهرس المستخدمين تالف ({e})، هيتبني من جديد")
+        return self.rebuild(storage)
+
+    def rebuild(self, storage):
+        """بناء الفهرس مرة واحدة من التخزين (مستخدم مستخدم من غير ما نحتفظ بيهم في الذاكرة)."""
+        entries = {}
+        for user_id in storage.list_user_ids():
+            try:
+                doc = storage.load_user(user_id)
+            except Exception as e:
+                print(f"❌ خطأ في قراءة المستخدم {user_id} للفهرس: {e}")
+                continue
+            if doc is not None:
+                entries[user_id] = summarize_user(
+                    doc.get("user_data", {}), doc.get("user_progress", {}), doc.get("user_reminders", [])
+                )
+        self.entries = entries
+        self.dirty = True
+        self.save()
+        return len(entries)
+
+    def update(self, user_id, summary):
+        if self.entries.get(user_id) != summary:
+            self.entries[user_id] = summary
+            self.dirty = True
+
+    def remove(self, user_id):
+        if self.entries.pop(user_id, None) is not None:
+            self.dirty = True
+
+    def get(self, user_id, default=None):
+        return self.entries.get(user_id, default)
+
+    def items(self):
+        return self.entries.items()
+
+    def snapshot(self):
+        """نص الفهرس لو اتغير من آخر حفظ (بيتاخد على الـ event loop)."""
+        if not self.dirty or not self.persist:
+            return None
+        self.dirty = False
+        return json.dumps(self.entries, ensure_ascii=False, default=str)
+
+    def write(self, text):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(self.path, text)
+
+    def save(self):
+        text = self.snapshot()
+        if text is not None:
+            self.write(text)
+
+
+class UserCache:
+    """
+    كاش LRU/TTL للمستخدمين المحملين في الذاكرة.
+    المستخدم بيتحمل أول ما يبعت رسالة أو أمر، وبيتشال من الذاكرة لو فضل مستني
+    أكتر من ttl ثانية أو لو الكاش عدى max_users أو max_bytes.
+
+    unload(user_id): شيل المستخدم من الذاكرة
+    size_of(user_id) -> تقدير حجمه بالبايت
+    is_busy(user_id) -> True لو عنده حفظ لسه متكتبش
+    """
+
+    def __init__(self, unload, size_of, is_busy=None,
+                 max_users=USER_CACHE_MAX_USERS, max_mb=USER_CACHE_MAX_MB, ttl=USER_CACHE_TTL):
+        self.unload = unload
+        self.size_of = size_of
+        self.is_busy = is_busy or (lambda user_id: False)
+        self.max_users = max_users
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> [آخر استخدام، الحجم التقريبي]
+        self.pins = {}
+        self.total_bytes = 0
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def touch(self, user_id, loaded=False):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            size = self.size_of(user_id)
+            self.entries[user_id] = [time.monotonic(), size]
+            self.total_bytes += size
+            self.stats["loads" if loaded else "hits"] += 1
+            if len(self.entries) > self.max_users or self.total_bytes > self.max_bytes:
+                self.evict(keep=user_id, max_skips=64)
+        else:
+            entry[0] = time.monotonic()
+            self.entries.move_to_end(user_id)
+            self.stats["hits"] += 1
+
+    def forget(self, user_id):
+        entry = self.entries.pop(user_id, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    @contextmanager
+    def pinned(self, user_id):
+        """المستخدم ميتشالش من الذاكرة طول ما الرد عليه شغال."""
+        self.pins[user_id] = self.pins.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            self.pins[user_id] -= 1
+            if self.pins[user_id] <= 0:
+                del self.pins[user_id]
+
+    def _can_evict(self, user_id):
+        return user_id not in self.pins and not self.is_busy(user_id)
+
+    def refresh_sizes(self):
+        total = 0
+        for user_id, entry in self.entries.items():
+            entry[1] = self.size_of(user_id)
+            total += entry[1]
+        self.total_bytes = total
+
+    def evict(self, keep=None, max_skips=None):
+        """
+        شيل المستخدمين المنتهية مدتهم، وبعدين الأقدم استخداماً لحد ما نرجع تحت الحد.
+        max_skips: بطل بعد العدد ده من المستخدمين المشغولين (من touch عشان منلفش على الكاش كله
+        مع كل رسالة وقت الزحمة، والباقي بيتشال في المرة الجاية).
+        """
+        now = time.monotonic()
+        victims = []
+        skipped = 0
+        count, total = len(self.entries), self.total_bytes
+        # بنلف من غير نسخ الكاش كله، وبنشيل في الآخر
+        for user_id, (last_used, size) in self.entries.items():
+            over_cap = count > self.max_users or total > self.max_bytes
+            expired = now - last_used > self.ttl
+            if not over_cap and not expired:
+                # الباقيين أحدث (الترتيب من الأقدم للأحدث)
+                break
+            if user_id == keep or not self._can_evict(user_id):
+                skipped += 1
+                if max_skips is not None and skipped >= max_skips:
+                    break
+                continue
+            victims.append(user_id)
+            count -= 1
+            total -= size
+        for user_id in victims:
+            self.forget(user_id)
+            self.unload(user_id)
+        evicted = len(victims)
+        self.stats["evictions"] += evicted
+        return evicted
@@ -0,0 +1,43 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class UserLocks:
+    """
+    lock لكل مستخدم: أي حاجة بتغير حالة المستخدم عبر أكتر من await
+    (رد، إعادة تحميل من الموقع، فرمتة) بتمسك الـ lock بتاعه، فالتغييرات
+    لنفس المستخدم بتحصل واحدة ورا التانية والمستخدمين المختلفين شغالين مع بعض.
+    الـ lock بيتمسح أول ما محدش ماسكه ولا مستنيه، فالذاكرة مش بتكبر مع عدد المستخدمين.
+    """
+
+    def __init__(self):
+        self.locks = {}
+        self.refs = {}
+        self.stats = {"acquired": 0, "contended": 0, "max_wait_ms": 0.0}
+
+    def locked(self, user_id):
+        lock = self.locks.get(str(user_id))
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, user_id):
+        uid = str(user_id)
+        lock = self.locks.get(uid)
+        if lock is None:
+            lock = self.locks[uid] = asyncio.Lock()
+        self.refs[uid] = self.refs.get(uid, 0) + 1
+        try:
+            if lock.locked():
+                self.stats["contended"] += 1
+            started = time.monotonic()
+            async with lock:
+                wait_ms = (time.monotonic() - started) * 1000
+                self.stats["acquired"] += 1
+                self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], wait_ms)
+                yield
+        finally:
+            self.refs[uid] -= 1
+            if self.refs[uid] <= 0:
+                del self.refs[uid]
+                del self.locks[uid]
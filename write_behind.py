@@ -0,0 +1,189 @@
+import os
+import time
+import asyncio
+import tempfile
+from collections import OrderedDict
+
+
+def atomic_write(path, text):
+    """
+    اكتب الملف في ملف مؤقت جنبه وبعدين rename،
+    فأي حد بيقرا الملف (الموقع أو المراقب) عمره ما يشوف ملف نصه مكتوب.
+    """
+    atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def atomic_write_bytes(path, data):
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _payload_size(payload):
+    if isinstance(payload, (str, bytes)):
+        return len(payload)
+    if isinstance(payload, dict):
+        return sum(_payload_size(v) for v in payload.values())
+    if isinstance(payload, (list, tuple)):
+        return sum(_payload_size(v) for v in payload)
+    return 8
+
+
+class WriteBehind:
+    """
+    حفظ مؤجل: save بتعلم على المستخدم إنه dirty بس، وworker في الخلفية
+    بيكتب الملف بعد delay ثانية. أي حفظ تاني لنفس المستخدم جوه الفترة دي بيتدمج في كتابة واحدة.
+
+    serialize(user_id, sections) -> payload   (بتشتغل على الـ event loop عشان الداتا متتغيرش وهي بتتقري)
+    write(user_id, payload) -> أي قيمة   (بتشتغل في thread)
+    sections=None معناها كل الأقسام.
+    on_written(user_id, result)   (بتشتغل على الـ event loop بعد الكتابة)
+    """
+
+    def __init__(self, serialize, write, delay=0.5, on_written=None):
+        self.serialize = serialize
+        self.write = write
+        self.delay = delay
+        self.on_written = on_written
+        self.dirty = OrderedDict()  # user_id -> (وقت أول علامة، الأقسام) والأقدم الأول
+        self.in_flight = set()
+        self.stats = {"marked": 0, "coalesced": 0, "flushed": 0, "bytes": 0, "errors": 0}
+        self._wakeup = None
+        self._task = None
+        self._idle = None
+        self._batches = 0
+
+    def mark_dirty(self, user_id, sections=None):
+        uid = str(user_id)
+        sections = frozenset(sections) if sections else None
+        self.stats["marked"] += 1
+        if uid in self.dirty:
+            self.stats["coalesced"] += 1
+        self._merge(uid, sections)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # مفيش event loop (سكربت أو إغلاق البوت): اكتب على طول
+            self.flush_sync()
+            return
+        self._ensure_worker()
+        self._wakeup.set()
+
+    def _merge(self, uid, sections):
+        # None = كل الأقسام، فأي دمج معاها بيفضل None
+        if uid in self.dirty:
+            marked, pending = self.dirty[uid]
+            merged = None if pending is None or sections is None else pending | sections
+            self.dirty[uid] = (marked, merged)
+        else:
+            self.dirty[uid] = (time.monotonic(), sections)
+
+    def is_pending(self, user_id):
+        uid = str(user_id)
+        return uid in self.dirty or uid in self.in_flight
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.dirty:
+                oldest = next(iter(self.dirty.values()))[0]
+                wait = oldest + self.delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                cutoff = time.monotonic() - self.delay
+                batch = [uid for uid, (marked, _) in self.dirty.items() if marked <= cutoff]
+                await self._flush_batch(batch)
+
+    def _take(self, user_ids):
+        items = []
+        for uid in user_ids:
+            entry = self.dirty.pop(uid, None)
+            if entry is None:
+                continue
+            try:
+                items.append((uid, entry[1], self.serialize(uid, entry[1])))
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"❌ خطأ في تجهيز بيانات المستخدم {uid}: {e}")
+        return items
+
+    def _write_many(self, items):
+        results = []
+        for uid, _, payload in items:
+            try:
+                results.append((uid, True, self.write(uid, payload)))
+            except Exception as e:
+                results.append((uid, False, e))
+        return results
+
+    def _finish(self, items, results):
+        for (uid, sections, payload), (_, ok, result) in zip(items, results):
+            self.in_flight.discard(uid)
+            if ok:
+                self.stats["flushed"] += 1
+                self.stats["bytes"] += _payload_size(payload)
+                if self.on_written:
+                    self.on_written(uid, result)
+            else:
+                self.stats["errors"] += 1
+                print(f"❌ خطأ في حفظ بيانات المستخدم {uid}: {result}")
+                # نحاول تاني في الدورة الجاية، ولو فيه علامة أحدث مستنية الأقسام دي بتتضاف عليها
+                self._merge(uid, sections)
+                if self._wakeup is not None:
+                    self._wakeup.set()
+
+    async def _flush_batch(self, user_ids):
+        items = self._take(user_ids)
+        if not items:
+            return
+        self._batches += 1
+        self._idle.clear()
+        self.in_flight.update(item[0] for item in items)
+        try:
+            results = await asyncio.to_thread(self._write_many, items)
+        finally:
+            self._batches -= 1
+            if self._batches == 0:
+                self._idle.set()
+        self._finish(items, results)
+
+    async def flush(self):
+        """اكتب كل المستخدمين المتعلم عليهم دلوقتي (on_disconnect)."""
+        while self.in_flight and self._idle is not None:
+            await self._idle.wait()
+        if self.dirty:
+            self._ensure_worker()
+            await self._flush_batch(list(self.dirty))
+
+    def flush_sync(self):
+        """نفس flush بس من غير event loop (بعد ما bot.run يخلص)."""
+        items = self._take(list(self.dirty))
+        self.in_flight.update(item[0] for item in items)
+        self._finish(items, self._write_many(items))
+
+    async def forget(self, user_id):
+        """الغي أي حفظ مستني للمستخدم واستنى الكتابة الجارية تخلص (قبل مسح ملفه)."""
+        uid = str(user_id)
+        self.dirty.pop(uid, None)
+        while uid in self.in_flight and self._idle is not None:
+            await self._idle.wait()